@@ -0,0 +1,215 @@
+# This file is part of pi-stomp.
+#
+# pi-stomp is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pi-stomp is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pi-stomp.  If not, see <https://www.gnu.org/licenses/>.
+
+import heapq
+import itertools
+import logging
+import os
+import select
+import time
+
+import common.histogram as Histogram
+
+# While a wakeup callback reports it isn't done (eg. a control waiting for something which neither interrupts nor
+# has a timer), it's called again after this many seconds
+BUSY_PERIOD = 0.01
+
+_loop = None
+
+
+def get_loop():
+    global _loop
+    if _loop is None:
+        _loop = EventLoop()
+    return _loop
+
+
+def wakeup():
+    # Wake the main loop, safe to call from any thread (GPIO callbacks, worker threads, ...)
+    # Does nothing until the loop exists, the first pass runs the wakeup callbacks anyway
+    loop = _loop
+    if loop is not None:
+        loop.wakeup()
+
+
+def call_later(delay, fn):
+    # The loop's call_later, from its own thread.  None if the loop isn't running, the caller then has to be
+    # polled instead
+    loop = _loop
+    if loop is None or not loop.running:
+        return None
+    return loop.call_later(delay, fn)
+
+
+class Timer:
+
+    def __init__(self, when, period, fn):
+        self.when = when
+        self.period = period
+        self.fn = fn
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class EventLoop:
+
+    # The main loop, sleeping until there's something to do instead of polling at a fixed rate
+    #
+    # Sources of work:
+    #   - wakeup() from other threads, after they've queued something for the main loop (a switch press, an
+    #     encoder step, a mod-ui notification, a finished host command).  The wakeup callbacks then poll the queues.
+    #   - file descriptors which become readable (add_reader)
+    #   - timers (call_later, call_every) for things which can only be polled, eg. ADC reads
+    # Everything is run on the thread calling run().
+    #
+    # Passes are kept cheap, there's one per timer tick: epoll is used directly rather than through selectors
+    # (pi-stomp is Linux only), and the timer heap is only looked at once per pass.
+    def __init__(self):
+        self.poller = select.epoll()
+        self.readers = {}  # fd: (fileobj, fn)
+        self.wake_read, self.wake_write = os.pipe()
+        os.set_blocking(self.wake_read, False)
+        os.set_blocking(self.wake_write, False)
+        self.poller.register(self.wake_read, select.EPOLLIN)
+        self.wake_pending = False
+        self.wake_callbacks = []
+        self.busy = None  # Timer re-running the wakeup callbacks
+        self.busy_period = BUSY_PERIOD
+        self.timers = []  # heap of (when, seq, Timer)
+        self.seq = itertools.count()
+        self.timeout = 0  # for the next pass's epoll, see _run_timers
+        self.running = False
+
+    def __del__(self):
+        self.poller.close()
+        os.close(self.wake_read)
+        os.close(self.wake_write)
+
+    def _drain(self):
+        try:
+            while os.read(self.wake_read, 64):
+                pass
+        except BlockingIOError:
+            pass
+
+    def _schedule(self, timer):
+        heapq.heappush(self.timers, (timer.when, next(self.seq), timer))
+        return timer
+
+    def _run_wakeup_callbacks(self):
+        # Cleared first so a wakeup() from here on (or from another thread meanwhile) isn't lost
+        self.wake_pending = False
+        start = time.perf_counter()
+        busy = False
+        for fn in self.wake_callbacks:
+            try:
+                if fn():
+                    busy = True
+            except Exception as e:
+                logging.error("Wakeup callback failed: %s" % e)
+        Histogram.get(Histogram.WAKEUP).add(time.perf_counter() - start)
+        if busy:
+            if self.busy is None:
+                self.busy = self.call_later(self.busy_period, self._busy_poll)
+        elif self.busy is not None:
+            self.busy.cancel()
+            self.busy = None
+
+    def _busy_poll(self):
+        self.busy = None
+        self._run_wakeup_callbacks()
+
+    def _run_timers(self):
+        # Runs the due timers, returns the timeout until the next one for epoll (which rounds up to the next
+        # millisecond), or -1 to wait until woken
+        timers = self.timers
+        now = time.monotonic()
+        while timers:
+            when, _, timer = timers[0]
+            if timer.cancelled:
+                heapq.heappop(timers)
+                continue
+            if when > now:
+                return when - now
+            if timer.period is None:
+                heapq.heappop(timers)
+            else:
+                # Keep to the period's grid, but don't try to catch up after a long callback
+                timer.when = max(when + timer.period, now)
+                heapq.heapreplace(timers, (timer.when, next(self.seq), timer))
+            try:
+                timer.fn()
+            except Exception as e:
+                logging.error("Timer callback failed: %s" % e)
+            now = time.monotonic()
+        return -1
+
+    # External API
+    def wakeup(self):
+        if self.wake_pending:
+            return
+        self.wake_pending = True
+        try:
+            os.write(self.wake_write, b'\0')
+        except BlockingIOError:
+            pass  # pipe full, a wakeup is pending anyway
+
+    def on_wakeup(self, fn):
+        # fn() is called after each wakeup.  Returning True means it has more to do without a further wakeup, it's
+        # then called again every busy_period until it returns False.
+        self.wake_callbacks.append(fn)
+
+    def add_reader(self, fileobj, fn):
+        # fn(fileobj) is called whenever fileobj (a file descriptor, or an object with fileno()) is readable
+        fd = fileobj if isinstance(fileobj, int) else fileobj.fileno()
+        self.readers[fd] = (fileobj, fn)
+        self.poller.register(fd, select.EPOLLIN)
+
+    def remove_reader(self, fileobj):
+        fd = fileobj if isinstance(fileobj, int) else fileobj.fileno()
+        self.readers.pop(fd, None)
+        self.poller.unregister(fd)
+
+    def call_later(self, delay, fn):
+        return self._schedule(Timer(time.monotonic() + delay, None, fn))
+
+    def call_every(self, period, fn):
+        return self._schedule(Timer(time.monotonic() + period, period, fn))
+
+    def run_once(self):
+        woken = False
+        for fd, mask in self.poller.poll(self.timeout):
+            if fd == self.wake_read:
+                self._drain()
+                woken = True
+            else:
+                fileobj, fn = self.readers[fd]
+                fn(fileobj)
+        if woken:
+            self._run_wakeup_callbacks()
+        self.timeout = self._run_timers()
+
+    def run(self):
+        # Until stop(), or an exception (eg. KeyboardInterrupt) which is passed on
+        self.running = True
+        self.wakeup()  # for anything queued before the loop started
+        while self.running:
+            self.run_once()
+
+    def stop(self):
+        self.running = False
+        self.wakeup()
@@ -0,0 +1,125 @@
+# This file is part of pi-stomp.
+#
+# pi-stomp is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pi-stomp is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pi-stomp.  If not, see <https://www.gnu.org/licenses/>.
+
+import bisect
+import logging
+import threading
+
+# Bucket upper bounds (seconds), roughly 1-2-5 steps from 50us to 5s, plus one for anything slower
+BOUNDS = [0.00005, 0.0001, 0.0002, 0.0005,
+          0.001, 0.002, 0.005, 0.01, 0.02, 0.05,
+          0.1, 0.2, 0.5, 1.0, 2.0, 5.0]
+
+# Histograms in the order they're reported, see get()
+WAKEUP = "wakeup"            # main loop wakeup callbacks (Handler.poll_controls)
+GPIO = "gpio"                # Hardware.poll_gpio_controls
+ANALOG = "analog"            # Hardware.poll_analog_controls
+SWITCH_WAKE = "switch_wake"  # footswitch interrupt to the main loop seeing it
+SWITCH = "switch"            # footswitch and encoder switch handlers
+ENCODER = "encoder"          # encoder handlers
+CALLBACK = "callback"        # host command callbacks (see Executor.poll)
+MODUI = "modui"              # mod-ui requests
+LCD = "lcd"                  # LCD render_image
+NAMES = [WAKEUP, GPIO, ANALOG, SWITCH_WAKE, SWITCH, ENCODER, CALLBACK, MODUI, LCD]
+
+
+class Histogram:
+
+    # Fixed bucket latency histogram, cheap enough to record everything all the time
+    # Percentiles are only as precise as the buckets, they report the bucket's upper bound (or the max if lower)
+    def __init__(self, name):
+        self.name = name
+        self.lock = threading.Lock()
+        self.counts = [0] * (len(BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        bucket = bisect.bisect_left(BOUNDS, seconds)
+        with self.lock:
+            self.counts[bucket] += 1
+            self.count += 1
+            self.total += seconds
+            if seconds > self.max:
+                self.max = seconds
+
+    def percentile(self, p):
+        with self.lock:
+            if self.count == 0:
+                return 0.0
+            rank = self.count * p / 100.0
+            seen = 0
+            for bucket, n in enumerate(self.counts):
+                seen += n
+                if seen >= rank:
+                    break
+            return min(BOUNDS[bucket], self.max) if bucket < len(BOUNDS) else self.max
+
+    def mean(self):
+        return self.total / self.count if self.count > 0 else 0.0
+
+    def reset(self):
+        with self.lock:
+            self.counts = [0] * (len(BOUNDS) + 1)
+            self.count = 0
+            self.total = 0.0
+            self.max = 0.0
+
+    def summary(self):
+        return "%s: n=%d mean=%.2fms p50=%.2fms p99=%.2fms max=%.2fms" % (
+            self.name, self.count, self.mean() * 1000, self.percentile(50) * 1000, self.percentile(99) * 1000,
+            self.max * 1000)
+
+    def buckets(self):
+        # "<=bound: count" for the non empty buckets
+        with self.lock:
+            counts = list(self.counts)
+        return ["%s%.2fms: %d" % ("<=" if i < len(BOUNDS) else ">", BOUNDS[min(i, len(BOUNDS) - 1)] * 1000, n)
+                for i, n in enumerate(counts) if n > 0]
+
+
+_histograms = {name: Histogram(name) for name in NAMES}
+_histograms_lock = threading.Lock()
+
+
+def get(name):
+    histogram = _histograms.get(name)
+    if histogram is None:
+        with _histograms_lock:
+            histogram = _histograms.setdefault(name, Histogram(name))
+    return histogram
+
+
+def dump():
+    # Log every histogram, eg. on SIGUSR1
+    for histogram in list(_histograms.values()):
+        if histogram.count == 0:
+            continue
+        logging.info(histogram.summary())
+        logging.info("  " + "  ".join(histogram.buckets()))
+
+
+def compact(name):
+    # Short form for the LCD, eg. "p99 2ms max 15ms"
+    histogram = get(name)
+    if histogram.count == 0:
+        return "-"
+    return "p99 %s max %s" % (_ms(histogram.percentile(99)), _ms(histogram.max))
+
+
+def _ms(seconds):
+    ms = seconds * 1000
+    return "%.1fms" % ms if ms < 10 else "%dms" % ms
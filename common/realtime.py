@@ -0,0 +1,191 @@
+# This file is part of pi-stomp.
+#
+# pi-stomp is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pi-stomp is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pi-stomp.  If not, see <https://www.gnu.org/licenses/>.
+
+import logging
+import os
+import threading
+
+import common.token as Token
+
+# Thread roles
+CONTROL = Token.CONTROL        # the main loop (controls, LCD) and the GPIO interrupt thread, which inherits it
+HOST = Token.HOST              # mod-ui/mod-host I/O: executor workers, mod-ui notifications, parameter sender
+BACKGROUND = Token.BACKGROUND  # everything else we start: wifi, pedalboard watcher and resolver, connection probes,
+                               # plugin data fetches and bundle parsers
+ROLES = [CONTROL, HOST, BACKGROUND]
+
+_policies = {}  # role: Policy, empty unless configured
+_settings = None  # as given to configure(), for processes we start (see settings())
+_threads = {}   # native thread id: (name, role)
+_lock = threading.Lock()
+
+
+class Policy:
+
+    # CPU affinity and scheduling for the threads of a role
+    #   cpus: CPUs to run on, None for all of them (so threads don't inherit their creator's)
+    #   fifo: SCHED_FIFO priority (1-99), 0 for normal scheduling
+    #   nice: nice level for normal scheduling
+    def __init__(self, cpus=None, fifo=0, nice=0):
+        self.cpus = set(cpus) if cpus else None
+        self.fifo = fifo
+        self.nice = nice
+
+    def describe(self):
+        return describe(self.cpus or _all_cpus(), os.SCHED_FIFO if self.fifo > 0 else os.SCHED_OTHER,
+                        self.fifo, self.nice)
+
+
+def _all_cpus():
+    return set(range(os.cpu_count()))
+
+
+def parse_cpus(spec):
+    # "3", "2,3", "0-1,3" or a list of ints (from yaml), to a set
+    if spec is None or spec == "":
+        return None
+    if isinstance(spec, int):
+        return {spec}
+    if isinstance(spec, (list, tuple)):
+        return set(int(c) for c in spec)
+    cpus = set()
+    for part in str(spec).split(','):
+        if '-' in part:
+            first, last = part.split('-', 1)
+            cpus.update(range(int(first), int(last) + 1))
+        elif part.strip():
+            cpus.add(int(part))
+    return cpus
+
+
+def describe(cpus, policy, priority, nice):
+    cpus = ",".join(str(c) for c in sorted(cpus))
+    if policy == os.SCHED_FIFO:
+        return "cpus %s SCHED_FIFO %d" % (cpus, priority)
+    return "cpus %s nice %d" % (cpus, nice)
+
+
+def current(tid):
+    # (cpus, policy, priority, nice) as the kernel has them for thread tid
+    return (os.sched_getaffinity(tid), os.sched_getscheduler(tid) & ~os.SCHED_RESET_ON_FORK,
+            os.sched_getparam(tid).sched_priority, os.getpriority(os.PRIO_PROCESS, tid))
+
+
+# External API
+def configure(policies):
+    # policies: {role: {cpus: .., fifo: .., nice: ..}} (the realtime config section, with command line overrides)
+    # Roles which aren't configured get normal scheduling on all CPUs once any role is
+    global _settings
+    _settings = policies
+    _policies.clear()
+    if not policies:
+        return
+    for role in ROLES:
+        settings = policies.get(role) or {}
+        try:
+            _policies[role] = Policy(parse_cpus(settings.get(Token.CPUS)), int(settings.get(Token.FIFO) or 0),
+                                     int(settings.get(Token.NICE) or 0))
+        except (ValueError, TypeError, AttributeError) as e:
+            logging.error("Invalid %s scheduling settings %s: %s" % (role, settings, e))
+
+
+def settings():
+    # What configure() was given, for worker processes to configure themselves the same way
+    return _settings
+
+
+def cpus(role):
+    # The CPUs role's threads run on, eg. to size a worker pool
+    policy = _policies.get(role)
+    if policy is None or policy.cpus is None:
+        return _all_cpus()
+    return set(policy.cpus)
+
+
+def apply(role):
+    # Apply role's policy to the calling thread, called first thing by each thread.  Linux applies affinity,
+    # scheduling policy and nice level per thread, new threads inherit their creator's.
+    policy = _policies.get(role)
+    if policy is None:
+        return
+    tid = threading.get_native_id()
+    name = threading.current_thread().name
+    with _lock:
+        _threads[tid] = (name, role)
+    try:
+        os.sched_setaffinity(tid, policy.cpus or _all_cpus())
+        if policy.fifo > 0:
+            os.sched_setscheduler(tid, os.SCHED_FIFO, os.sched_param(policy.fifo))
+        else:
+            os.sched_setscheduler(tid, os.SCHED_OTHER, os.sched_param(0))
+            os.setpriority(os.PRIO_PROCESS, tid, policy.nice)
+    except OSError as e:
+        logging.warning("Cannot apply %s scheduling (%s) to %s: %s" % (role, policy.describe(), name, e))
+    verify(tid, name, role)
+
+
+def reset_on_fork(role):
+    # Threads and processes the calling thread starts from now on don't inherit role's scheduling, they start with
+    # normal scheduling (a negative nice is reset to 0).  For once the threads which should inherit it (eg. the GPIO
+    # interrupt thread) have been started, so pools, os.system() and subprocess children don't run SCHED_FIFO.
+    # Affinity is still inherited, threads we start apply their own role.
+    policy = _policies.get(role)
+    if policy is None:
+        return
+    tid = threading.get_native_id()
+    try:
+        if policy.fifo > 0:
+            os.sched_setscheduler(tid, os.SCHED_FIFO | os.SCHED_RESET_ON_FORK, os.sched_param(policy.fifo))
+        else:
+            os.sched_setscheduler(tid, os.SCHED_OTHER | os.SCHED_RESET_ON_FORK, os.sched_param(0))
+    except OSError as e:
+        logging.warning("Cannot stop %s scheduling being inherited: %s" % (role, e))
+
+
+def verify(tid, name, role):
+    # Compare what the kernel has for thread tid with role's policy, returns True if it matches, None if the thread
+    # has exited
+    policy = _policies[role]
+    try:
+        cpus, sched, priority, nice = current(tid)
+    except OSError:
+        with _lock:
+            _threads.pop(tid, None)
+        return None
+    ok = cpus == (policy.cpus or _all_cpus())
+    if policy.fifo > 0:
+        ok = ok and sched == os.SCHED_FIFO and priority == policy.fifo
+    else:
+        ok = ok and sched == os.SCHED_OTHER and nice == policy.nice
+    actual = describe(cpus, sched, priority, nice)
+    if ok:
+        logging.debug("%s thread %s (%d): %s" % (role, name, tid, actual))
+    else:
+        logging.warning("%s thread %s (%d): %s, wanted %s" % (role, name, tid, actual, policy.describe()))
+    return ok
+
+
+def report():
+    # Log the scheduling of every thread a policy was applied to, eg. once started
+    if not _policies:
+        logging.info("Default CPU affinity and scheduling")
+        return
+    with _lock:
+        threads = list(_threads.items())
+    for role in ROLES:
+        results = [verify(tid, name, role) for tid, (name, r) in threads if r == role]
+        results = [ok for ok in results if ok is not None]
+        logging.info("%s: %s, %d threads%s" % (role, _policies[role].describe(), len(results),
+                                               "" if all(results) else " (not all applied, see warnings)"))
@@ -15,42 +15,84 @@
 
 ACTION = 'action'
 ADC_INPUT = 'adc_input'
+ANALOG = 'analog'
 ANALOG_CONTROLLERS = 'analog_controllers'
+ARCS = 'arcs'
+BACKGROUND = 'background'
+BINDING = 'binding'
+BLOCKS = 'blocks'
+BRANCH = 'branch'
 BUNDLE = 'bundle'
+BUNDLES = 'bundles'
 BYPASS = 'bypass'
+BYPASSED = 'bypassed'
 CATEGORY = 'category'
 CHANNEL = 'channel'
 COLON_BYPASS = ':bypass'
 COLOR = 'color'
 CONTROL = 'control'
+CONTROL_INPUTS = 'control_inputs'
+CONTROLS = 'controls'
+CPUS = 'cpus'
+DATA = 'data'
 DEBOUNCE_INPUT = 'debounce_input'
+DEPTH = 'depth'
 DISABLE = 'disable'
 DOWN = 'DOWN'
 EXPRESSION = 'EXPRESSION'
+FIFO = 'fifo'
 FOOTSWITCHES = 'footswitches'
 GPIO_INPUT = 'gpio_input'
 GPIO_OUTPUT = 'gpio_output'
 HARDWARE = 'hardware'
+HOST = 'host'
 ID = 'id'
+INFO = 'info'
 INPUT = 'input'
+INSTANCE_ID = 'instance_id'
 KNOB = 'KNOB'
+LAZY_LOAD = 'lazy_load'
 LEFT = 'LEFT'
 LEFT_RIGHT = 'LEFT_RIGHT'
+LILV = 'lilv'
+LOAD_WORKERS = 'load_workers'
+MAIN_LOOP = 'main_loop'
+MANIFESTS = 'manifests'
 MAXIMUM = 'maximum'
 MIDI = 'midi'
 MIDI_CC = 'midi_CC'
 MINIMUM = 'minimum'
+MODUI = 'modui'
+MTIME = 'mtime'
+MTIMES = 'mtimes'
 NAME = 'name'
+NICE = 'nice'
 NONE = 'None'
 PARAMETER = 'parameter'
+PARAMETER_RATE = 'parameter_rate'
+PARAMETER_WEBSOCKET = 'parameter_websocket'
+PARAMETERS = 'parameters'
+PARSER = 'parser'
+PEDALBOARD = 'pedalboard'
+PEDALBOARDS = 'pedalboards'
+PLUGINS = 'plugins'
 PORTS = 'ports'
 PRESET = 'preset'
+PROTOTYPE = 'prototype'
 RANGES = 'ranges'
+REALTIME = 'realtime'
 RIGHT = 'RIGHT'
 SHORTNAME = 'shortName'
+SNAPSHOTS = 'snapshots'
+SUBSCRIBE = 'subscribe'
 SYMBOL = 'symbol'
 THRESHOLD = 'threshold'
 TITLE = 'title'
+TURTLE = 'turtle'
 TYPE = 'type'
 UP = 'UP'
+VALUE = 'value'
+VERIFY_PRESETS = 'verify_presets'
 VERSION = 'version'
+WATCH = 'watch'
+WIFI = 'wifi'
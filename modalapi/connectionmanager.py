@@ -0,0 +1,91 @@
+# This file is part of pi-stomp.
+#
+# pi-stomp is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pi-stomp is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pi-stomp.  If not, see <https://www.gnu.org/licenses/>.
+
+import logging
+import threading
+import time
+
+import common.eventloop as EventLoop
+import common.realtime as Realtime
+
+# Probe delays (seconds), doubling while mod-ui doesn't answer
+RETRY_MIN = 0.5
+RETRY_MAX = 30.0
+
+
+class ConnectionManager:
+
+    # Keeps track of whether mod-ui is available
+    #
+    # A background thread probes mod-ui (see ModUi.probe) until it answers, backing off exponentially.  Once it
+    # has, the thread waits for the client's circuit breaker to open (requests failing to connect) and then
+    # starts probing again.  poll() (called from the main loop) reports the changes.
+    def __init__(self, modui, retry_min=RETRY_MIN, retry_max=RETRY_MAX):
+        self.modui = modui
+        self.retry_min = retry_min
+        self.retry_max = retry_max
+        self.available = False  # as last seen by the thread
+        self.reported = False   # as last returned by poll()
+        self.ready = threading.Event()
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self._connection_thread, daemon=True)
+        self.thread.start()
+
+    def __del__(self):
+        logging.info("mod-ui connection cleanup")
+        self.stop.set()
+
+    def _connection_thread(self):
+        Realtime.apply(Realtime.BACKGROUND)
+        delay = 0
+        while not self.stop.is_set():
+            if delay > 0 and self.stop.wait(delay):
+                return
+            while not self.modui.probe():
+                delay = min(max(delay * 2, self.retry_min), self.retry_max)
+                logging.info("Waiting %.1fs for mod-ui" % delay)
+                if self.stop.wait(delay):
+                    return
+            logging.info("mod-ui available")
+            up = time.monotonic()
+            self.available = True
+            self.ready.set()
+            EventLoop.wakeup()
+
+            while not self.modui.breaker.wait_open(1.0):
+                if self.stop.is_set():
+                    return
+            self.ready.clear()
+            self.available = False
+            EventLoop.wakeup()
+
+            # A connection which fails again straight away (eg. mod-ui answering but not working) backs off too
+            if time.monotonic() - up > self.retry_max:
+                delay = 0
+            else:
+                delay = min(max(delay * 2, self.retry_min), self.retry_max)
+
+    # External API
+    def wait(self, timeout):
+        # Wait (at most timeout seconds) for mod-ui to be available, returns whether it is
+        return self.ready.wait(timeout)
+
+    def poll(self):
+        # True once mod-ui has become available, False once it has become unavailable, otherwise None
+        available = self.available
+        if available == self.reported:
+            return None
+        self.reported = available
+        return available
@@ -0,0 +1,152 @@
+# This file is part of pi-stomp.
+#
+# pi-stomp is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pi-stomp is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pi-stomp.  If not, see <https://www.gnu.org/licenses/>.
+
+import logging
+import queue
+import threading
+import time
+
+import common.eventloop as EventLoop
+import common.histogram as Histogram
+import common.realtime as Realtime
+
+# Resources, each has its own ordered queue and worker thread
+MODUI = "modui"          # mod-ui requests which change the host's state
+AUDIOCARD = "audiocard"  # amixer/alsactl
+PREPARE = "prepare"      # local work which can overlap the host's
+
+
+class Task:
+
+    def __init__(self, fn, args, callback, errback, label, key):
+        self.fn = fn
+        self.args = args
+        self.callback = callback
+        self.errback = errback
+        self.label = label
+        self.key = key
+        self.start = None
+
+
+class Executor:
+
+    # Runs host commands (HTTP requests, subprocesses) off the main loop so controls are polled while they wait
+    #
+    # Tasks submitted for the same resource run one at a time, in order.  Different resources run concurrently.
+    # A task's callback (or errback) is not called on the worker, it's queued and run by poll() on the main loop,
+    # so callbacks can touch the LCD, hardware and pedalboard model like any other main loop code.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = {}  # resource: [Task]
+        self.running = {}  # resource: Task
+        self.wakeup = {}   # resource: threading.Condition
+        self.done = queue.Queue()  # (fn, arg) to run on the main loop
+
+    def _worker_thread(self, resource):
+        Realtime.apply(Realtime.HOST)
+        cond = self.wakeup[resource]
+        while True:
+            with cond:
+                while len(self.pending[resource]) == 0:
+                    cond.wait()
+                task = self.pending[resource].pop(0)
+                task.start = time.monotonic()
+                self.running[resource] = task
+            try:
+                result = task.fn(*task.args)
+                if task.callback is not None:
+                    self.done.put((task.callback, result))
+                    EventLoop.wakeup()
+            except Exception as e:
+                logging.error("%s task failed: %s" % (resource, e))
+                if task.errback is not None:
+                    self.done.put((task.errback, e))
+                    EventLoop.wakeup()
+            with cond:
+                self.running.pop(resource, None)
+
+    # External API
+    def submit(self, resource, fn, *args, callback=None, errback=None, label=None, key=None):
+        # Queue fn(*args) on resource's worker.  callback(result) or errback(exception) follow on the main loop.
+        # A task with a key replaces a queued (not yet started) task with the same key, eg. so only the last of
+        # several quick preset changes is sent.  label describes the task for progress display.
+        task = Task(fn, args, callback, errback, label, key)
+        with self.lock:
+            if resource not in self.wakeup:
+                self.pending[resource] = []
+                self.wakeup[resource] = threading.Condition()
+                threading.Thread(target=self._worker_thread, args=(resource,), daemon=True).start()
+        cond = self.wakeup[resource]
+        with cond:
+            tasks = self.pending[resource]
+            if key is not None:
+                for i, t in enumerate(tasks):
+                    if t.key == key:
+                        logging.debug("Replacing queued %s task: %s" % (resource, key))
+                        tasks[i] = task
+                        break
+                else:
+                    tasks.append(task)
+            else:
+                tasks.append(task)
+            cond.notify()
+
+    def poll(self):
+        # Run completion callbacks, returns True if any were run
+        if self.done.empty():
+            return False
+        while True:
+            try:
+                fn, arg = self.done.get_nowait()
+            except queue.Empty:
+                return True
+            start = time.perf_counter()
+            try:
+                fn(arg)
+            except Exception as e:
+                logging.error("Task callback failed: %s" % e)
+            Histogram.get(Histogram.CALLBACK).add(time.perf_counter() - start)
+
+    def busy(self, resource=None):
+        # True if anything (for resource) is queued or running
+        resources = [resource] if resource is not None else list(self.wakeup)
+        for r in resources:
+            if r in self.wakeup:
+                with self.wakeup[r]:
+                    if len(self.pending[r]) > 0 or r in self.running:
+                        return True
+        return False
+
+    def wait(self, timeout=5.0):
+        # Wait for everything queued to finish (callbacks aren't run), returns False on timeout
+        deadline = time.monotonic() + timeout
+        while self.busy():
+            if time.monotonic() > deadline:
+                logging.warning("Timed out waiting for host commands to finish")
+                return False
+            time.sleep(0.01)
+        return True
+
+    def progress(self):
+        # (label, seconds) of the longest running labelled task, or None
+        now = time.monotonic()
+        longest = None
+        for resource in list(self.running):
+            task = self.running.get(resource)
+            if task is not None and task.label is not None and task.start is not None:
+                elapsed = now - task.start
+                if longest is None or elapsed > longest[1]:
+                    longest = (task.label, elapsed)
+        return longest
@@ -0,0 +1,121 @@
+# This file is part of pi-stomp.
+#
+# pi-stomp is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pi-stomp is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pi-stomp.  If not, see <https://www.gnu.org/licenses/>.
+
+import heapq
+
+
+# Signal graph of a pedalboard
+#
+# Nodes are plugin instance_ids, arcs are (tail, head) pairs where None stands for the pedalboard's own
+# (system capture/playback) ports.  From that, a stable plugin order is computed which covers splits, merges
+# and parallel (eg. stereo) paths:
+#   order:  topological order, plugins closer to the inputs first.  Ties are broken by the order in which
+#           plugins are reached from the inputs, then by the order they were given in.
+#           Plugins in a feedback loop and then plugins not reachable from the inputs follow.
+#   depth:  length of the longest path from the inputs (0 for a plugin fed directly by the inputs)
+#   branch: parallel path index.  A path gets a new branch when it starts at the inputs or splits off
+#           another path, and keeps it until it merges (merged plugins take the branch of their first input)
+class Graph:
+
+    def __init__(self, instance_ids, arcs):
+        self.instance_ids = list(instance_ids)
+        self.successors = {i: [] for i in self.instance_ids}
+        self.predecessors = {i: [] for i in self.instance_ids}
+        self.inputs = []  # plugins fed directly by the pedalboard inputs
+        self.order = []
+        self.depth = {}
+        self.branch = {}
+
+        for tail, head in arcs:
+            if head is None or head not in self.successors:
+                continue
+            if tail is None:
+                if head not in self.inputs:
+                    self.inputs.append(head)
+            elif tail in self.successors and head not in self.successors[tail]:
+                self.successors[tail].append(head)
+                self.predecessors[head].append(tail)
+
+        self.__sort()
+        self.__assign_branches()
+
+    def __reached(self):
+        # Breadth first discovery order from the inputs, used as the tie breaker when sorting
+        reached = {}
+        frontier = list(self.inputs)
+        while frontier:
+            next_frontier = []
+            for node in frontier:
+                if node in reached:
+                    continue
+                reached[node] = len(reached)
+                next_frontier.extend(self.successors[node])
+            frontier = next_frontier
+        return reached
+
+    def __sort(self):
+        # Kahn's algorithm, with a priority queue so the resulting order is stable
+        reached = self.__reached()
+        position = {i: n for n, i in enumerate(self.instance_ids)}
+        unreachable = len(self.instance_ids)
+
+        def key(node):
+            return (self.depth[node], reached.get(node, unreachable), position[node])
+
+        remaining = {i: len(self.predecessors[i]) for i in self.instance_ids}
+        emitted = set()
+        ready = []
+        for node in self.instance_ids:
+            if remaining[node] == 0 and node in reached:
+                self.depth[node] = 0
+                heapq.heappush(ready, (key(node), node))
+        self.__drain(ready, remaining, emitted, key)
+
+        # Whatever is left is either part of a feedback loop or not connected to the inputs
+        for node in sorted(self.instance_ids, key=lambda n: (reached.get(n, unreachable), position[n])):
+            if node in emitted:
+                continue
+            remaining[node] = 0  # breaks a loop here, if there is one
+            self.depth.setdefault(node, 0)
+            heapq.heappush(ready, (key(node), node))
+            self.__drain(ready, remaining, emitted, key)
+
+    def __drain(self, ready, remaining, emitted, key):
+        while ready:
+            _, node = heapq.heappop(ready)
+            if node in emitted:
+                continue
+            emitted.add(node)
+            self.order.append(node)
+            for s in self.successors[node]:
+                if s in emitted:
+                    continue
+                self.depth[s] = max(self.depth.get(s, 0), self.depth[node] + 1)
+                remaining[s] -= 1
+                if remaining[s] == 0:
+                    heapq.heappush(ready, (key(s), s))
+
+    def __assign_branches(self):
+        next_branch = 0
+        position = {i: n for n, i in enumerate(self.order)}
+        for node in self.order:
+            preds = [p for p in self.predecessors[node] if p in self.branch]
+            if len(preds) > 0:
+                first = min(preds, key=position.get)
+                if self.successors[first][0] == node:
+                    self.branch[node] = self.branch[first]
+                    continue
+            self.branch[node] = next_branch
+            next_branch += 1
@@ -0,0 +1,163 @@
+# This file is part of pi-stomp.
+#
+# pi-stomp is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pi-stomp is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pi-stomp.  If not, see <https://www.gnu.org/licenses/>.
+
+import lilv
+import logging
+import os
+import threading
+
+import common.token as Token
+import common.util as util
+
+
+# A single lilv World shared by all pedalboards
+#
+# Specifications and plugin classes are loaded once.  Each pedalboard bundle is loaded, reduced to plain
+# python data (see parse_pedalboard) and then unloaded again, so the RDF model doesn't grow with the
+# number of pedalboards.  lilv isn't thread safe, so all access is serialized by self.lock
+class LilvWorld:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.world = lilv.World()
+
+        # this is needed when loading specific bundles instead of load_all
+        # (these functions are not exposed via World yet)
+        self.world.load_specifications()
+        self.world.load_plugin_classes()
+
+        self.uri_arc   = self.world.new_uri("http://drobilla.net/ns/ingen#arc")
+        self.uri_block = self.world.new_uri("http://drobilla.net/ns/ingen#block")
+        self.uri_head  = self.world.new_uri("http://drobilla.net/ns/ingen#head")
+        self.uri_port  = self.world.new_uri("http://lv2plug.in/ns/lv2core#port")
+        self.uri_tail  = self.world.new_uri("http://drobilla.net/ns/ingen#tail")
+        self.uri_type  = self.world.new_uri("http://www.w3.org/1999/02/22-rdf-syntax-ns#type")
+        self.uri_value = self.world.new_uri("http://drobilla.net/ns/ingen#value")
+
+    def get_pedalboard_plugin(self, bundlenode, bundle):
+        # get all plugins in the bundle (other bundles have been unloaded, but match the bundle to be sure)
+        plugin = None
+        for p in self.world.get_all_plugins():
+            if str(p.get_bundle_uri()) == str(bundlenode):
+                if plugin is not None:
+                    raise Exception('get_pedalboard_plugin(%s) - bundle has > 1 plugin' % bundle)
+                plugin = p
+
+        if plugin is None:
+            raise Exception('get_pedalboard_plugin(%s) - bundle has no plugin' % bundle)
+
+        return plugin
+
+    def port_owner(self, port, bundlepath):
+        # Ports are named <bundle>/<instance>/<symbol> for plugins and <bundle>/<symbol> for the pedalboard's own
+        # (system) ports.  Returns the plugin instance_id, or None for a pedalboard port
+        path = str(port.get_path()).replace(bundlepath, "", 1)
+        owner = os.path.dirname(path)
+        if owner in ("", os.sep):
+            return None
+        return owner
+
+    # Parse a pedalboard bundle into plain python data
+    # @a bundlepath is a string, consisting of a directory in the filesystem (absolute pathname).
+    def parse_pedalboard(self, bundlepath):
+        # lilv wants the last character as the separator
+        bundle = os.path.abspath(bundlepath)
+        if not bundle.endswith(os.sep):
+            bundle += os.sep
+
+        with self.lock:
+            # convert bundle string into a lilv node and load the bundle
+            bundlenode = self.world.new_file_uri(None, bundle)
+            self.world.load_bundle(bundlenode)
+            try:
+                plugin = self.get_pedalboard_plugin(bundlenode, bundle)
+                return self.__extract(plugin, bundlepath)
+            finally:
+                # Nothing refers to the RDF model once extracted, free it
+                self.world.unload_bundle(bundlenode)
+
+    def __extract(self, plugin, bundlepath):
+        # check if the plugin is a pedalboard
+        def fill_in_type(node):
+            if node is not None and node.is_uri():
+                return str(node)
+            return None
+
+        plugin_types = [i for i in util.LILV_FOREACH(plugin.get_value(self.uri_type), fill_in_type)]
+        if "http://moddevices.com/ns/modpedal#Pedalboard" not in plugin_types:
+            raise Exception('parse_pedalboard(%s) - plugin has no mod:Pedalboard type' % bundlepath)
+
+        # Connections between ports, reduced to connections between plugins
+        # Sorted by port so the order doesn't depend on how the file was written
+        arcs = []
+        for arc in plugin.get_value(self.uri_arc):
+            tail = self.world.get(arc, self.uri_tail, None)
+            head = self.world.get(arc, self.uri_head, None)
+            if tail is None or head is None:
+                continue
+            arcs.append((str(tail), str(head), self.port_owner(tail, bundlepath), self.port_owner(head, bundlepath)))
+        arcs = [(tail, head) for _, _, tail, head in sorted(arcs)]
+
+        # Iterate blocks (plugins)
+        blocks = []
+        for block in plugin.get_value(self.uri_block):
+            if block is None or block.is_blank():
+                continue
+
+            instance_id = str(block.get_path()).replace(bundlepath, "", 1)
+
+            prototype = None
+            nodes = self.world.find_nodes(block, self.world.ns.lv2.prototype, None)
+            if len(nodes) > 0:
+                prototype = str(nodes[0])
+
+            # These are the port nodes used to define parameter controls
+            ports = []
+            for port in self.world.find_nodes(block, self.world.ns.lv2.port, None):
+                param_value = self.world.get(port, self.uri_value, None)
+                binding = None
+                binding_node = self.world.get(port, self.world.ns.midi.binding, None)
+                if binding_node is not None:
+                    controller_num = self.world.get(binding_node, self.world.ns.midi.controllerNumber, None)
+                    channel = self.world.get(binding_node, self.world.ns.midi.channel, None)
+                    if (controller_num is not None) and (channel is not None):
+                        binding = "%d:%d" % (self.world.new_int(channel), self.world.new_int(controller_num))
+                        logging.debug("  MIDI CC binding %s" % binding)
+                value = None
+                if param_value is not None:
+                    if param_value.is_float():
+                        value = float(self.world.new_float(param_value))
+                    elif param_value.is_int():
+                        value = int(self.world.new_int(param_value))
+                    else:
+                        value = str(value)
+                ports.append({Token.SYMBOL: os.path.basename(str(port)), Token.VALUE: value, Token.BINDING: binding})
+
+            blocks.append({Token.INSTANCE_ID: instance_id, Token.PROTOTYPE: prototype, Token.PORTS: ports})
+
+        return {Token.BLOCKS: blocks, Token.ARCS: arcs}
+
+
+_world = None
+_world_lock = threading.Lock()
+
+
+def get_world():
+    # The world is created on first use so processes which never parse a bundle don't pay for it
+    global _world
+    with _world_lock:
+        if _world is None:
+            _world = LilvWorld()
+        return _world
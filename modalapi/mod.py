@@ -16,18 +16,30 @@
 import json
 import logging
 import os
-import requests as req
 import subprocess
 import sys
+import threading
 import time
 import yaml
 
+import common.histogram as Histogram
 import common.token as Token
 import common.util as util
 import pistomp.analogswitch as AnalogSwitch
+import pistomp.config as config
 import pistomp.encoderswitch as EncoderSwitch
+import modalapi.connectionmanager as ConnectionManager
+import modalapi.executor as Executor
+import modalapi.modui as ModUi
+import modalapi.moduisubscriber as ModUiSubscriber
 import modalapi.pedalboard as Pedalboard
+import modalapi.pedalboardcache as PedalboardCache
+import modalapi.pedalboardresolver as PedalboardResolver
+import modalapi.pedalboardwatcher as PedalboardWatcher
 import modalapi.parameter as Parameter
+import modalapi.parametersender as ParameterSender
+import modalapi.plugincache as PluginCache
+import modalapi.snapshots as Snapshots
 import modalapi.wifi as Wifi
 
 from pistomp.analogmidicontrol import AnalogMidiControl
@@ -82,6 +94,9 @@ class MenuType(Enum):
     MENU_SYSTEM = 1
     MENU_INFO = 2
 
+# Seconds to wait for mod-ui at startup before going ahead without it
+STARTUP_WAIT = 2.0
+
 class Mod(Handler):
     __single = None
 
@@ -96,7 +111,22 @@ class Mod(Handler):
         self.audiocard = audiocard
         self.lcd = None
         self.homedir = homedir
-        self.root_uri = "http://localhost:80/"
+        self.root_uri = ModUi.ROOT_URI
+        self.modui = ModUi.get_client()  # all mod-ui requests go through this
+        self.connection = None  # watches mod-ui's availability (see host_connect)
+        self.ready = False  # pedalboard state has been loaded from mod-ui, until then only MIDI controls work
+        self.parameter_websocket = False  # send parameter changes over the subscriber's websocket
+        self.modui_subscriber = None  # follows changes made via MOD UI
+        self.parameter_sender = None  # sends encoder edits in the background
+        self.executor = Executor.Executor()  # runs host commands without stalling the main loop
+        self.pedalboard_changing = None  # pedalboard being loaded by the executor
+        self.pedalboards_changed = set()  # bundles added, removed or saved, until rescanned (see pedalboard_rescan)
+        self.snapshot_cache = Snapshots.SnapshotCache()
+        self.verify_presets = True  # check the cached snapshots against mod-ui's after a preset change
+        self.host_state_supported = True  # until mod-ui turns out not to have pi_stomp_state
+        self.progress_shown = False  # the info area shows executor progress
+        self.data_dir = "/home/pistomp/data"
+        self.pedalboard_dir = os.path.join(self.data_dir, ".pedalboards")
 
         self.pedalboards = {}
         self.pedalboard_list = []  # TODO LAME to have two lists
@@ -108,7 +138,14 @@ class Mod(Handler):
         self.selected_parameter_index = 0
         self.parameter_tweak_amount = 8
 
-        self.plugin_dict = {}
+        # Plugin data (from mod-ui) and parsed pedalboards are persisted between sessions, so only new/changed
+        # plugins need to be fetched and only new/changed bundles need to be parsed at boot
+        cache_dir = os.path.join(self.data_dir, ".pistomp")
+        self.plugin_cache = PluginCache.PluginCache(os.path.join(cache_dir, "plugins.json"))
+        self.plugin_dict = self.plugin_cache.load()
+        self.pedalboard_cache = PedalboardCache.PedalboardCache(os.path.join(cache_dir, "pedalboards.json"))
+        self.pedalboard_resolver = PedalboardResolver.PedalboardResolver(self.plugin_dict, self.pedalboard_cache,
+                                                                         self.plugin_cache)
 
         self.hardware = None
 
@@ -128,16 +165,29 @@ class Mod(Handler):
         self.current_menu = MenuType.MENU_NONE
 
         # This file is modified when the pedalboard is changed via MOD UI
-        self.pedalboard_modification_file = "/home/pistomp/data/last.json"
+        self.pedalboard_modification_file = os.path.join(self.data_dir, "last.json")
         self.pedalboard_change_timestamp = os.path.getmtime(self.pedalboard_modification_file)\
             if Path(self.pedalboard_modification_file).exists() else 0
 
         self.wifi_manager = Wifi.WifiManager()
+        self.pedalboard_watcher = None  # started once pedalboards are loaded
+
+    def cleanup(self):
+        self.parameter_flush()
+        self.executor.wait()
+        for line in self.modui.latency_summary():
+            logging.info("mod-ui latency %s" % line)
 
     def __del__(self):
         logging.info("Handler cleanup")
         if self.wifi_manager:
             del self.wifi_manager
+        if self.pedalboard_watcher:
+            del self.pedalboard_watcher
+        if self.modui_subscriber:
+            del self.modui_subscriber
+        if self.connection:
+            del self.connection
 
     # Container for dynamic data which is unique to the "current" pedalboard
     # The self.current pointed above will point to this object which gets
@@ -147,9 +197,42 @@ class Mod(Handler):
         def __init__(self, pedalboard):
             self.pedalboard = pedalboard
             self.presets = {}
+            self.snapshots = None  # {index: Snapshot} read from the bundle, if it has a snapshot file
             self.preset_index = 0
             self.analog_controllers = {}  # { type: (plugin_name, param_name) }
 
+    # Progress and per-phase timings of making a pedalboard current (see pedalboard_change and pedalboard_follow)
+    # The host load and the local preparation run concurrently on the executor, whichever finishes last
+    # swaps the result in
+    class Switch:
+        def __init__(self, pedalboard):
+            self.pedalboard = pedalboard
+            self.start = time.monotonic()
+            self.loaded = False   # the host has loaded the bundle
+            self.prepared = None  # Prepared, once the local preparation is done
+            self.state = None     # the host's plugin values after the load (see host_state_get)
+            self.presets = None   # {index: name} from mod-ui, for bundles without snapshots
+            self.timings = []     # (phase, seconds)
+            self.lock = threading.Lock()
+
+        def timed(self, phase, fn, *args):
+            start = time.monotonic()
+            result = fn(*args)
+            with self.lock:
+                self.timings.append((phase, time.monotonic() - start))
+            return result
+
+        def log(self):
+            phases = ", ".join("%s %dms" % (phase, secs * 1000) for phase, secs in self.timings)
+            logging.info("Pedalboard switch to %s: %dms (%s)" %
+                         (self.pedalboard.title, (time.monotonic() - self.start) * 1000, phases))
+
+    # Everything set_current_pedalboard needs which doesn't depend on the host
+    class Prepared:
+        def __init__(self, cfg, snapshots):
+            self.cfg = cfg              # pedalboard specific config.yml, or None
+            self.snapshots = snapshots  # {index: Snapshot} from the bundle, None if presets need fetching from mod-ui
+
     class Deep:
         def __init__(self, plugin):
             self.plugin = plugin
@@ -164,6 +247,14 @@ class Mod(Handler):
 
     def add_hardware(self, hardware):
         self.hardware = hardware
+        cfg = hardware.default_cfg
+        if config.get_value(cfg, Token.MODUI, Token.SUBSCRIBE, True):
+            self.modui_subscriber = ModUiSubscriber.ModUiSubscriber()
+            self.parameter_websocket = config.get_value(cfg, Token.MODUI, Token.PARAMETER_WEBSOCKET, False)
+        self.parameter_sender = ParameterSender.ParameterSender(self.parameter_send, config.get_value(
+            cfg, Token.MODUI, Token.PARAMETER_RATE, ParameterSender.DEFAULT_RATE))
+        self.verify_presets = config.get_value(cfg, Token.MODUI, Token.VERIFY_PRESETS, True)
+        self.wifi_manager.period = config.get_value(cfg, Token.MAIN_LOOP, Token.WIFI, Wifi.POLL_PERIOD)
 
     def add_lcd(self, lcd):
         self.lcd = lcd
@@ -382,23 +473,61 @@ class Mod(Handler):
         return self.selectable_items[self.selectable_index][0]
 
     def poll_controls(self):
+        # Called when the main loop is woken, returns True while controls need polling again (see Handler)
+        if not self.ready:
+            # Degraded to a plain MIDI controller until mod-ui is available
+            busy = self.hardware.poll_midi_controls()
+            self.poll_connection()
+            return busy
         if self.universal_encoder_mode is not UniversalEncoderMode.LOADING:
-            self.hardware.poll_controls()
+            busy = self.hardware.poll_gpio_controls()
+        else:
+            busy = True  # so controls used meanwhile are handled once loading is done
+        self.executor.poll()
+        if self.modui_subscriber is not None:
+            events = self.modui_subscriber.poll()
+            if events is not None:
+                self.apply_modui_events(events)
         wifi_update = self.wifi_manager.poll()
         if wifi_update is not None:
             self.wifi_status = wifi_update
             self.lcd.update_wifi(self.wifi_status)
             if self.current_menu == MenuType.MENU_INFO:
                 self.system_info_update_wifi()
+        return busy
+
+    def poll_analog_controls(self):
+        if not self.ready:
+            # Knobs and expression pedals still send MIDI, but an AnalogSwitch press acts on the current
+            # pedalboard and there isn't one yet
+            self.hardware.poll_analog_controls(midi_only=True)
+            return
+        if self.universal_encoder_mode is not UniversalEncoderMode.LOADING:
+            self.hardware.poll_analog_controls()
 
     def poll_modui_changes(self):
         # This poll looks for changes made via the MOD UI and tries to sync the pi-Stomp hardware
+        if not self.ready:
+            return
+        self.poll_connection()
+
+        # Look for pedalboards which have been added, removed or saved
+        if self.pedalboard_watcher is not None:
+            changed = self.pedalboard_watcher.poll()
+            if changed is not None:
+                self.pedalboard_rescan(changed)
+
+        # Our own pedalboard load also touches the modification file, let it finish first
+        if self.pedalboard_changing is None:
+            self.poll_modui_pedalboard()
+
+        self.executor_progress()
 
+    def poll_modui_pedalboard(self):
         # Look for a change of pedalboard
         #
         # If the pedalboard_modification_file timestamp has changed, extract the bundle path and set current pedalboard
-        #
-        # TODO this is an interim solution until better MOD-UI to pi-stomp event communication is added
+        # With the mod-ui subscriber, this is checked as soon as mod-ui reports a pedalboard load
         #
         if Path(self.pedalboard_modification_file).exists():
             ts = os.path.getmtime(self.pedalboard_modification_file)
@@ -407,41 +536,168 @@ class Mod(Handler):
 
             # Timestamp changed
             self.pedalboard_change_timestamp = ts
-            self.lcd.draw_info_message("Loading...")
             mod_bundle = self.get_pedalboard_bundle_from_mod()
             if mod_bundle:
                 logging.info("Pedalboard changed via MOD from: %s to: %s" %
                              (self.current.pedalboard.bundle, mod_bundle))
-                pb = self.pedalboards[mod_bundle]
-                self.set_current_pedalboard(pb)
+                pb = self.pedalboards.get(mod_bundle)
+                if pb is not None:
+                    self.lcd.draw_info_message("Loading...")
+                    self.pedalboard_follow(pb)
+
+    def apply_modui_events(self, events):
+        # Bring the current pedalboard in line with changes made via MOD UI (see ModUiSubscriber)
+        # then redraw only the affected parts of the LCD
+        redraw_title = False
+        redraw_plugins = False
+        redraw_fs = False
+        plugins = {}
+        if self.current is not None:
+            plugins = {"/graph" + p.instance_id: p for p in self.current.pedalboard.plugins}
+
+        for event in events:
+            if event[0] == ModUiSubscriber.LOADED:
+                # Our own pedalboard load also touches the modification file, let it finish first (as
+                # poll_modui_changes does)
+                if self.pedalboard_changing is None:
+                    self.poll_modui_pedalboard()
+                return
+            if self.current is None:
+                continue
+            if event[0] == ModUiSubscriber.PARAM_SET:
+                _, instance, symbol, value = event
+                plugin = plugins.get(instance)
+                if plugin is not None and self.plugin_value_apply(plugin, symbol, value):
+                    redraw_plugins = True
+                    redraw_fs = redraw_fs or plugin.has_footswitch
+            elif event[0] == ModUiSubscriber.SNAPSHOT:
+                _, index, name = event
+                if index != self.current.preset_index:
+                    self.current.preset_index = index
+                    self.selected_preset_index = index
+                    redraw_title = True
+
+        self.update_lcd_changes(redraw_title, redraw_plugins, redraw_fs)
+
+    #
+    # mod-ui connection
+    #
+
+    def host_connect(self):
+        # mod-ui often starts after pi-stomp at boot.  Rather than exiting (and being restarted), the footswitches
+        # and analog controls work as plain MIDI controls until it's up, then the pedalboard state gets loaded
+        self.connection = ConnectionManager.ConnectionManager(self.modui)
+        if self.connection.wait(STARTUP_WAIT):
+            self.poll_connection()
+        else:
+            logging.warning("mod-ui not available, running as a MIDI controller until it is")
+            self.lcd.draw_info_message("Waiting for MOD...")
+
+    def poll_connection(self):
+        available = self.connection.poll() if self.connection is not None else None
+        if available is None:
+            return
+        if available and not self.ready:
+            self.host_ready()
+        elif available:
+            # mod-ui may have been restarted, along with mod-host
+            logging.info("mod-ui reconnected")
+            self.poll_modui_pedalboard()
+            if self.current_menu == MenuType.MENU_NONE:
+                self.update_lcd()
+            self.host_state_sync()
+        else:
+            logging.error("mod-ui connection lost")
+            self.lcd.draw_info_message("MOD unavailable")
+
+    def host_ready(self):
+        # Load everything which comes from mod-ui, then leave degraded mode
+        self.lcd.draw_info_message("Loading...")
+        try:
+            if not self.load_pedalboards():
+                raise ModUi.ModUiUnavailable("no pedalboard list")
+
+            # Load the current pedalboard as "current"
+            current_bundle = self.get_current_pedalboard_bundle_path()
+            if not current_bundle or current_bundle not in self.pedalboards:
+                # Apparently, no pedalboard is currently loaded so just change to the default
+                self.pedalboard_change(blocking=True)
+            else:
+                self.pedalboard_follow(self.pedalboards[current_bundle], blocking=True)
+        except Exception as e:
+            # Try again when the connection manager next finds mod-ui available
+            logging.error("Cannot load pedalboards from mod-ui: %s" % e)
+            self.pedalboard_changing = None
+            self.modui.breaker.trip()
+            return
+        self.ready = True
 
     #
     # Pedalboard Stuff
     #
 
-    def load_pedalboards(self):
-        url = self.root_uri + "pedalboard/list"
+    def get_pedalboard_list(self):
+        # The list of {bundle, title} dicts from mod-ui, or None if it can't be obtained
+        url = "pedalboard/list"
 
         try:
-            resp = req.get(url)
+            resp = self.modui.get(url)
         except:  # TODO
             logging.error("Cannot connect to mod-host")
-            sys.exit()
+            return None
 
         if resp.status_code != 200:
             logging.error("Cannot connect to mod-host.  Status: %s" % resp.status_code)
-            sys.exit()
+            return None
 
-        pbs = json.loads(resp.text)
+        return json.loads(resp.text)
+
+    def load_pedalboards(self):
+        # Returns False if mod-ui couldn't provide the list
+        pbs = self.get_pedalboard_list()
+        if pbs is None:
+            return False
+
+        # With lazy loading, only the current pedalboard gets parsed now.  The others start as title only stubs
+        # which get resolved when selected (or in the background when a neighbour is selected)
+        cfg = self.hardware.default_cfg
+        lazy = config.get_value(cfg, Token.PEDALBOARDS, Token.LAZY_LOAD, True)
+        Pedalboard.set_parser(config.get_value(cfg, Token.PEDALBOARDS, Token.PARSER, Token.LILV))
+        current_bundle = self.get_current_pedalboard_bundle_path()
+
+        to_parse = []
         for pb in pbs:
-            logging.info("Loading pedalboard info: %s" % pb[Token.TITLE])
             bundle = pb[Token.BUNDLE]
             title = pb[Token.TITLE]
-            pedalboard = Pedalboard.Pedalboard(title, bundle)
-            pedalboard.load_bundle(bundle, self.plugin_dict)
-            self.pedalboards[bundle] = pedalboard
-            self.pedalboard_list.append(pedalboard)
-            #logging.debug("dump: %s" % pedalboard.to_json())
+            pedalboard = self.pedalboard_cache.get(bundle, title)
+            if pedalboard is not None:
+                logging.debug("Loaded cached pedalboard info: %s" % title)
+            elif lazy and bundle != current_bundle:
+                pedalboard = Pedalboard.Pedalboard(title, bundle)
+            else:
+                to_parse.append((title, bundle))
+            self.pedalboards[bundle] = pedalboard  # None until parsed, but keeps the mod-ui order
+
+        # Parse bundles which weren't in the cache (or have changed)
+        workers = config.get_value(cfg, Token.PEDALBOARDS, Token.LOAD_WORKERS, 0)
+        for pedalboard in Pedalboard.load_bundles(to_parse, self.plugin_dict, workers):
+            self.pedalboards[pedalboard.bundle] = pedalboard
+            self.pedalboard_cache.put(pedalboard, self.plugin_dict)
+
+        self.pedalboard_list = list(self.pedalboards.values())
+        #logging.debug("dump: %s" % pedalboard.to_json())
+
+        self.pedalboard_cache.prune(self.pedalboards)
+        self.pedalboard_cache.save()
+        self.plugin_cache.save(self.plugin_dict)
+
+        if current_bundle in self.pedalboards:
+            self.pedalboard_resolve_neighbours(self.pedalboard_list.index(self.pedalboards[current_bundle]))
+
+        # Pick up pedalboards saved or added via MOD UI from now on
+        if self.pedalboard_watcher is None and config.get_value(cfg, Token.PEDALBOARDS, Token.WATCH, True):
+            self.pedalboard_watcher = PedalboardWatcher.PedalboardWatcher(self.pedalboard_dir)
+        return True
 
         # TODO - example of querying host
         #bund = self.get_current_pedalboard()
@@ -449,6 +705,89 @@ class Mod(Handler):
         #logging.debug("Preset: %s %d" % (bund, self.host.pedalboard_preset))  # this value not initialized
         #logging.debug("Preset: %s" % self.get_current_preset_name())
 
+    def pedalboard_rescan(self, bundles):
+        # Apply changes to the given bundles (added, removed or saved), leaving all other pedalboards untouched
+        # The list and the saved current pedalboard come from the executor, pedalboard_rescan_done applies them.
+        # Keyed, so bundles changed while a rescan is queued are rescanned together.
+        self.pedalboards_changed |= set(bundles)
+        current_bundle = self.current.pedalboard.bundle if self.current is not None else None
+        self.executor.submit(Executor.MODUI, self.pedalboard_rescan_host, set(self.pedalboards_changed),
+                             list(self.pedalboards), current_bundle, callback=self.pedalboard_rescan_done,
+                             errback=self.pedalboard_rescan_failed, key=Token.PEDALBOARDS)
+
+    def pedalboard_rescan_host(self, bundles, known, current_bundle):
+        # Called on the executor
+        pbs = self.get_pedalboard_list()
+        if pbs is None:
+            return bundles, None, None
+        listed = set(pb[Token.BUNDLE] for pb in pbs)
+        self.pedalboard_resolver.forget(list(bundles) + [bundle for bundle in known if bundle not in listed])
+
+        # The current pedalboard is parsed again if it was saved, to see whether its bindings changed
+        saved = None
+        if current_bundle in bundles:
+            for pb in pbs:
+                if pb[Token.BUNDLE] == current_bundle:
+                    saved = self.pedalboard_resolver.resolve(Pedalboard.Pedalboard(pb[Token.TITLE], current_bundle))
+        return bundles, pbs, saved
+
+    def pedalboard_rescan_done(self, result):
+        bundles, pbs, saved = result
+        if pbs is None:
+            return  # left in pedalboards_changed, for the next rescan
+        self.pedalboards_changed -= bundles
+        logging.info("Pedalboards changed: %s" % ", ".join(sorted(bundles)))
+
+        selected = None
+        if self.selected_pedalboard_index < len(self.pedalboard_list):
+            selected = self.pedalboard_list[self.selected_pedalboard_index].bundle
+        current = self.current.pedalboard if self.current is not None else None
+
+        pedalboards = {}
+        for pb in pbs:
+            bundle = pb[Token.BUNDLE]
+            pedalboard = self.pedalboards.get(bundle)
+            if saved is not None and bundle == saved.bundle:
+                pedalboard = saved
+            elif pedalboard is None or bundle in bundles:
+                # New or saved, it gets parsed when needed like any other stub
+                pedalboard = Pedalboard.Pedalboard(pb[Token.TITLE], bundle)
+            pedalboard.title = pb[Token.TITLE]
+            pedalboards[bundle] = pedalboard
+        removed = [bundle for bundle in self.pedalboards if bundle not in pedalboards]
+        if len(removed) > 0:
+            logging.info("Pedalboards removed: %s" % ", ".join(removed))
+
+        self.pedalboards = pedalboards
+        self.pedalboard_list = list(self.pedalboards.values())
+        if selected in self.pedalboards:
+            self.selected_pedalboard_index = self.pedalboard_list.index(self.pedalboards[selected])
+        else:
+            self.selected_pedalboard_index = 0
+
+        if current is not None and current.bundle in self.pedalboards:
+            # The current pedalboard is only rebuilt if its plugins or their bindings were changed
+            if current.bundle in bundles:
+                pedalboard = self.pedalboards[current.bundle]
+                if not pedalboard.loaded or self.pedalboard_bindings(pedalboard) != self.pedalboard_bindings(current):
+                    self.pedalboard_follow(pedalboard)  # (not loaded if it became current since the rescan)
+                else:
+                    current.title = pedalboard.title
+                    self.pedalboards[current.bundle] = current
+                    self.pedalboard_list[self.pedalboard_list.index(pedalboard)] = current
+            self.update_lcd_title()
+
+        if len(self.pedalboard_list) > 0:
+            self.pedalboard_resolve_neighbours(self.selected_pedalboard_index)
+
+    def pedalboard_rescan_failed(self, error):
+        # The bundles are left in pedalboards_changed, for the next rescan
+        logging.error("Cannot rescan pedalboards: %s" % error)
+
+    def pedalboard_bindings(self, pedalboard):
+        return set((p.instance_id, symbol, param.binding) for p in pedalboard.plugins
+                   for symbol, param in p.parameters.items())
+
     def get_pedalboard_bundle_from_mod(self):
         # Assumes the caller has already checked for existence of the file
         mod_bundle = None
@@ -463,25 +802,38 @@ class Mod(Handler):
             mod_bundle = self.get_pedalboard_bundle_from_mod()
         return mod_bundle
 
-    def set_current_pedalboard(self, pedalboard):
+    def pedalboard_resolve_neighbours(self, index):
+        # Queue the pedalboards adjacent to index for background loading, they're the likely next selections
+        num = len(self.pedalboard_list)
+        if num > 0:
+            self.pedalboard_resolver.resolve_later([self.pedalboard_list[(index + i) % num] for i in (0, 1, -1)])
+
+    def set_current_pedalboard(self, switch):
+        # switch has been prepared, and has the host's state, by pedalboard_change or pedalboard_follow.  Nothing
+        # here waits for the host.
+        prepared = switch.prepared
+
         # Delete previous "current"
         del self.current
 
         # Create a new "current"
-        self.current = self.Current(pedalboard)
+        self.current = self.Current(switch.pedalboard)
 
-        # Load Pedalboard specific config (overrides default set during initial hardware init)
-        config_file = Path(pedalboard.bundle) / "config.yml"
-        cfg = None
-        if config_file.exists():
-            with open(config_file.as_posix(), 'r') as ymlfile:
-                cfg = yaml.load(ymlfile, Loader=yaml.SafeLoader)
-        self.hardware.reinit(cfg)
+        # Pedalboard specific config overrides the default set during initial hardware init
+        switch.timed("reinit", self.hardware.reinit, prepared.cfg)
+
+        # The values the host is actually using (eg. from its current snapshot) rather than the saved ones
+        if switch.state is not None:
+            self.host_state_apply(switch.state, redraw=False)
 
         # Initialize the data
-        self.bind_current_pedalboard()
-        self.load_current_presets()
-        self.update_lcd()
+        switch.timed("bind", self.bind_current_pedalboard)
+        if prepared.snapshots is not None:
+            self.current.snapshots = prepared.snapshots
+            self.current.presets = {index: s.name for index, s in prepared.snapshots.items()}
+        elif switch.presets is not None:
+            self.current.presets = switch.presets
+        switch.timed("lcd", self.update_lcd)
 
         # Selection info
         self.selectable_items.clear()
@@ -495,6 +847,26 @@ class Mod(Handler):
             self.selectable_items.append((SelectedType.SYSTEM, None))
         self.selectable_index = 0
         self.selected_preset_index = 0
+        switch.log()
+
+    def pedalboard_prepare(self, switch):
+        # May be called on the executor, so only reads files (and the resolver, which has its own lock)
+        pedalboard = switch.pedalboard
+
+        # Make sure the pedalboard is fully loaded (it might still be a stub)
+        switch.timed("resolve", self.pedalboard_resolver.resolve, pedalboard)
+        cfg = switch.timed("config", self.read_pedalboard_config, pedalboard)
+        snapshots = switch.timed("snapshots", self.snapshot_cache.get, pedalboard.bundle)
+        switch.prepared = self.Prepared(cfg, snapshots)
+        return switch
+
+    def read_pedalboard_config(self, pedalboard):
+        config_file = Path(pedalboard.bundle) / "config.yml"
+        cfg = None
+        if config_file.exists():
+            with open(config_file.as_posix(), 'r') as ymlfile:
+                cfg = yaml.load(ymlfile, Loader=yaml.SafeLoader)
+        return cfg
 
     def bind_current_pedalboard(self):
         # "current" being the pedalboard mod-host says is current
@@ -541,45 +913,126 @@ class Mod(Handler):
             highlight_only = self.universal_encoder_mode == UniversalEncoderMode.PEDALBOARD_SELECT
             self.lcd.draw_title(self.pedalboard_list[next_idx].title, None, True, False, highlight_only)
             self.selected_pedalboard_index = next_idx
+            self.pedalboard_resolve_neighbours(next_idx)
 
-    def pedalboard_change(self):
+    def pedalboard_change(self, blocking=False):
+        # The host loads the bundle while the rest is prepared locally (see Switch), both on the executor.
+        # set_current_pedalboard follows when both are done.
+        # (blocking is for startup, when there's no current pedalboard to keep the controls going with)
         logging.info("Pedalboard change")
         if self.selected_pedalboard_index < len(self.pedalboard_list):
             self.lcd.draw_info_message("Loading...")
+            switch = self.Switch(self.pedalboard_list[self.selected_pedalboard_index])
+            self.pedalboard_changing = switch
+            if blocking:
+                self.pedalboard_switch_now(switch, self.pedalboard_change_host)
+            else:
+                # Keyed, so scrolling through several pedalboards only loads the last one still queued
+                self.executor.submit(Executor.MODUI, self.pedalboard_change_host, switch,
+                                     callback=self.pedalboard_change_done, errback=self.pedalboard_change_failed,
+                                     label="Loading", key=Token.PEDALBOARD)
+                self.executor.submit(Executor.PREPARE, self.pedalboard_prepare, switch,
+                                     callback=self.pedalboard_change_done, errback=self.pedalboard_change_failed,
+                                     key=Token.PEDALBOARD)
+
+    def pedalboard_follow(self, pedalboard, blocking=False):
+        # The host already has pedalboard loaded (changed via MOD UI, or rebuilt after a save), only the host's
+        # state is fetched.  Otherwise like pedalboard_change.
+        switch = self.Switch(pedalboard)
+        self.pedalboard_changing = switch
+        if blocking:
+            self.pedalboard_switch_now(switch, self.pedalboard_state_host)
+        else:
+            self.executor.submit(Executor.MODUI, self.pedalboard_state_host, switch,
+                                 callback=self.pedalboard_change_done, errback=self.pedalboard_change_failed,
+                                 label="Loading", key=Token.PEDALBOARD)
+            self.executor.submit(Executor.PREPARE, self.pedalboard_prepare, switch,
+                                 callback=self.pedalboard_change_done, errback=self.pedalboard_change_failed,
+                                 key=Token.PEDALBOARD)
+
+    def pedalboard_switch_now(self, switch, host_fn):
+        # Everything on this thread, for startup when there are no controls to keep going
+        self.pedalboard_prepare(switch)
+        host_fn(switch)
+        if switch.prepared.snapshots is None:
+            self.pedalboard_presets_host(switch)
+        self.pedalboard_change_done(switch)
+
+    def pedalboard_state_host(self, switch):
+        # Called on the executor
+        self.parameter_flush()
+        switch.state = switch.timed("state", self.host_state_get)
+        switch.loaded = True
+        return switch
+
+    def pedalboard_presets_host(self, switch):
+        # Called on the executor
+        switch.presets = switch.timed("presets", self.load_current_presets)
+        return switch
+
+    def pedalboard_change_host(self, switch):
+        # Called on the executor
+        self.parameter_flush()
+        resp1 = switch.timed("reset", self.modui.get, "reset")
+        if resp1.status_code != 200:
+            logging.error("Bad Reset request")
+
+        uri = "pedalboard/load_bundle/"
+        data = {"bundlepath": switch.pedalboard.bundle}
+        resp2 = switch.timed("load_bundle", self.modui.post, uri, data)
+        if resp2.status_code != 200:
+            logging.error("Bad Rest request: %s %s  status: %d" % (uri, data, resp2.status_code))
+        switch.state = switch.timed("state", self.host_state_get)
+        switch.loaded = True
+        return switch
+
+    def pedalboard_change_done(self, switch):
+        if switch is not self.pedalboard_changing:
+            return  # superseded by a later change, or already swapped in
+        if not switch.loaded or switch.prepared is None:
+            return  # still waiting for the other half
+        if switch.prepared.snapshots is None and switch.presets is None:
+            # The bundle has no snapshots, mod-ui has the preset names
+            self.executor.submit(Executor.MODUI, self.pedalboard_presets_host, switch,
+                                 callback=self.pedalboard_change_done, errback=self.pedalboard_change_failed,
+                                 label="Loading", key=Token.PEDALBOARD)
+            return
+        self.pedalboard_changing = None
 
-            resp1 = req.get(self.root_uri + "reset")
-            if resp1.status_code != 200:
-                logging.error("Bad Reset request")
+        # mod-ui has rewritten the modification file, that change is this one
+        if Path(self.pedalboard_modification_file).exists():
+            self.pedalboard_change_timestamp = os.path.getmtime(self.pedalboard_modification_file)
 
-            uri = self.root_uri + "pedalboard/load_bundle/"
-            bundlepath = self.pedalboard_list[self.selected_pedalboard_index].bundle
-            data = {"bundlepath": bundlepath}
-            resp2 = req.post(uri, data)
-            if resp2.status_code != 200:
-                logging.error("Bad Rest request: %s %s  status: %d" % (uri, data, resp2.status_code))
+        # Now that it's presumably changed, swap in the dynamic "current" data
+        self.set_current_pedalboard(switch)
+        self.bot_encoder_mode = BotEncoderMode.DEFAULT
 
-            # Now that it's presumably changed, load the dynamic "current" data
-            self.set_current_pedalboard(self.pedalboard_list[self.selected_pedalboard_index])
-            self.bot_encoder_mode = BotEncoderMode.DEFAULT
+    def pedalboard_change_failed(self, error):
+        self.pedalboard_changing = None
+        self.lcd.draw_info_message("Load failed")
 
     #
     # Preset Stuff
     #
 
     def load_current_presets(self):
-        url = self.root_uri + "snapshot/list"
+        # {index: name} of the host's current pedalboard, empty if mod-ui can't say.  Safe on the executor
+        presets = {}
+        url = "snapshot/list"
         try:
-            resp = req.get(url)
-            if resp.status_code == 200:
-                pass
-        except:
-            return None
-        dict = json.loads(resp.text)
+            resp = self.modui.get(url)
+            if resp.status_code != 200:
+                logging.error("Bad Rest request: %s status: %d" % (url, resp.status_code))
+                return presets
+            dict = json.loads(resp.text)
+        except Exception as e:
+            logging.error("Cannot get presets: %s" % e)
+            return presets
         for key, name in dict.items():
             if key.isdigit():
                 index = int(key)
-                self.current.presets[index] = name
-        return resp.text
+                presets[index] = name
+        return presets
 
     def next_preset_index(self, dict, current, incr):
         # This essentially applies modulo to a set of potentially discontinuous keys
@@ -616,20 +1069,109 @@ class Mod(Handler):
     def preset_change(self):
         index = self.selected_preset_index
         logging.info("preset change: %d" % index)
-        self.lcd.draw_info_message("Loading...")
-        url = (self.root_uri + "snapshot/load?id=%d" % index)
-        # req.get(self.root_uri + "reset")
-        resp = req.get(url)
+        if self.pedalboard_changing is not None:
+            # The index refers to the presets of the pedalboard being replaced
+            logging.info("Pedalboard loading, ignoring preset change")
+            return
+        self.current.preset_index = index
+        snapshot = util.DICT_GET(self.current.snapshots, index) if self.current.snapshots is not None else None
+        if snapshot is not None:
+            # The snapshot's settings are known, show them straight away while the host catches up
+            self.preset_apply_snapshot(snapshot)
+            self.executor.submit(Executor.MODUI, self.preset_load_host, self.current.pedalboard, index,
+                                 snapshot.name if self.verify_presets else None,
+                                 callback=self.preset_load_done, errback=self.preset_load_failed,
+                                 label="Loading", key=Token.PRESET)
+        else:
+            self.lcd.draw_info_message("Loading...")
+            self.executor.submit(Executor.MODUI, self.preset_change_host, self.current.pedalboard, index,
+                                 callback=self.preset_change_done, label="Loading", key=Token.PRESET)
+        self.bot_encoder_mode = BotEncoderMode.DEFAULT
+
+    def preset_apply_snapshot(self, snapshot):
+        # In the same form as the host's state, so only what the snapshot changes gets redrawn
+        state = {}
+        for instance_id, params in snapshot.parameters.items():
+            state["/graph" + instance_id] = dict(params)
+        for instance_id, bypassed in snapshot.bypass.items():
+            state.setdefault("/graph" + instance_id, {})[Token.COLON_BYPASS] = 1.0 if bypassed else 0.0
+        self.host_state_apply(state, redraw_title=True)
+
+    def preset_load_host(self, pedalboard, index, verify_name):
+        # Called on the executor.  Returns (pedalboard, state, ok) for preset_load_done.  state is the host's
+        # plugin values if it can provide them in one request (see host_state_get).  Otherwise ok is False if the
+        # host's snapshot doesn't match the one from the bundle (eg. it was changed in MOD UI but not saved)
+        self.parameter_flush()
+        url = ("snapshot/load?id=%d" % index)
+        resp = self.modui.get(url)
         if resp.status_code != 200:
             logging.error("Bad Rest request: %s status: %d" % (url, resp.status_code))
-        self.current.preset_index = index
+            return pedalboard, None, False
+        if verify_name is None:
+            return pedalboard, None, True
+        state = self.host_state_get()
+        if state is not None:
+            return pedalboard, state, True
+        resp = self.modui.get("snapshot/name?id=%d" % index)
+        if resp.status_code != 200 or util.DICT_GET(resp.json(), Token.NAME) != verify_name:
+            logging.warning("Snapshot %d of %s differs from the bundle's" % (index, pedalboard.title))
+            return pedalboard, None, False
+        return pedalboard, None, True
+
+    def preset_load_done(self, result):
+        pedalboard, state, ok = result
+        if pedalboard is not self.current.pedalboard:
+            return
+        if state is not None:
+            # Corrects (and redraws) whatever differs from the bundle's snapshot
+            self.host_state_apply(state)
+        elif not ok:
+            # Fall back to asking the host for each plugin's state
+            self.current.snapshots = None
+            self.executor.submit(Executor.MODUI, self.preset_query_host, pedalboard,
+                                 callback=self.preset_change_done, key=Token.PRESET)
+
+    def preset_load_failed(self, error):
+        self.preset_load_done((self.current.pedalboard, None, False))
+
+    def preset_change_host(self, pedalboard, index):
+        # Called on the executor, returns (pedalboard, state) for preset_change_done
+        self.parameter_flush()
+        url = ("snapshot/load?id=%d" % index)
+        resp = self.modui.get(url)
+        if resp.status_code != 200:
+            logging.error("Bad Rest request: %s status: %d" % (url, resp.status_code))
+        return self.preset_query_host(pedalboard)
+
+    def preset_query_host(self, pedalboard):
+        # load of the preset might have changed plugin bypass status
+        state = self.host_state_get()
+        if state is not None:
+            return pedalboard, state
+
+        # Without pi_stomp_state, ask for each plugin's bypass, in the same form
+        state = {}
+        for p in pedalboard.plugins:
+            uri = "effect/parameter/pi_stomp_get//graph" + p.instance_id + "/:bypass"
+            try:
+                resp = self.modui.get(uri)
+                if resp.status_code == 200:
+                    state["/graph" + p.instance_id] = {Token.COLON_BYPASS: 1.0 if resp.text == "true" else 0.0}
+            except:
+                logging.error("failed to get bypass value for: %s" % p.instance_id)
+                continue
+        return pedalboard, state
 
-        #load of the preset might have changed plugin bypass status
-        self.preset_change_plugin_update()
-        self.bot_encoder_mode = BotEncoderMode.DEFAULT
+    def preset_change_done(self, result):
+        pedalboard, state = result
+        if pedalboard is not self.current.pedalboard:
+            return
+        if self.current_menu == MenuType.MENU_NONE:
+            self.update_lcd_info_area()  # was showing "Loading..."
+        self.host_state_apply(state, redraw_title=True)
 
     def preset_incr_and_change(self):
-        if self.universal_encoder_mode == UniversalEncoderMode.LOADING:
+        if self.current is None or self.universal_encoder_mode == UniversalEncoderMode.LOADING:
             return
         self.universal_encoder_mode = UniversalEncoderMode.LOADING
         self.preset_select(1)
@@ -637,7 +1179,7 @@ class Mod(Handler):
         self.universal_encoder_mode = UniversalEncoderMode.DEFAULT
 
     def preset_decr_and_change(self):
-        if self.universal_encoder_mode == UniversalEncoderMode.LOADING:
+        if self.current is None or self.universal_encoder_mode == UniversalEncoderMode.LOADING:
             return
         self.universal_encoder_mode = UniversalEncoderMode.LOADING
         self.preset_select(-1)
@@ -645,30 +1187,13 @@ class Mod(Handler):
         self.universal_encoder_mode = UniversalEncoderMode.DEFAULT
 
     def preset_set_and_change(self, index):
-        if self.universal_encoder_mode == UniversalEncoderMode.LOADING:
+        if self.current is None or self.universal_encoder_mode == UniversalEncoderMode.LOADING:
             return
         self.universal_encoder_mode = UniversalEncoderMode.LOADING
         if self.preset_select_index(index):
             self.preset_change()
         self.universal_encoder_mode = UniversalEncoderMode.DEFAULT
 
-    def preset_change_plugin_update(self):
-        # Now that the preset has changed on the host, update plugin bypass indicators
-        for p in self.current.pedalboard.plugins:
-            uri = self.root_uri + "effect/parameter/pi_stomp_get//graph" + p.instance_id + "/:bypass"
-            try:
-                resp = req.get(uri)
-                if resp.status_code == 200:
-                    p.set_bypass(resp.text == "true")
-            except:
-                logging.error("failed to get bypass value for: %s" % p.instance_id)
-                continue
-        self.lcd.draw_tools(SelectedType.WIFI, SelectedType.BYPASS, SelectedType.SYSTEM)
-        self.lcd.draw_analog_assignments(self.current.analog_controllers)
-        self.lcd.draw_plugins(self.current.pedalboard.plugins)
-        self.lcd.draw_bound_plugins(self.current.pedalboard.plugins, self.hardware.footswitches)
-        self.lcd.draw_plugin_select()
-
     #
     # Plugin Stuff
     #
@@ -701,12 +1226,9 @@ class Mod(Handler):
                     if isinstance(c, Footswitch):
                         c.pressed(0)
                         return
-            # Regular (non footswitch plugin)
-            url = self.root_uri + "effect/parameter/pi_stomp_set//graph%s/:bypass" % inst.instance_id
+            # Regular (non footswitch plugin), sent in the background like parameter edits (see parameter_send)
             value = inst.toggle_bypass()
-            code = self.parameter_set_send(url, "1" if value else "0", 200)
-            if (code != 200):
-                inst.toggle_bypass()  # toggle back to original value since request wasn't successful
+            self.parameter_sender.send(inst, Token.COLON_BYPASS, 1.0 if value else 0.0)
 
             #  Indicate change on LCD, and redraw selection(highlight)
             self.update_lcd_plugins()
@@ -808,6 +1330,9 @@ class Mod(Handler):
         self.current_menu = MenuType.MENU_INFO
         self.menu_items = {"0": {Token.NAME: "< Back to main screen", Token.ACTION: self.menu_back}}
         self.menu_items["SW:"] = {Token.NAME: self.git_describe, Token.ACTION: None}
+        # Latency (see kill -USR1 for the details)
+        self.menu_items["Switch:"] = {Token.NAME: Histogram.compact(Histogram.SWITCH), Token.ACTION: None}
+        self.menu_items["Host:"] = {Token.NAME: Histogram.compact(Histogram.MODUI), Token.ACTION: None}
         self.system_info_populate_wifi()
         self.lcd.menu_show("System Info", self.menu_items)
         # See comment in system_menu_show()
@@ -831,13 +1356,19 @@ class Mod(Handler):
 
     def system_menu_save_current_pb(self):
         logging.debug("save current")
+        self.executor.submit(Executor.MODUI, self.pedalboard_save_host, self.current.pedalboard.title,
+                             label="Saving")
+
+    def pedalboard_save_host(self, title):
+        # Called on the executor
+        self.parameter_flush()
         # TODO this works to save the pedalboard values, but just default, not Preset values
         # Figure out how to save preset (host.py:preset_save_replace)
         # TODO this also causes a problem if self.current.pedalboard.title != mod-host title
         # which can happen if the pedalboard is changed via MOD UI, not via hardware
-        url = self.root_uri + "pedalboard/save"
+        url = "pedalboard/save"
         try:
-            resp = req.post(url, data={"asNew": "0", "title": self.current.pedalboard.title})
+            resp = self.modui.post(url, data={"asNew": "0", "title": title})
             if resp.status_code != 200:
                 logging.error("Bad Rest request: %s status: %d" % (url, resp.status_code))
             else:
@@ -888,10 +1419,14 @@ class Mod(Handler):
         self.lcd.draw_info_message(title)
 
     def input_gain_commit(self):
-        self.audiocard.set_parameter(self.audiocard.CAPTURE_VOLUME, self.deep.selected_parameter.value)
+        self.audiocard_set_parameter(self.audiocard.CAPTURE_VOLUME, self.deep.selected_parameter.value)
 
     def headphone_volume_commit(self):
-        self.audiocard.set_parameter(self.audiocard.MASTER, self.deep.selected_parameter.value)
+        self.audiocard_set_parameter(self.audiocard.MASTER, self.deep.selected_parameter.value)
+
+    def audiocard_set_parameter(self, param_name, value):
+        # amixer (and the alsactl store after it) is slow, keyed so encoder spins only apply the latest value
+        self.executor.submit(Executor.AUDIOCARD, self.audiocard.set_parameter, param_name, value, key=param_name)
 
     def system_toggle_bypass(self):
         relay = self.hardware.relay
@@ -962,25 +1497,129 @@ class Mod(Handler):
         self.lcd.draw_value_edit_graph(param, new_value)
 
     def parameter_value_commit(self):
+        # Queued, the LCD shows the new value straight away and the sender catches up (see ParameterSender)
         param = self.deep.selected_parameter
-        url = self.root_uri + "effect/parameter/pi_stomp_set//graph%s/%s" % (self.deep.plugin.instance_id, param.symbol)
-        formatted_value = ("%.1f" % param.value)
-        self.parameter_set_send(url, formatted_value, 200)
+        self.parameter_sender.send(self.deep.plugin, param.symbol, param.value)
+
+    def parameter_send(self, plugin, symbol, value):
+        # Called on the ParameterSender thread
+        if self.parameter_set_websocket(plugin, symbol, value):
+            return
+        url = "effect/parameter/pi_stomp_set//graph%s/%s" % (plugin.instance_id, symbol)
+        formatted_value = ("%.1f" % value)
+        if not self.parameter_set_send(url, formatted_value, 200):
+            # What's shown (eg. a bypass toggle) goes back to what the host has
+            self.host_state_sync()
+
+    def parameter_flush(self):
+        # Make sure edited values have landed before anything which depends on the host's state
+        if self.parameter_sender is not None:
+            self.parameter_sender.flush()
+
+    def parameter_set_websocket(self, plugin, symbol, value):
+        # Send a parameter (or bypass) change over mod-ui's websocket, if enabled.  Returns False if the change
+        # still needs to be sent with a request
+        if not self.parameter_websocket or self.modui_subscriber is None:
+            return False
+        return self.modui_subscriber.parameter_set("/graph" + plugin.instance_id, symbol, value)
 
     def parameter_set_send(self, url, value, expect_code):
-        logging.debug("request: %s" % url)
+        # Returns True if mod-ui accepted the change
+        logging.debug("request: %s value: %s" % (url, value))
         try:
-            resp = None
-            if value is not None:
-                logging.debug("value: %s" % value)
-                resp = req.post(url, json={"value": value})
-            if resp.status_code != expect_code:
-                logging.error("Bad Rest request: %s status: %d" % (url, resp.status_code))
-            else:
-                logging.debug("Parameter changed to: %d" % value)
-        except:
-            logging.debug("status: %s" % resp.status_code)
-            return resp.status_code
+            resp = self.modui.post(url, json={"value": value})
+        except Exception as e:
+            logging.error("Bad Rest request: %s %s" % (url, e))
+            return False
+        if resp.status_code != expect_code:
+            logging.error("Bad Rest request: %s status: %d" % (url, resp.status_code))
+            return False
+        logging.debug("Parameter changed to: %s" % value)
+        return True
+
+    def executor_progress(self):
+        # Long running host commands show how long they've been going
+        progress = self.executor.progress()
+        if self.current_menu != MenuType.MENU_NONE:
+            return
+        if progress is not None and progress[1] >= 1:
+            self.lcd.draw_info_message("%s... %ds" % (progress[0], progress[1]))
+            self.progress_shown = True
+        elif progress is None and self.progress_shown:
+            self.progress_shown = False
+            self.update_lcd_info_area()
+
+    #
+    # Host state
+    #
+
+    def host_state_get(self):
+        # {instance: {symbol: value}} for every plugin on the host's graph (bypass as :bypass), in one request.
+        # None if mod-ui doesn't have the pi_stomp_state mod-tweak (or can't be reached).  Safe on the executor
+        if not self.host_state_supported:
+            return None
+        try:
+            resp = self.modui.get("effect/pi_stomp_state")
+        except Exception as e:
+            logging.error("Cannot get host state: %s" % e)
+            return None
+        if resp.status_code == 404:
+            logging.info("mod-ui has no pi_stomp_state, plugins will be queried one by one")
+            self.host_state_supported = False
+            return None
+        if resp.status_code != 200:
+            logging.error("Bad Rest request: effect/pi_stomp_state status: %d" % resp.status_code)
+            return None
+        return resp.json()
+
+    def host_state_apply(self, state, redraw=True, redraw_title=False):
+        # Bring the current pedalboard's plugins in line with the host's state, then redraw only what changed
+        redraw_plugins = False
+        redraw_fs = False
+        for plugin in self.current.pedalboard.plugins:
+            values = state.get("/graph" + plugin.instance_id)
+            if values is None:
+                continue
+            for symbol, value in values.items():
+                if self.plugin_value_apply(plugin, symbol, value):
+                    redraw_plugins = True
+                    redraw_fs = redraw_fs or plugin.has_footswitch
+        if redraw:
+            self.update_lcd_changes(redraw_title, redraw_plugins, redraw_fs)
+
+    def plugin_value_apply(self, plugin, symbol, value):
+        # Set a value the host has (eg. changed via MOD UI) on plugin, and on the controllers bound to it so a
+        # later edit starts from there.  Returns True if the plugin's bypass changed.
+        param = plugin.parameters.get(symbol)
+        if param is None:
+            return False
+        if symbol == Token.COLON_BYPASS:
+            bypassed = value >= 0.5
+            if bool(plugin.is_bypassed()) == bypassed:
+                return False
+            plugin.set_bypass(bypassed)  # also updates footswitch LEDs
+            return True
+        if param.value != value:
+            param.value = value
+            for c in plugin.controllers:
+                if c.parameter is param:
+                    c.set_value(value)
+        return False
+
+    def host_state_sync(self):
+        # Resync the current pedalboard with the host in the background (eg. after a reconnect)
+        if self.current is not None:
+            self.executor.submit(Executor.MODUI, self.host_state_sync_host, self.current.pedalboard,
+                                 callback=self.host_state_sync_done)
+
+    def host_state_sync_host(self, pedalboard):
+        # Called on the executor
+        return pedalboard, self.host_state_get()
+
+    def host_state_sync_done(self, result):
+        pedalboard, state = result
+        if state is not None and pedalboard is self.current.pedalboard:
+            self.host_state_apply(state)
 
     #
     # LCD Stuff
@@ -1014,7 +1653,24 @@ class Mod(Handler):
     def update_lcd_plugins(self):
         self.lcd.draw_plugins(self.current.pedalboard.plugins)
 
+    def update_lcd_info_area(self):
+        # Restore what draw_info_message covers (the toolbar, or the analog assignments on mono LCDs)
+        self.lcd.draw_tools(SelectedType.WIFI, SelectedType.BYPASS, SelectedType.SYSTEM)
+        self.lcd.draw_analog_assignments(self.current.analog_controllers)
+
+    def update_lcd_changes(self, redraw_title, redraw_plugins, redraw_fs):
+        if self.current_menu != MenuType.MENU_NONE:
+            return  # the model is up to date, the home screen gets drawn when the menu closes
+        if redraw_title:
+            self.update_lcd_title()
+        if redraw_plugins:
+            self.update_lcd_plugins()
+        if redraw_fs:
+            self.update_lcd_fs()
+
     def update_lcd_fs(self, bypass_change=False):
         if bypass_change:
             self.lcd.update_bypass(self.hardware.relay.enabled)
+        if self.current is None:
+            return
         self.lcd.draw_bound_plugins(self.current.pedalboard.plugins, self.hardware.footswitches)
@@ -0,0 +1,196 @@
+# This file is part of pi-stomp.
+#
+# pi-stomp is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pi-stomp is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pi-stomp.  If not, see <https://www.gnu.org/licenses/>.
+
+import logging
+import requests
+import threading
+import time
+
+from requests.adapters import HTTPAdapter
+
+import common.histogram as Histogram
+
+ROOT_URI = "http://localhost:80/"
+
+# mod-ui is local, so failing to connect at all should be quick
+CONNECT_TIMEOUT = 1.0
+
+# Read timeouts (seconds) by endpoint prefix, the longest matching prefix applies
+TIMEOUTS = {
+    "": 5.0,
+    "effect/get": 10.0,
+    "effect/parameter/": 1.0,
+    "pedalboard/list": 10.0,
+    "pedalboard/load_bundle/": 30.0,
+    "pedalboard/save": 10.0,
+    "reset": 10.0,
+    "snapshot/list": 2.0,
+    "snapshot/load": 10.0,
+}
+
+# Enough connections for the concurrent plugin data fetches (see Pedalboard.FETCH_WORKERS) plus the main loop
+POOL_SIZE = 10
+
+# Cheap request which tells whether mod-ui is up, any HTTP answer will do (see ModUi.probe)
+PROBE_PATH = "ping"
+PROBE_TIMEOUT = 2.0
+
+# Consecutive connection failures after which requests fail straight away (see CircuitBreaker)
+FAILURE_THRESHOLD = 3
+
+
+class ModUiUnavailable(requests.exceptions.ConnectionError):
+    # Raised instead of trying to connect while the circuit breaker is open
+    pass
+
+
+class CircuitBreaker:
+
+    # Stops requests being sent to a mod-ui which isn't there, so each one fails immediately instead of after
+    # its connect timeout.  Opens after threshold consecutive connection failures, closes again on success
+    # (ie. when ConnectionManager's probing finds mod-ui back)
+    def __init__(self, threshold=FAILURE_THRESHOLD):
+        self.threshold = threshold
+        self.failures = 0
+        self.cond = threading.Condition()
+
+    def is_open(self):
+        return self.failures >= self.threshold
+
+    def failure(self):
+        with self.cond:
+            self.failures += 1
+            if self.failures == self.threshold:
+                logging.error("mod-ui unreachable, suspending requests")
+                self.cond.notify_all()
+
+    def success(self):
+        with self.cond:
+            self.failures = 0
+
+    def trip(self):
+        with self.cond:
+            self.failures = max(self.failures, self.threshold)
+            self.cond.notify_all()
+
+    def wait_open(self, timeout=None):
+        # Block until the breaker opens (or timeout), returns whether it is open
+        with self.cond:
+            return self.cond.wait_for(self.is_open, timeout)
+
+
+class Latency:
+
+    # Running latency figures (seconds) for calls to one endpoint
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+
+    def add(self, seconds, error=False):
+        self.count += 1
+        if error:
+            self.errors += 1
+        self.total += seconds
+        self.last = seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def mean(self):
+        return self.total / self.count if self.count > 0 else 0.0
+
+
+class ModUi:
+
+    # Client for the mod-ui REST API
+    #
+    # All requests go through one requests.Session, so connections to mod-ui are kept alive and reused instead
+    # of being set up for every parameter change.  Each request gets the timeout for its endpoint and its
+    # latency is recorded (see latency).  Requests raise the usual requests exceptions on failure.
+    def __init__(self, root_uri=ROOT_URI):
+        self.root_uri = root_uri
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+        self.session.mount(root_uri, adapter)
+        self.lock = threading.Lock()
+        self.latency = {}  # endpoint prefix: Latency
+        self.breaker = CircuitBreaker()
+
+    def endpoint(self, path):
+        return max((p for p in TIMEOUTS if path.startswith(p)), key=len)
+
+    def request(self, method, path, **kwargs):
+        if self.breaker.is_open():
+            raise ModUiUnavailable("mod-ui unavailable: %s" % path)
+        endpoint = self.endpoint(path)
+        kwargs.setdefault('timeout', (CONNECT_TIMEOUT, TIMEOUTS[endpoint]))
+        start = time.monotonic()
+        error = True
+        try:
+            resp = self.session.request(method, self.root_uri + path, **kwargs)
+            error = resp.status_code >= 400
+            self.breaker.success()
+            return resp
+        except requests.exceptions.ConnectionError:
+            self.breaker.failure()
+            raise
+        finally:
+            elapsed = time.monotonic() - start
+            with self.lock:
+                if endpoint not in self.latency:
+                    self.latency[endpoint] = Latency()
+                self.latency[endpoint].add(elapsed, error)
+            Histogram.get(Histogram.MODUI).add(elapsed)
+            logging.debug("mod-ui %s %s: %.1fms" % (method, path, elapsed * 1000))
+
+    def get(self, path, **kwargs):
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path, data=None, json=None, **kwargs):
+        return self.request("POST", path, data=data, json=json, **kwargs)
+
+    def probe(self):
+        # True if mod-ui answers, bypassing (and if it does, closing) the circuit breaker
+        try:
+            resp = self.session.get(self.root_uri + PROBE_PATH, timeout=(CONNECT_TIMEOUT, PROBE_TIMEOUT))
+        except requests.exceptions.RequestException as e:
+            logging.debug("mod-ui probe: %s" % e)
+            return False
+        if resp.status_code >= 500:
+            return False
+        self.breaker.success()
+        return True
+
+    def latency_summary(self):
+        # One line per endpoint, slowest (by mean) first
+        with self.lock:
+            items = sorted(self.latency.items(), key=lambda i: i[1].mean(), reverse=True)
+            return ["%s: n=%d err=%d mean=%.1fms max=%.1fms" %
+                    (endpoint or "/", l.count, l.errors, l.mean() * 1000, l.max * 1000) for endpoint, l in items]
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    # The shared client, so everything uses the same connection pool
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = ModUi()
+        return _client
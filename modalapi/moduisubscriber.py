@@ -0,0 +1,140 @@
+# This file is part of pi-stomp.
+#
+# pi-stomp is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pi-stomp is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pi-stomp.  If not, see <https://www.gnu.org/licenses/>.
+
+import logging
+import queue
+import threading
+
+import common.eventloop as EventLoop
+import common.realtime as Realtime
+import modalapi.websocketclient as WebSocketClient
+
+WS_URI = "ws://localhost:80/websocket"
+
+# Reconnect delays (seconds), doubling while mod-ui is unreachable
+RETRY_MIN = 1.0
+RETRY_MAX = 30.0
+
+# Events, as tuples with the event type first
+PARAM_SET = "param_set"            # (PARAM_SET, instance, symbol, value), bypass uses the :bypass symbol
+SNAPSHOT = "pedal_snapshot"        # (SNAPSHOT, index, name)
+LOADED = "loading_end"             # (LOADED,) a pedalboard has been (re)loaded
+
+
+class ModUiSubscriber:
+
+    # Follows mod-ui's websocket feed (the one its web pages use) so changes made in the browser reach pi-stomp
+    #
+    # Messages are read on a background thread, which blocks while nothing happens.  The ones pi-stomp cares about
+    # are turned into events and queued, poll() (called from the main loop) returns them.
+    # While a pedalboard is loading, mod-ui reports its whole state, those messages are dropped in favour of
+    # a single LOADED event.
+    def __init__(self, url=WS_URI):
+        self.url = url
+        self.events = queue.Queue()
+        self.stop = threading.Event()
+        self.connected = False
+        self.loading = False
+        self.ws = None
+        self.thread = threading.Thread(target=self._subscriber_thread, daemon=True)
+        self.thread.start()
+
+    def __del__(self):
+        logging.info("mod-ui subscriber cleanup")
+        self.stop.set()
+        if self.ws is not None:
+            self.ws.close()
+
+    def _subscriber_thread(self):
+        Realtime.apply(Realtime.HOST)
+        delay = RETRY_MIN
+        while not self.stop.is_set():
+            self.ws = WebSocketClient.WebSocketClient(self.url)
+            try:
+                self.ws.connect()
+                logging.info("Subscribed to mod-ui changes")
+                self.connected = True
+                delay = RETRY_MIN
+                while not self.stop.is_set():
+                    message = self.ws.recv()
+                    if message is None:
+                        break
+                    self._dispatch(message)
+            except (OSError, WebSocketClient.WebSocketError) as e:
+                logging.debug("mod-ui websocket: %s" % e)
+            if self.connected:
+                logging.info("mod-ui websocket disconnected")
+            self.connected = False
+            self.loading = False
+            self.ws.close()
+            self.stop.wait(delay)
+            delay = min(delay * 2, RETRY_MAX)
+
+    def _queue(self, event):
+        self.events.put(event)
+        EventLoop.wakeup()
+
+    def _dispatch(self, message):
+        args = message.split(" ")
+        cmd = args[0]
+
+        # mod-ui waits for its clients to keep up, so these need answering
+        if cmd == "ping":
+            self.ws.send("pong")
+        elif cmd == "data_ready":
+            self.ws.send(message)
+
+        elif cmd == "loading_start":
+            self.loading = True
+        elif cmd == "loading_end":
+            self.loading = False
+            self._queue((LOADED,))
+        elif self.loading:
+            return
+        elif cmd == "param_set" and len(args) >= 4:
+            try:
+                self._queue((PARAM_SET, args[1], args[2], float(args[3])))
+            except ValueError:
+                pass
+        elif cmd == "pedal_snapshot" and len(args) >= 2:
+            try:
+                self._queue((SNAPSHOT, int(args[1]), " ".join(args[2:])))
+            except ValueError:
+                pass
+
+    # External API
+    def parameter_set(self, instance, symbol, value):
+        # Set a parameter (or bypass, as the :bypass symbol) the way MOD UI's own controls do, with a websocket
+        # message rather than a request.  mod-ui passes it on to mod-host over its own connection and tells its
+        # other clients (not this one).  Returns False if not connected.  Safe from any thread.
+        ws = self.ws
+        if not self.connected or ws is None:
+            return False
+        try:
+            ws.send("param_set %s/%s %f" % (instance, symbol, value))
+        except (OSError, WebSocketClient.WebSocketError) as e:
+            logging.debug("mod-ui websocket send failed: %s" % e)
+            return False
+        return True
+
+    def poll(self):
+        if self.events.empty():
+            return None
+        events = []
+        while True:
+            try:
+                events.append(self.events.get_nowait())
+            except queue.Empty:
+                return events
@@ -0,0 +1,86 @@
+# This file is part of pi-stomp.
+#
+# pi-stomp is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pi-stomp is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pi-stomp.  If not, see <https://www.gnu.org/licenses/>.
+
+import logging
+import threading
+import time
+
+import common.realtime as Realtime
+
+DEFAULT_RATE = 30  # parameter changes sent per second
+
+
+class ParameterSender:
+
+    # Sends parameter changes on a background thread so the main loop never waits for the host
+    #
+    # Changes are kept in an outbox keyed by (instance_id, symbol), a newer value replaces one which hasn't been
+    # sent yet, so spinning an encoder only ever sends the latest value.  Sends are limited to rate per second.
+    # @a send_fn(plugin, symbol, value) does the actual sending (and its own error handling).
+    def __init__(self, send_fn, rate=DEFAULT_RATE):
+        self.send_fn = send_fn
+        self.interval = 1.0 / rate if rate > 0 else 0
+        self.cond = threading.Condition()
+        self.outbox = {}  # (instance_id, symbol): (plugin, value)
+        self.sending = False
+        self.thread = threading.Thread(target=self._sender_thread, daemon=True)
+        self.thread.start()
+
+    def _sender_thread(self):
+        Realtime.apply(Realtime.HOST)
+        last = 0
+        while True:
+            with self.cond:
+                while len(self.outbox) == 0:
+                    self.cond.wait()
+                # oldest key first, so one busy parameter can't starve the others
+                key = next(iter(self.outbox))
+                plugin, value = self.outbox.pop(key)
+                self.sending = True
+
+            wait = last + self.interval - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+                with self.cond:
+                    # a newer value may have arrived meanwhile, send that instead
+                    if key in self.outbox:
+                        plugin, value = self.outbox.pop(key)
+            last = time.monotonic()
+            try:
+                self.send_fn(plugin, key[1], value)
+            except Exception as e:
+                logging.error("Failed to send %s %s: %s" % (key[0], key[1], e))
+
+            with self.cond:
+                self.sending = False
+                self.cond.notify_all()
+
+    # External API
+    def send(self, plugin, symbol, value):
+        with self.cond:
+            self.outbox[(plugin.instance_id, symbol)] = (plugin, value)
+            self.cond.notify_all()
+
+    def flush(self, timeout=2.0):
+        # Wait until everything queued has been sent, returns False on timeout
+        deadline = time.monotonic() + timeout
+        with self.cond:
+            while len(self.outbox) > 0 or self.sending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    logging.warning("Timed out flushing %d parameter changes" % len(self.outbox))
+                    return False
+                self.cond.wait(remaining)
+        return True
@@ -14,240 +14,220 @@
 # along with pi-stomp.  If not, see <https://www.gnu.org/licenses/>.
 
 import json
-import lilv
 import logging
-import operator
-import os
-import requests as req
-import sys
+import multiprocessing
+import requests
 import urllib.parse
 
+import common.realtime as Realtime
 import common.token as Token
 import common.util as util
+import modalapi.graph as Graph
+import modalapi.lilvworld as LilvWorld
+import modalapi.modui as ModUi
 import modalapi.parameter as Parameter
 import modalapi.plugin as Plugin
+import modalapi.plugincache as PluginCache
+import modalapi.ttlreader as TtlReader
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+# Maximum number of concurrent plugin data requests to mod-ui
+FETCH_WORKERS = 8
+
+# Bundle parser, Token.LILV or Token.TURTLE (the lightweight TtlReader)
+parser = Token.LILV
+
+
+def set_parser(name):
+    global parser
+    if name not in (Token.LILV, Token.TURTLE):
+        logging.error("Unknown pedalboard parser: %s, using %s" % (name, Token.LILV))
+        name = Token.LILV
+    parser = name
+
+
+def parse_bundle(bundlepath):
+    # Either parser returns the same plain data (see LilvWorld.parse_pedalboard)
+    if parser == Token.TURTLE:
+        return TtlReader.parse_pedalboard(bundlepath)
+    return LilvWorld.get_world().parse_pedalboard(bundlepath)
+
+
+def get_plugin_data(uri):
+    url = "effect/get?uri=" + urllib.parse.quote(uri)
+    try:
+        resp = ModUi.get_client().get(url, headers={'Cache-Control': 'no-cache', 'Pragma': 'no-cache'})
+    except requests.exceptions.RequestException:
+        # Fails the load, which is retried once mod-ui is available (see Mod.host_ready)
+        logging.error("Cannot connect to mod-host.")
+        raise
+
+    if resp.status_code != 200:
+        logging.error("mod-host not able to get plugin data: %s\nStatus: %s" % (url, resp.status_code))
+        return {}
+        #sys.exit()
+
+    return PluginCache.compact_plugin_info(json.loads(resp.text))
+
+
+def get_prototypes(data):
+    # The set of plugin URIs used by the blocks of a parsed bundle
+    return set(b[Token.PROTOTYPE] for b in data[Token.BLOCKS] if b[Token.PROTOTYPE] is not None)
+
+
+def fetch_plugin_data(uris, plugin_dict):
+    # Fetch data for all plugins not already in plugin_dict as one concurrent batch
+    missing = sorted(uri for uri in uris if uri not in plugin_dict)
+    if len(missing) == 0:
+        return
+    logging.info("Fetching data for %d plugins" % len(missing))
+    # The workers would otherwise inherit the scheduling of the caller, which may be the main loop's
+    with ThreadPoolExecutor(max_workers=min(FETCH_WORKERS, len(missing)), initializer=Realtime.apply,
+                            initargs=(Realtime.BACKGROUND,)) as pool:
+        for uri, plugin_info in zip(missing, pool.map(get_plugin_data, missing)):
+            if plugin_info:
+                logging.debug("added %s" % uri)
+                plugin_dict[uri] = plugin_info
+
 
 class Pedalboard:
 
     def __init__(self, title, bundle):
-        self.root_uri = "http://localhost:80/"
+        self.root_uri = ModUi.ROOT_URI
         self.title = title
         self.bundle = bundle  # TODO used?
         self.plugins = []
-
-        self.world = lilv.World()
-
-        # this is needed when loading specific bundles instead of load_all
-        # (these functions are not exposed via World yet)
-        self.world.load_specifications()
-        self.world.load_plugin_classes()
-
-        self.uri_block = self.world.new_uri("http://drobilla.net/ns/ingen#block")
-        self.uri_head  = self.world.new_uri("http://drobilla.net/ns/ingen#head")
-        self.uri_port  = self.world.new_uri("http://lv2plug.in/ns/lv2core#port")
-        self.uri_tail  = self.world.new_uri("http://drobilla.net/ns/ingen#tail")
-        self.uri_value = self.world.new_uri("http://drobilla.net/ns/ingen#value")
-
-    def get_pedalboard_plugin(self, world, bundlepath):
-        # lilv wants the last character as the separator
-        bundle = os.path.abspath(bundlepath)
-        if not bundle.endswith(os.sep):
-            bundle += os.sep
-        # convert bundle string into a lilv node
-        bundlenode = self.world.new_file_uri(None, bundle)
-
-        # load the bundle
-        self.world.load_bundle(bundlenode)
-
-        # free bundlenode, no longer needed
-        #self.world.node_free(bundlenode)  # TODO find out why this is no longer necessary (why did API method go away)
-
-        # get all plugins in the bundle
-        ps = self.world.get_all_plugins()
-
-        # make sure the bundle includes 1 and only 1 plugin (the pedalboard)
-        if len(ps) != 1:
-            raise Exception('get_pedalboard_info(%s) - bundle has 0 or > 1 plugin'.format(bundle))
-
-        # no indexing in python-lilv yet, just get the first item
-        plugin = None
-        for p in ps:
-            plugin = p
-            break
-
-        if plugin is None:
-            raise Exception('get_pedalboard_plugin(%s)'.format(bundle))
-
-        return plugin
-
-    def get_plugin_data(self, uri):
-        url = self.root_uri + "effect/get?uri=" + urllib.parse.quote(uri)
-        try:
-            resp = req.get(url, headers={'Cache-Control': 'no-cache', 'Pragma': 'no-cache'})
-        except:  # TODO
-            logging.error("Cannot connect to mod-host.")
-            sys.exit()
-
-        if resp.status_code != 200:
-            logging.error("mod-host not able to get plugin data: %s\nStatus: %s" % (url, resp.status_code))
-            return {}
-            #sys.exit()
-
-        return json.loads(resp.text)
-
-    def chase_tail(self, block, conn):
-        if block is None:
-            return
-        conn.append(block)
-
-        ports = self.world.find_nodes(block, self.uri_port, None)
-        for port in ports:
-            tail = self.world.get(None, self.uri_tail, port)
-            if tail is None:
-                continue
-            head = self.world.get(tail, self.uri_head, None)
-            if head is not None:
-                block = self.world.get(None, self.uri_port, head)
-                if block is not None and block not in conn:
-                    self.chase_tail(block, conn)
-            break
-        return conn
+        self.loaded = False  # False for a title-only stub which hasn't had its bundle parsed yet
+        self.plugin_uris = set()  # plugins used, set once loaded
+        self.complete = True  # False if it was built without the data of some of its plugins
 
     # Get info from an lv2 bundle
     # @a bundle is a string, consisting of a directory in the filesystem (absolute pathname).
     def load_bundle(self, bundlepath, plugin_dict):
-        # Load the bundle, return the single plugin for the pedalboard
-        plugin = self.get_pedalboard_plugin(self.world, bundlepath)
-
-        # check if the plugin is a pedalboard
-        def fill_in_type(node):
-            if node is not None and node.is_uri():
-                return node
-            return None
-
-        u = self.world.new_uri("http://www.w3.org/1999/02/22-rdf-syntax-ns#type")
-        plugin_types = [i for i in util.LILV_FOREACH(plugin.get_value(u), fill_in_type)]
-        if "http://moddevices.com/ns/modpedal#Pedalboard" not in plugin_types:
-            raise Exception('get_pedalboard_info(%s) - plugin has no mod:Pedalboard type'.format(bundlepath))
-
-        # Walk ports starting from capture1 to determine general plugin order
-        # TODO can this be generalized to use the chase_tail function?
-        plugin_order = []
-        ports = plugin.get_value(self.uri_port)
-        for port in ports:
-            if port is None:
-                continue
-            tail = self.world.get(None, self.uri_tail, port)   # TODO could end up being capture2
-            if tail is None:
-                continue
-            head = self.world.get(tail, self.uri_head, None)
-            if head is not None:
-                block = self.world.get(None, self.uri_port, head)
-                if block is not None:
-                    self.chase_tail(block, plugin_order)
-            break
-
+        # Parse the bundle, only plain data comes back
+        data = parse_bundle(bundlepath)
+        fetch_plugin_data(get_prototypes(data), plugin_dict)
+        self.build_plugins(data, plugin_dict)
+
+    # Create the Plugin/Parameter objects from parsed bundle data
+    # Plugin data is expected to have been fetched into plugin_dict already (see fetch_plugin_data)
+    def build_plugins(self, data, plugin_dict):
         # Iterate blocks (plugins)
         plugins_unordered = {}
-        plugins_extra = []
-        blocks = plugin.get_value(self.uri_block)
-        for block in blocks:
-            if block is None or block.is_blank():
-                continue
-
-            # Add plugin data (from plugin registry) to global plugin dictionary
+        plugin_uris = get_prototypes(data)
+        complete = True
+        for block in data[Token.BLOCKS]:
+            # Plugin data (from plugin registry)
             plugin_info = {}
             category = None
-            prototype = self.world.find_nodes(block, self.world.ns.lv2.prototype, None)
-            if len(prototype) > 0:
-                #logging.debug("prototype %s" % prototype[0])
-                plugin_uri = str(prototype[0])  # plugin.get_uri()
-                if plugin_uri not in plugin_dict:
-                    plugin_info = self.get_plugin_data(plugin_uri)
-                    if plugin_info:
-                        logging.debug("added %s" % plugin_uri)
-                        plugin_dict[plugin_uri] = plugin_info
-                else:
-                    plugin_info = plugin_dict[plugin_uri]
-                if plugin_info is not None:
-                    cat = util.DICT_GET(plugin_info, Token.CATEGORY)
-                    if cat is not None and len(cat) > 0:
-                        category = cat[0]
+            plugin_uri = block[Token.PROTOTYPE]
+            if plugin_uri is not None:
+                plugin_info = plugin_dict.get(plugin_uri, {})
+                if not plugin_info:
+                    complete = False  # eg. mod-ui couldn't provide it this time
+                cat = util.DICT_GET(plugin_info, Token.CATEGORY)
+                if cat is not None and len(cat) > 0:
+                    category = cat[0]
 
             # Extract Parameter data
-            instance_id = str(block.get_path()).replace(bundlepath, "", 1)
-            nodes = self.world.find_nodes(block, self.world.ns.lv2.port, None)
+            instance_id = block[Token.INSTANCE_ID]
             parameters = {}
-            if len(nodes) > 0:
-                # These are the port nodes used to define parameter controls
-                for port in nodes:
-                    param_value = self.world.get(port, self.uri_value, None)
-                    #logging.debug("port: %s  value: %s" % (port, param_value))
-                    binding = self.world.get(port, self.world.ns.midi.binding, None)
-                    if binding is not None:
-                        controller_num = self.world.get(binding, self.world.ns.midi.controllerNumber, None)
-                        channel = self.world.get(binding, self.world.ns.midi.channel, None)
-                        if (controller_num is not None) and (channel is not None):
-                            binding = "%d:%d" % (self.world.new_int(channel), self.world.new_int(controller_num))
-                            logging.debug("  MIDI CC binding %s" % binding)
-                    path = str(port)
-                    symbol = os.path.basename(path)
-                    value = None
-                    if param_value is not None:
-                        if param_value.is_float():
-                            value = float(self.world.new_float(param_value))
-                        elif param_value.is_int():
-                            value = int(self.world.new_int(param_value))
-                        else:
-                            value = str(value)
-                    # Bypass "parameter" is a special case without an entry in the plugin definition
-                    if symbol == Token.COLON_BYPASS:
-                        info = {"shortName": "bypass", "symbol": symbol, "ranges": {"minimum": 0, "maximum": 1}}  # TODO tokenize
-                        v = False if value is 0 else True
-                        param = Parameter.Parameter(info, v, binding)
-                        parameters[symbol] = param
-                        continue  # don't try to find matching symbol in plugin_dict
-                    # Try to find a matching symbol in plugin_dict to obtain the remaining param details
-                    try:
-                        plugin_params = plugin_info[Token.PORTS][Token.CONTROL][Token.INPUT]
-                    except KeyError:
-                        logging.warning("plugin port info not found, could be missing LV2 for: %s", instance_id)
-                        continue
-                    for pp in plugin_params:
-                        sym = util.DICT_GET(pp, Token.SYMBOL)
-                        if sym == symbol:
-                            #logging.debug("PARAM: %s %s %s" % (util.DICT_GET(pp, 'name'), info[uri], category))
-                            param = Parameter.Parameter(pp, value, binding)
-                            #logging.debug("Param: %s %s %4.2f %4.2f %s" % (param.name, param.symbol, param.minimum, value, binding))
-                            parameters[symbol] = param
-
-                    #logging.debug("  Label: %s" % label)
+            # symbol: port spec index, built once per plugin URI when the plugin data was fetched
+            port_index = util.DICT_GET(plugin_info, Token.CONTROL_INPUTS)
+            if port_index is None:
+                logging.warning("plugin port info not found, could be missing LV2 for: %s", instance_id)
+                port_index = {}
+            for port in block[Token.PORTS]:
+                symbol = port[Token.SYMBOL]
+                value = port[Token.VALUE]
+                binding = port[Token.BINDING]
+                # Bypass "parameter" is a special case without an entry in the plugin definition
+                if symbol == Token.COLON_BYPASS:
+                    info = {"shortName": "bypass", "symbol": symbol, "ranges": {"minimum": 0, "maximum": 1}}  # TODO tokenize
+                    v = False if value == 0 else True
+                    param = Parameter.Parameter(info, v, binding)
+                    parameters[symbol] = param
+                    continue  # don't try to find matching symbol in plugin_dict
+                # Look up the matching symbol in the plugin data to obtain the remaining param details
+                pp = port_index.get(symbol)
+                if pp is not None:
+                    param = Parameter.Parameter(pp, value, binding)
+                    #logging.debug("Param: %s %s %4.2f %4.2f %s" % (param.name, param.symbol, param.minimum, value, binding))
+                    parameters[symbol] = param
+                elif value is not None and len(port_index) > 0:
+                    # Only control ports have values (audio/midi ports are expected to be missing from the index)
+                    logging.warning("%s: unknown parameter symbol: %s" % (instance_id, symbol))
+
             inst = Plugin.Plugin(instance_id, parameters, plugin_info, category)
 
-            try:
-                index = plugin_order.index(block)
-                plugins_unordered[index] = inst
-            except:
-                plugins_extra.append(inst)
+            plugins_unordered[instance_id] = inst
             #logging.debug("dump: %s" % inst.to_json())
 
-        # Add "extra" plugins (those not part of the tail_chase order) to the plugins_unordered dict
-        max_index = len(plugins_unordered)
-        for e in plugins_extra:
-            plugins_unordered[max_index] = e
-            max_index = max_index + 1
-
-        # Sort the dictionary based on their order index and add to the pedalboard.plugin list
-        # TODO improve the creation (tail chasing, sorting, dict>list conversion)
-        if max_index > 0:
-            sorted_dict = dict(sorted(plugins_unordered.items(), key=operator.itemgetter(0)))
-            for i in range(0, len(sorted_dict)):
-                val = sorted_dict.get(i)
-                if val is not None:
-                    self.plugins.append(val)
+        # Order plugins by signal flow (see Graph), keeping the graph position for display
+        graph = Graph.Graph(plugins_unordered.keys(), data[Token.ARCS])
+        plugins = []
+        for instance_id in graph.order:
+            inst = plugins_unordered[instance_id]
+            inst.depth = graph.depth[instance_id]
+            inst.branch = graph.branch[instance_id]
+            plugins.append(inst)
+
+        # Assign only once complete since stubs may be resolved from a background thread
+        self.plugins = plugins
+        self.plugin_uris = plugin_uris
+        self.complete = complete
+        self.loaded = True
 
         # Done obtaining relevant lilv for the pedalboard
         return
 
     def to_json(self):
         return json.dumps(self, default=lambda o: o.__dict__, sort_keys=True, indent=4)
+
+
+#
+# Bulk loading
+#
+# Bundles are parsed first (optionally in a pool of worker processes, each with its own lilv world when lilv is
+# the parser), then the plugin data for every plugin they use is fetched as a single concurrent batch, and only
+# then are the Pedalboard objects built.
+#
+# Worker processes come from a forkserver rather than being forked from here: this process has threads running
+# (and possibly holding locks, eg. logging's or the lilv world's) which a forked child would inherit mid-flight.
+# They get the background role's CPU affinity and scheduling, not that of whichever thread created them.
+#
+
+def _init_worker(parser_name, sched_settings):
+    set_parser(parser_name)
+    Realtime.configure(sched_settings)
+    Realtime.apply(Realtime.BACKGROUND)
+
+
+def load_bundles(title_bundles, plugin_dict, workers=0):
+    # Parse a list of (title, bundle) tuples, returning the Pedalboards in the same order
+    bundles = [bundle for _, bundle in title_bundles]
+    workers = min(workers, len(Realtime.cpus(Realtime.BACKGROUND)), len(title_bundles))
+    if workers < 2:
+        datas = []
+        for title, bundle in title_bundles:
+            logging.info("Loading pedalboard info: %s" % title)
+            datas.append(parse_bundle(bundle))
+    else:
+        logging.info("Loading info for %d pedalboards using %d processes" % (len(title_bundles), workers))
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("forkserver"),
+                                 initializer=_init_worker, initargs=(parser, Realtime.settings())) as pool:
+            # map() yields results in submission order so the pedalboard order stays deterministic
+            datas = list(pool.map(parse_bundle, bundles))
+
+    uris = set()
+    for data in datas:
+        uris |= get_prototypes(data)
+    fetch_plugin_data(uris, plugin_dict)
+
+    pedalboards = []
+    for (title, bundle), data in zip(title_bundles, datas):
+        pedalboard = Pedalboard(title, bundle)
+        pedalboard.build_plugins(data, plugin_dict)
+        pedalboards.append(pedalboard)
+    return pedalboards
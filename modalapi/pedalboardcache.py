@@ -0,0 +1,192 @@
+# This file is part of pi-stomp.
+#
+# pi-stomp is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pi-stomp is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pi-stomp.  If not, see <https://www.gnu.org/licenses/>.
+
+import json
+import logging
+import os
+
+import common.token as Token
+import modalapi.parameter as Parameter
+import modalapi.pedalboard as Pedalboard
+import modalapi.plugin as Plugin
+import modalapi.plugincache as PluginCache
+
+# Bump this whenever the serialized layout changes so stale indexes get discarded
+CACHE_VERSION = 3
+
+
+def bundle_mtimes(bundle):
+    # The cache key for a bundle is the set of its TTL files and their modification times
+    mtimes = {}
+    try:
+        for entry in os.scandir(bundle):
+            if entry.is_file() and entry.name.endswith(".ttl"):
+                mtimes[entry.name] = entry.stat().st_mtime
+    except OSError:
+        return None
+    return mtimes
+
+
+def manifest_mtimes(uris, plugin_dict):
+    # The manifest files and modification times of the plugins used by a pedalboard, so the entry is dropped when
+    # any of them is upgraded (port ranges or symbols may have changed).  None if any can't be determined.
+    mtimes = {}
+    for uri in uris:
+        info = plugin_dict.get(uri)
+        if not info:
+            return None
+        manifest = PluginCache.manifest_file(info)
+        mtime = PluginCache.manifest_mtime(info)
+        if mtime is None:
+            return None
+        mtimes[manifest] = mtime
+    return mtimes
+
+
+def manifests_unchanged(mtimes):
+    for manifest, mtime in mtimes.items():
+        try:
+            if os.path.getmtime(manifest) != mtime:
+                return False
+        except OSError:
+            return False
+    return True
+
+
+def parameter_to_dict(param):
+    return {Token.NAME: param.name,
+            Token.SYMBOL: param.symbol,
+            Token.MINIMUM: param.minimum,
+            Token.MAXIMUM: param.maximum,
+            Token.VALUE: param.value,
+            Token.BINDING: param.binding}
+
+
+def parameter_from_dict(d):
+    info = {Token.SHORTNAME: d[Token.NAME],
+            Token.SYMBOL: d[Token.SYMBOL],
+            Token.RANGES: {Token.MINIMUM: d[Token.MINIMUM], Token.MAXIMUM: d[Token.MAXIMUM]}}
+    return Parameter.Parameter(info, d[Token.VALUE], d[Token.BINDING])
+
+
+def plugin_to_dict(plugin):
+    return {Token.INSTANCE_ID: plugin.instance_id,
+            Token.CATEGORY: plugin.category,
+            Token.DEPTH: plugin.depth,
+            Token.BRANCH: plugin.branch,
+            Token.PARAMETERS: [parameter_to_dict(p) for p in plugin.parameters.values()]}
+
+
+def plugin_from_dict(d):
+    parameters = {}
+    for p in d[Token.PARAMETERS]:
+        param = parameter_from_dict(p)
+        parameters[param.symbol] = param
+    plugin = Plugin.Plugin(d[Token.INSTANCE_ID], parameters, None, d[Token.CATEGORY])
+    plugin.depth = d[Token.DEPTH]
+    plugin.branch = d[Token.BRANCH]
+    return plugin
+
+
+def pedalboard_to_dict(pedalboard):
+    return {Token.TITLE: pedalboard.title,
+            Token.BUNDLE: pedalboard.bundle,
+            Token.PLUGINS: [plugin_to_dict(p) for p in pedalboard.plugins]}
+
+
+def pedalboard_from_dict(d):
+    pedalboard = Pedalboard.Pedalboard(d[Token.TITLE], d[Token.BUNDLE])
+    pedalboard.plugins = [plugin_from_dict(p) for p in d[Token.PLUGINS]]
+    pedalboard.loaded = True
+    return pedalboard
+
+
+# Persistent index of parsed pedalboards
+# Each entry holds the serialized pedalboard (ordered plugins and their parameters) along with the
+# modification times of the bundle's TTL files and of its plugins' manifests.  An entry is only used if those
+# times still match.
+class PedalboardCache:
+
+    def __init__(self, cache_file):
+        self.cache_file = cache_file
+        self.entries = {}  # bundle: {mtimes: {file: mtime}, manifests: {file: mtime}, pedalboard: {...}}
+        self.dirty = False
+        self.load()
+
+    def load(self):
+        if not os.path.isfile(self.cache_file):
+            return
+        try:
+            with open(self.cache_file, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning("Ignoring unreadable pedalboard cache %s: %s" % (self.cache_file, e))
+            return
+        if data.get(Token.VERSION) != CACHE_VERSION:
+            logging.info("Pedalboard cache version changed, rebuilding")
+            return
+        self.entries = data.get(Token.PEDALBOARDS, {})
+
+    def save(self):
+        if not self.dirty:
+            return
+        tmp_file = self.cache_file + ".tmp"
+        try:
+            os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+            with open(tmp_file, 'w') as f:
+                json.dump({Token.VERSION: CACHE_VERSION, Token.PEDALBOARDS: self.entries}, f)
+            os.replace(tmp_file, self.cache_file)  # atomic so a power cut can't leave a partial index
+            self.dirty = False
+        except OSError as e:
+            logging.error("Cannot write pedalboard cache %s: %s" % (self.cache_file, e))
+
+    def get(self, bundle, title):
+        # Return the cached Pedalboard for bundle, or None if missing or its TTL files have changed
+        entry = self.entries.get(bundle)
+        if entry is None:
+            return None
+        if entry[Token.MTIMES] != bundle_mtimes(bundle) or not manifests_unchanged(entry[Token.MANIFESTS]):
+            return None
+        try:
+            pedalboard = pedalboard_from_dict(entry[Token.PEDALBOARD])
+        except (KeyError, TypeError) as e:
+            logging.warning("Discarding corrupt pedalboard cache entry for %s: %s" % (bundle, e))
+            return None
+        pedalboard.title = title  # title is owned by mod-ui
+        return pedalboard
+
+    def put(self, pedalboard, plugin_dict):
+        # Pedalboards built without the data of all their plugins aren't kept, they're parsed again next time
+        if not pedalboard.complete:
+            logging.warning("Not caching %s, some of its plugin data is missing" % pedalboard.bundle)
+            self.remove(pedalboard.bundle)
+            return
+        mtimes = bundle_mtimes(pedalboard.bundle)
+        manifests = manifest_mtimes(pedalboard.plugin_uris, plugin_dict)
+        if mtimes is None or manifests is None:
+            self.remove(pedalboard.bundle)
+            return
+        self.entries[pedalboard.bundle] = {Token.MTIMES: mtimes, Token.MANIFESTS: manifests,
+                                           Token.PEDALBOARD: pedalboard_to_dict(pedalboard)}
+        self.dirty = True
+
+    def remove(self, bundle):
+        if self.entries.pop(bundle, None) is not None:
+            self.dirty = True
+
+    def prune(self, bundles):
+        # Drop entries for bundles which no longer exist
+        for bundle in [b for b in self.entries if b not in bundles]:
+            self.remove(bundle)
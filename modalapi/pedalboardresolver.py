@@ -0,0 +1,74 @@
+# This file is part of pi-stomp.
+#
+# pi-stomp is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pi-stomp is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pi-stomp.  If not, see <https://www.gnu.org/licenses/>.
+
+import logging
+import queue
+import threading
+
+import common.realtime as Realtime
+
+
+# Resolves lazily loaded pedalboards (title + bundle stubs) into fully parsed pedalboards
+#
+# resolve() is used when a pedalboard is actually needed (made current).  resolve_later() queues pedalboards
+# which will probably be needed soon (eg. neighbours of the selection) for parsing on a background thread.
+# Parsing of a given pedalboard only ever happens once, whichever comes first.
+class PedalboardResolver:
+
+    def __init__(self, plugin_dict, pedalboard_cache, plugin_cache):
+        self.plugin_dict = plugin_dict
+        self.pedalboard_cache = pedalboard_cache
+        self.plugin_cache = plugin_cache
+        self.lock = threading.Lock()
+        self.pending = queue.Queue()
+        self.thread = threading.Thread(target=self._resolver_thread, daemon=True)
+        self.thread.start()
+
+    def _resolver_thread(self):
+        Realtime.apply(Realtime.BACKGROUND)
+        while True:
+            pedalboard = self.pending.get()
+            if pedalboard is not None:  # None just requests a cache save
+                try:
+                    self.resolve(pedalboard)
+                except Exception as e:
+                    logging.error("Failed to load pedalboard %s: %s" % (pedalboard.bundle, e))
+            if self.pending.empty():
+                with self.lock:
+                    self.pedalboard_cache.save()
+                    self.plugin_cache.save(self.plugin_dict)
+
+    # External API
+    def resolve(self, pedalboard):
+        with self.lock:
+            if not pedalboard.loaded:
+                logging.info("Loading pedalboard info: %s" % pedalboard.title)
+                pedalboard.load_bundle(pedalboard.bundle, self.plugin_dict)
+                self.pedalboard_cache.put(pedalboard, self.plugin_dict)
+                if threading.current_thread() is not self.thread:
+                    self.pending.put(None)  # leave the cache write to the background thread
+        return pedalboard
+
+    def forget(self, bundles):
+        # Drop cached data for bundles which have changed or been removed
+        with self.lock:
+            for bundle in bundles:
+                self.pedalboard_cache.remove(bundle)
+        self.pending.put(None)
+
+    def resolve_later(self, pedalboards):
+        for pedalboard in pedalboards:
+            if not pedalboard.loaded:
+                self.pending.put(pedalboard)
@@ -0,0 +1,169 @@
+# This file is part of pi-stomp.
+#
+# pi-stomp is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pi-stomp is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pi-stomp.  If not, see <https://www.gnu.org/licenses/>.
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import threading
+import time
+
+import common.realtime as Realtime
+
+# inotify(7) event masks
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+ROOT_MASK = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE_SELF | IN_ONLYDIR
+BUNDLE_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_MOVED_FROM | IN_DELETE | IN_ONLYDIR
+
+EVENT = struct.Struct("iIII")  # struct inotify_event, followed by len bytes of name
+
+# mod-ui writes several files when saving, wait for a bundle to be quiet this long before reporting it
+SETTLE_TIME = 1.0
+
+
+class PedalboardWatcher:
+
+    # Watches the pedalboards directory, and each bundle in it, for pedalboards being added, removed or saved
+    #
+    # Events are collected on a background thread.  poll() returns the set of bundle paths which have changed
+    # (and settled) since the last call, or None.  Only the bundle's TTL files matter, screenshots etc. are ignored.
+    def __init__(self, pedalboard_dir):
+        self.pedalboard_dir = pedalboard_dir
+        self.lock = threading.Lock()
+        self.changed = set()
+        self.pending = {}  # bundle: time of last event
+        self.watches = {}  # watch descriptor: bundle path (or None for pedalboard_dir)
+        self.stop = threading.Event()
+        self.fd = -1
+        self.libc = None
+        self.thread = None
+
+        try:
+            self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        except (OSError, AttributeError) as e:
+            logging.warning("Pedalboard watcher not supported: %s" % e)
+            return
+        if self.fd < 0:
+            logging.warning("Pedalboard watcher not started: %s" % os.strerror(ctypes.get_errno()))
+            return
+
+        if self._add_watch(pedalboard_dir, None, ROOT_MASK) < 0:
+            os.close(self.fd)
+            self.fd = -1
+            return
+        for entry in os.scandir(pedalboard_dir):
+            if entry.is_dir():
+                self._add_watch(entry.path, entry.path, BUNDLE_MASK)
+
+        self.thread = threading.Thread(target=self._watcher_thread, daemon=True)
+        self.thread.start()
+
+    def __del__(self):
+        logging.info("Pedalboard watcher cleanup")
+        self.stop.set()
+        if self.thread is not None:
+            self.thread.join()
+        if self.fd >= 0:
+            os.close(self.fd)
+
+    def _add_watch(self, path, bundle, mask):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            logging.warning("Cannot watch %s: %s" % (path, os.strerror(ctypes.get_errno())))
+        else:
+            self.watches[wd] = bundle
+        return wd
+
+    def _read_events(self):
+        try:
+            buf = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        now = time.monotonic()
+        offset = 0
+        while offset < len(buf):
+            wd, mask, _, length = EVENT.unpack_from(buf, offset)
+            offset += EVENT.size
+            name = os.fsdecode(buf[offset:offset + length].rstrip(b'\0'))
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                # Events were lost, consider everything changed
+                logging.warning("Pedalboard watcher overflow, rescanning all bundles")
+                for bundle in self.watches.values():
+                    if bundle is not None:
+                        self.pending[bundle] = now
+                continue
+            if mask & IN_IGNORED:
+                self.watches.pop(wd, None)
+                continue
+            if wd not in self.watches:
+                continue
+
+            bundle = self.watches[wd]
+            if bundle is None:
+                # A bundle directory was added or removed
+                if not mask & IN_ISDIR:
+                    continue
+                bundle = os.path.join(self.pedalboard_dir, name)
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    self._add_watch(bundle, bundle, BUNDLE_MASK)
+                elif mask & IN_MOVED_FROM:
+                    # A moved directory keeps its watch, but it no longer names the bundle
+                    for w in [w for w, b in self.watches.items() if b == bundle]:
+                        self.libc.inotify_rm_watch(self.fd, w)
+                self.pending[bundle] = now
+            elif name.endswith(".ttl"):
+                self.pending[bundle] = now
+
+    def _watcher_thread(self):
+        Realtime.apply(Realtime.BACKGROUND)
+        while not self.stop.is_set():
+            try:
+                ready, _, _ = select.select([self.fd], [], [], SETTLE_TIME / 2)
+            except (OSError, ValueError):
+                break
+            if ready:
+                self._read_events()
+
+            now = time.monotonic()
+            settled = [b for b, t in self.pending.items() if now - t >= SETTLE_TIME]
+            if len(settled) > 0:
+                with self.lock:
+                    for bundle in settled:
+                        del self.pending[bundle]
+                        self.changed.add(bundle)
+
+    # External API
+    def poll(self):
+        if len(self.changed) > 0:
+            with self.lock:
+                update = self.changed
+                self.changed = set()
+            return update
+        return None
@@ -28,6 +28,8 @@ class Plugin:
         self.controllers = []
         self.has_footswitch = False
         self.category = category
+        self.depth = 0   # position in the signal graph (see Graph)
+        self.branch = 0
         #self.info_dict = info   # TODO could store this but not sure we need to
 
     def is_bypassed(self):
@@ -0,0 +1,115 @@
+# This file is part of pi-stomp.
+#
+# pi-stomp is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pi-stomp is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pi-stomp.  If not, see <https://www.gnu.org/licenses/>.
+
+import json
+import logging
+import os
+
+import common.token as Token
+
+# Bump this whenever the compact plugin layout changes so stale caches get discarded
+CACHE_VERSION = 2
+
+
+def compact_plugin_info(info):
+    # Reduce the (large) mod-ui effect/get response to just the fields used to build Parameters
+    # Control input ports are indexed by symbol, so Parameter construction is a dict lookup for every instance
+    control_inputs = {}
+    for port in info.get(Token.PORTS, {}).get(Token.CONTROL, {}).get(Token.INPUT, []):
+        ranges = port.get(Token.RANGES, {})
+        symbol = port.get(Token.SYMBOL)
+        control_inputs[symbol] = {Token.SYMBOL: symbol,
+                                  Token.NAME: port.get(Token.NAME),
+                                  Token.SHORTNAME: port.get(Token.SHORTNAME),
+                                  Token.RANGES: {Token.MINIMUM: ranges.get(Token.MINIMUM),
+                                                 Token.MAXIMUM: ranges.get(Token.MAXIMUM)}}
+    return {Token.CATEGORY: info.get(Token.CATEGORY, []),
+            Token.BUNDLES: info.get(Token.BUNDLES, []),
+            Token.CONTROL_INPUTS: control_inputs}
+
+
+def manifest_file(info):
+    # The plugin's LV2 bundle manifest changes whenever the plugin is reinstalled or upgraded
+    bundles = info.get(Token.BUNDLES)
+    if not bundles:
+        return None
+    return os.path.join(bundles[0], "manifest.ttl")
+
+
+def manifest_mtime(info):
+    manifest = manifest_file(info)
+    if manifest is None:
+        return None
+    try:
+        return os.path.getmtime(manifest)
+    except OSError:
+        return None
+
+
+# Persistent cache of compact plugin data keyed by plugin URI
+# Entries are invalidated when the manifest of the plugin's LV2 bundle changes (or disappears)
+class PluginCache:
+
+    def __init__(self, cache_file):
+        self.cache_file = cache_file
+        self.mtimes = {}  # uri: manifest mtime at the time the entry was cached
+
+    def load(self):
+        # Returns a plugin_dict populated with all entries which are still valid
+        plugin_dict = {}
+        if not os.path.isfile(self.cache_file):
+            return plugin_dict
+        try:
+            with open(self.cache_file, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning("Ignoring unreadable plugin cache %s: %s" % (self.cache_file, e))
+            return plugin_dict
+        if data.get(Token.VERSION) != CACHE_VERSION:
+            logging.info("Plugin cache version changed, rebuilding")
+            return plugin_dict
+
+        for uri, entry in data.get(Token.PLUGINS, {}).items():
+            info = entry[Token.INFO]
+            mtime = manifest_mtime(info)
+            if mtime is None or mtime != entry[Token.MTIME]:
+                logging.debug("Plugin cache entry is stale: %s" % uri)
+                continue
+            plugin_dict[uri] = info
+            self.mtimes[uri] = mtime
+        logging.debug("Loaded %d cached plugins" % len(plugin_dict))
+        return plugin_dict
+
+    def save(self, plugin_dict):
+        # Write plugin_dict out, only if it has entries which haven't been saved before
+        new = [uri for uri in list(plugin_dict) if uri not in self.mtimes]
+        if len(new) == 0:
+            return
+        for uri in new:
+            self.mtimes[uri] = manifest_mtime(plugin_dict[uri])
+
+        entries = {}
+        for uri, info in list(plugin_dict.items()):
+            if self.mtimes.get(uri) is not None:
+                entries[uri] = {Token.MTIME: self.mtimes[uri], Token.INFO: info}
+
+        tmp_file = self.cache_file + ".tmp"
+        try:
+            os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+            with open(tmp_file, 'w') as f:
+                json.dump({Token.VERSION: CACHE_VERSION, Token.PLUGINS: entries}, f)
+            os.replace(tmp_file, self.cache_file)
+        except OSError as e:
+            logging.error("Cannot write plugin cache %s: %s" % (self.cache_file, e))
@@ -0,0 +1,83 @@
+# This file is part of pi-stomp.
+#
+# pi-stomp is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pi-stomp is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pi-stomp.  If not, see <https://www.gnu.org/licenses/>.
+
+import json
+import logging
+import os
+import threading
+
+import common.token as Token
+
+SNAPSHOT_FILE = "snapshots.json"
+
+
+class Snapshot:
+
+    # One of a pedalboard's snapshots (presets), as mod-ui saved it
+    def __init__(self, name, bypass, parameters):
+        self.name = name
+        self.bypass = bypass          # {instance_id: bypassed}
+        self.parameters = parameters  # {instance_id: {symbol: value}}
+
+
+def read_snapshots(bundlepath):
+    # Returns {index: Snapshot} from the bundle's snapshot file, None if there isn't one (or it can't be read)
+    #
+    # mod-ui writes {"current": n, "snapshots": [{"name": .., "data": {instance: {"bypassed": .., "parameters": {..}}}}]}
+    # with instance names relative to /graph/, the instance_ids used here keep the leading slash
+    path = os.path.join(bundlepath, SNAPSHOT_FILE)
+    try:
+        with open(path, 'r') as file:
+            snapshots = json.load(file)[Token.SNAPSHOTS]
+        result = {}
+        for index, s in enumerate(snapshots):
+            if s is None:
+                continue
+            bypass = {}
+            parameters = {}
+            for instance, data in s.get(Token.DATA, {}).items():
+                instance_id = "/" + instance
+                if Token.BYPASSED in data:
+                    bypass[instance_id] = bool(data[Token.BYPASSED])
+                parameters[instance_id] = {sym: float(v) for sym, v in data.get(Token.PARAMETERS, {}).items()}
+            result[index] = Snapshot(s[Token.NAME], bypass, parameters)
+        return result
+    except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+        logging.debug("No snapshots from %s: %s" % (path, e))
+        return None
+
+
+class SnapshotCache:
+
+    # Parsed snapshot files per pedalboard bundle, reparsed when the file changes (ie. the pedalboard is saved)
+    # Used from the executor as well as the main loop, hence the lock
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = {}  # bundlepath: (mtime, {index: Snapshot})
+
+    def get(self, bundlepath):
+        try:
+            mtime = os.path.getmtime(os.path.join(bundlepath, SNAPSHOT_FILE))
+        except OSError:
+            return None
+        with self.lock:
+            entry = self.entries.get(bundlepath)
+            if entry is not None and entry[0] == mtime:
+                return entry[1]
+        snapshots = read_snapshots(bundlepath)
+        if snapshots is not None:
+            with self.lock:
+                self.entries[bundlepath] = (mtime, snapshots)
+        return snapshots
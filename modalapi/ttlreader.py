@@ -0,0 +1,379 @@
+# This file is part of pi-stomp.
+#
+# pi-stomp is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pi-stomp is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pi-stomp.  If not, see <https://www.gnu.org/licenses/>.
+
+import os
+import pathlib
+import re
+import urllib.parse
+
+import common.token as Token
+
+# Lightweight pedalboard bundle reader
+#
+# An alternative to LilvWorld.parse_pedalboard which doesn't build an RDF model.  The bundle's TTL files are
+# tokenized and parsed as a stream of triples, of which only the few predicates used to build a pedalboard
+# are kept.  The result is the same plain python data as LilvWorld.parse_pedalboard returns.
+# Only Turtle is supported (mod-ui doesn't write anything else), but all of it, not just mod-ui's layout.
+
+INGEN = "http://drobilla.net/ns/ingen#"
+LV2 = "http://lv2plug.in/ns/lv2core#"
+MIDI = "http://lv2plug.in/ns/ext/midi#"
+RDF = "http://www.w3.org/1999/02/22-rdf-syntax-ns#"
+RDFS = "http://www.w3.org/2000/01/rdf-schema#"
+XSD = "http://www.w3.org/2001/XMLSchema#"
+
+INGEN_ARC = INGEN + "arc"
+INGEN_BLOCK = INGEN + "block"
+INGEN_HEAD = INGEN + "head"
+INGEN_TAIL = INGEN + "tail"
+INGEN_VALUE = INGEN + "value"
+LV2_PLUGIN = LV2 + "Plugin"
+LV2_PORT = LV2 + "port"
+LV2_PROTOTYPE = LV2 + "prototype"
+MIDI_BINDING = MIDI + "binding"
+MIDI_CHANNEL = MIDI + "channel"
+MIDI_CONTROLLER_NUMBER = MIDI + "controllerNumber"
+MODPEDAL_PEDALBOARD = "http://moddevices.com/ns/modpedal#Pedalboard"
+RDF_TYPE = RDF + "type"
+RDFS_SEE_ALSO = RDFS + "seeAlso"
+
+# Everything else is dropped as soon as it's parsed
+PREDICATES = {INGEN_ARC, INGEN_BLOCK, INGEN_HEAD, INGEN_TAIL, INGEN_VALUE, LV2_PORT, LV2_PROTOTYPE,
+              MIDI_BINDING, MIDI_CHANNEL, MIDI_CONTROLLER_NUMBER, RDF_TYPE, RDFS_SEE_ALSO}
+
+INTEGER_TYPES = {XSD + t for t in ("integer", "int", "long", "short", "byte", "nonNegativeInteger",
+                                   "positiveInteger", "unsignedInt", "unsignedLong", "unsignedShort")}
+FLOAT_TYPES = {XSD + t for t in ("decimal", "double", "float")}
+
+_NAME = r"(?:[\w-]|\.(?=[\w:%-]))"  # names may contain, but not end with, a dot
+_TOKENS = re.compile(r"""
+    (?P<skip>\s+|\#[^\n]*)
+  | <(?P<iri>[^<>"{}|^`\\\x00-\x20]*)>
+  | _:(?P<bnode>%(name)s+)
+  | (?P<pname>(?:[A-Za-z]%(name)s*)?:(?:[\w:%%-]|\.(?=[\w:%%-]))*)
+  | (?P<string>\"\"\"(?:[^"\\]|\\.|"(?!""))*\"\"\"|'''(?:[^'\\]|\\.|'(?!''))*'''
+               |"(?:[^"\\\n]|\\.)*"|'(?:[^'\\\n]|\\.)*')
+  | (?P<datatype>\^\^)
+  | @(?P<at>[A-Za-z]+(?:-[A-Za-z0-9]+)*)
+  | (?P<double>[+-]?(?:\d+\.?\d*|\.\d+)[eE][+-]?\d+)
+  | (?P<decimal>[+-]?\d*\.\d+)
+  | (?P<integer>[+-]?\d+)
+  | (?P<word>[A-Za-z]+)
+  | (?P<punct>[.;,\[\]()])
+""" % {'name': _NAME}, re.VERBOSE)
+
+_ESCAPES = re.compile(r"\\(?:u([0-9A-Fa-f]{4})|U([0-9A-Fa-f]{8})|(.))", re.DOTALL)
+_ESCAPE_CHARS = {'t': '\t', 'b': '\b', 'n': '\n', 'r': '\r', 'f': '\f'}
+
+
+def unescape(s):
+    def replace(m):
+        if m.group(3) is None:
+            return chr(int(m.group(1) or m.group(2), 16))
+        return _ESCAPE_CHARS.get(m.group(3), m.group(3))
+    return _ESCAPES.sub(replace, s)
+
+
+def file_path(uri):
+    return urllib.parse.unquote(urllib.parse.urlparse(uri).path)
+
+
+class BNode(str):
+    # Blank node label, distinct from IRIs which are plain strings
+    pass
+
+
+class Literal:
+
+    def __init__(self, lexical, datatype=None, lang=None):
+        self.lexical = lexical
+        self.datatype = datatype
+        self.lang = lang
+
+    def is_int(self):
+        return self.datatype in INTEGER_TYPES
+
+    def is_float(self):
+        return self.datatype in FLOAT_TYPES
+
+    def __repr__(self):
+        return "Literal(%r, %r)" % (self.lexical, self.datatype)
+
+
+# The subset of triples kept from parsing: subject: {predicate: [objects]}
+class Triples:
+
+    def __init__(self):
+        self.subjects = {}
+        self.bnode_prefix = 0  # keeps blank node labels of different files apart
+
+    def add(self, s, p, o):
+        if p in PREDICATES:
+            self.subjects.setdefault(s, {}).setdefault(p, []).append(o)
+
+    def values(self, s, p):
+        return self.subjects.get(s, {}).get(p, [])
+
+    def get(self, s, p):
+        values = self.values(s, p)
+        return values[0] if len(values) > 0 else None
+
+
+class TurtleParser:
+
+    def __init__(self, text, base, triples):
+        self.text = text
+        self.base = base
+        self.triples = triples
+        self.prefixes = {}
+        self.tokens = self.__tokenize()
+        self.token = next(self.tokens)
+        triples.bnode_prefix += 1
+        self.bnode_prefix = "b%d_" % triples.bnode_prefix
+        self.anon = 0
+
+    def __tokenize(self):
+        pos = 0
+        end = len(self.text)
+        while pos < end:
+            m = _TOKENS.match(self.text, pos)
+            if m is None:
+                raise ValueError("Turtle syntax error at offset %d: %r" % (pos, self.text[pos:pos + 20]))
+            pos = m.end()
+            if m.lastgroup != 'skip':
+                yield m.lastgroup, m.group(m.lastgroup)
+        yield None, None
+
+    def __next(self):
+        token = self.token
+        self.token = next(self.tokens)
+        return token
+
+    def __expect(self, value):
+        kind, v = self.__next()
+        if kind != 'punct' or v != value:
+            raise ValueError("Turtle syntax error: expected '%s', got %r" % (value, v))
+
+    def __at_punct(self, value):
+        return self.token[0] == 'punct' and self.token[1] == value
+
+    def __new_bnode(self):
+        self.anon += 1
+        return BNode("_:%sanon%d" % (self.bnode_prefix, self.anon))
+
+    def __iri(self, kind, value):
+        if kind == 'iri':
+            return urllib.parse.urljoin(self.base, unescape(value))
+        prefix, local = value.split(':', 1)
+        if prefix not in self.prefixes:
+            raise ValueError("Turtle syntax error: undefined prefix '%s'" % prefix)
+        return self.prefixes[prefix] + local
+
+    def parse(self):
+        while self.token[0] is not None:
+            kind, value = self.token
+            if kind == 'at' or (kind == 'word' and value.lower() in ('prefix', 'base')):
+                self.__directive()
+            else:
+                self.__triples()
+                self.__expect('.')
+
+    def __directive(self):
+        kind, value = self.__next()
+        sparql = kind == 'word'  # PREFIX/BASE don't end with a '.'
+        if value.lower() == 'prefix':
+            name = self.__next()[1]
+            if not name.endswith(':'):
+                raise ValueError("Turtle syntax error: bad prefix name %r" % name)
+            self.prefixes[name[:-1]] = self.__iri(*self.__next())
+        elif value.lower() == 'base':
+            self.base = self.__iri(*self.__next())
+        else:
+            raise ValueError("Turtle syntax error: unknown directive @%s" % value)
+        if not sparql:
+            self.__expect('.')
+
+    def __triples(self):
+        if self.__at_punct('['):
+            self.__next()
+            subject = self.__new_bnode()
+            if not self.__at_punct(']'):
+                self.__predicate_objects(subject)
+            self.__expect(']')
+            if self.__at_punct('.'):
+                return  # a bare [ ... ] statement
+        else:
+            subject = self.__subject()
+        self.__predicate_objects(subject)
+
+    def __subject(self):
+        kind, value = self.token
+        if kind == 'punct' and value == '(':
+            return self.__collection()
+        self.__next()
+        if kind in ('iri', 'pname'):
+            return self.__iri(kind, value)
+        if kind == 'bnode':
+            return BNode("_:%s%s" % (self.bnode_prefix, value))
+        raise ValueError("Turtle syntax error: unexpected subject %r" % value)
+
+    def __predicate_objects(self, subject):
+        while True:
+            kind, value = self.__next()
+            if kind == 'word' and value == 'a':
+                predicate = RDF_TYPE
+            elif kind in ('iri', 'pname'):
+                predicate = self.__iri(kind, value)
+            else:
+                raise ValueError("Turtle syntax error: unexpected predicate %r" % value)
+            self.triples.add(subject, predicate, self.__object())
+            while self.__at_punct(','):
+                self.__next()
+                self.triples.add(subject, predicate, self.__object())
+            # any number of ';' may follow, with or without another predicate
+            if not self.__at_punct(';'):
+                return
+            while self.__at_punct(';'):
+                self.__next()
+            if self.token[0] == 'punct':
+                return
+
+    def __object(self):
+        kind, value = self.token
+        if kind == 'punct' and value == '[':
+            self.__next()
+            node = self.__new_bnode()
+            if not self.__at_punct(']'):
+                self.__predicate_objects(node)
+            self.__expect(']')
+            return node
+        if kind == 'punct' and value == '(':
+            return self.__collection()
+        self.__next()
+        if kind in ('iri', 'pname'):
+            return self.__iri(kind, value)
+        if kind == 'bnode':
+            return BNode("_:%s%s" % (self.bnode_prefix, value))
+        if kind == 'string':
+            quotes = 3 if value[:3] in ('"""', "'''") else 1
+            lexical = unescape(value[quotes:-quotes])
+            if self.token[0] == 'datatype':
+                self.__next()
+                return Literal(lexical, self.__iri(*self.__next()))
+            if self.token[0] == 'at':
+                return Literal(lexical, RDF + "langString", self.__next()[1])
+            return Literal(lexical, XSD + "string")
+        if kind in ('integer', 'decimal', 'double'):
+            return Literal(value, XSD + kind)
+        if kind == 'word' and value in ('true', 'false'):
+            return Literal(value, XSD + "boolean")
+        raise ValueError("Turtle syntax error: unexpected object %r" % value)
+
+    def __collection(self):
+        # Nothing used from pedalboards is a list, so the members are parsed but not kept
+        self.__expect('(')
+        while not self.__at_punct(')'):
+            self.__object()
+        self.__next()
+        return self.__new_bnode()
+
+
+def read_file(path, uri, triples):
+    with open(path, 'r', encoding='utf-8') as f:
+        text = f.read()
+    TurtleParser(text, uri, triples).parse()
+
+
+# Parse a pedalboard bundle into plain python data, see LilvWorld.parse_pedalboard
+# @a bundlepath is a string, consisting of a directory in the filesystem (absolute pathname).
+def parse_pedalboard(bundlepath):
+    bundle = os.path.abspath(bundlepath)
+    base = pathlib.Path(bundle).as_uri() + "/"
+    triples = Triples()
+
+    # Like lilv, the manifest names the plugin and the files which describe it
+    read_file(os.path.join(bundle, "manifest.ttl"), base + "manifest.ttl", triples)
+    plugins = [s for s, p in triples.subjects.items() if LV2_PLUGIN in p.get(RDF_TYPE, [])]
+    if len(plugins) == 0:
+        raise Exception('parse_pedalboard(%s) - bundle has no plugin' % bundlepath)
+    if len(plugins) > 1:
+        raise Exception('parse_pedalboard(%s) - bundle has > 1 plugin' % bundlepath)
+    plugin = plugins[0]
+
+    loaded = {base + "manifest.ttl"}
+    for uri in triples.values(plugin, RDFS_SEE_ALSO):
+        if isinstance(uri, str) and not isinstance(uri, BNode) and uri not in loaded:
+            loaded.add(uri)
+            read_file(file_path(uri), uri, triples)
+
+    return extract(triples, plugin, bundlepath)
+
+
+def port_owner(port, bundlepath):
+    # See LilvWorld.port_owner
+    owner = os.path.dirname(file_path(port).replace(bundlepath, "", 1))
+    if owner in ("", os.sep):
+        return None
+    return owner
+
+
+def extract(triples, plugin, bundlepath):
+    if MODPEDAL_PEDALBOARD not in triples.values(plugin, RDF_TYPE):
+        raise Exception('parse_pedalboard(%s) - plugin has no mod:Pedalboard type' % bundlepath)
+
+    # lilv returns nodes sorted, blocks and ports are sorted the same way so both readers agree
+    def uris(nodes):
+        return sorted(n for n in nodes if isinstance(n, str) and not isinstance(n, BNode))
+
+    arcs = []
+    for arc in triples.values(plugin, INGEN_ARC):
+        tail = triples.get(arc, INGEN_TAIL)
+        head = triples.get(arc, INGEN_HEAD)
+        if tail is None or head is None:
+            continue
+        arcs.append((tail, head, port_owner(tail, bundlepath), port_owner(head, bundlepath)))
+    arcs = [(tail, head) for _, _, tail, head in sorted(arcs)]
+
+    blocks = []
+    for block in uris(triples.values(plugin, INGEN_BLOCK)):
+        instance_id = file_path(block).replace(bundlepath, "", 1)
+
+        prototype = triples.get(block, LV2_PROTOTYPE)
+        if prototype is not None:
+            prototype = str(prototype)
+
+        ports = []
+        for port in uris(triples.values(block, LV2_PORT)):
+            param_value = triples.get(port, INGEN_VALUE)
+            binding = None
+            binding_node = triples.get(port, MIDI_BINDING)
+            if binding_node is not None:
+                controller_num = triples.get(binding_node, MIDI_CONTROLLER_NUMBER)
+                channel = triples.get(binding_node, MIDI_CHANNEL)
+                if isinstance(controller_num, Literal) and isinstance(channel, Literal):
+                    binding = "%d:%d" % (int(channel.lexical), int(controller_num.lexical))
+            value = None
+            if isinstance(param_value, Literal):
+                if param_value.is_float():
+                    value = float(param_value.lexical)
+                elif param_value.is_int():
+                    value = int(param_value.lexical)
+                else:
+                    value = str(None)  # same as LilvWorld, other literal types aren't converted
+            ports.append({Token.SYMBOL: os.path.basename(port), Token.VALUE: value, Token.BINDING: binding})
+
+        blocks.append({Token.INSTANCE_ID: instance_id, Token.PROTOTYPE: prototype, Token.PORTS: ports})
+
+    return {Token.BLOCKS: blocks, Token.ARCS: arcs}
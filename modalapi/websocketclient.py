@@ -0,0 +1,153 @@
+# This file is part of pi-stomp.
+#
+# pi-stomp is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pi-stomp is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pi-stomp.  If not, see <https://www.gnu.org/licenses/>.
+
+import base64
+import hashlib
+import os
+import socket
+import struct
+import threading
+import urllib.parse
+
+GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+OP_CONTINUATION = 0x0
+OP_TEXT = 0x1
+OP_BINARY = 0x2
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+
+class WebSocketError(Exception):
+    pass
+
+
+class WebSocketClient:
+
+    # Minimal RFC 6455 websocket client, enough to follow mod-ui's feed without another dependency
+    #
+    # recv() blocks until a complete text message arrives (None once the connection is closed).  Pings are
+    # answered as they're read.  send() may be called from any thread.
+    def __init__(self, url, timeout=None):
+        self.url = urllib.parse.urlparse(url)
+        self.timeout = timeout
+        self.sock = None
+        self.reader = None
+        self.send_lock = threading.Lock()
+
+    def connect(self):
+        port = self.url.port or 80
+        path = self.url.path or "/"
+        self.sock = socket.create_connection((self.url.hostname, port), timeout=self.timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = self.sock.makefile('rb')
+
+        key = base64.b64encode(os.urandom(16)).decode()
+        request = ("GET %s HTTP/1.1\r\n"
+                   "Host: %s:%d\r\n"
+                   "Upgrade: websocket\r\n"
+                   "Connection: Upgrade\r\n"
+                   "Sec-WebSocket-Key: %s\r\n"
+                   "Sec-WebSocket-Version: 13\r\n\r\n") % (path, self.url.hostname, port, key)
+        self.sock.sendall(request.encode())
+
+        status = self.reader.readline().decode('latin-1')
+        headers = {}
+        while True:
+            line = self.reader.readline().decode('latin-1').strip()
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+        if not status.startswith("HTTP/1.1 101"):
+            self.close()
+            raise WebSocketError("Websocket handshake failed: %s" % status.strip())
+        accept = base64.b64encode(hashlib.sha1((key + GUID).encode()).digest()).decode()
+        if headers.get("sec-websocket-accept") != accept:
+            self.close()
+            raise WebSocketError("Websocket handshake failed: bad accept key")
+
+    def close(self):
+        if self.sock is not None:
+            try:
+                self._send_frame(OP_CLOSE, b"")
+            except OSError:
+                pass
+            try:
+                self.reader.close()
+                self.sock.close()
+            except OSError:
+                pass
+            self.sock = None
+            self.reader = None
+
+    def _read(self, n):
+        data = self.reader.read(n)
+        if data is None or len(data) < n:
+            raise ConnectionError("Websocket connection closed")
+        return data
+
+    def _read_frame(self):
+        b1, b2 = self._read(2)
+        fin = b1 & 0x80
+        opcode = b1 & 0x0F
+        length = b2 & 0x7F
+        if length == 126:
+            length = struct.unpack("!H", self._read(2))[0]
+        elif length == 127:
+            length = struct.unpack("!Q", self._read(8))[0]
+        mask = self._read(4) if b2 & 0x80 else None
+        payload = self._read(length)
+        if mask is not None:
+            payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+        return fin, opcode, payload
+
+    def _send_frame(self, opcode, payload):
+        # Client frames must be masked
+        header = bytearray([0x80 | opcode])
+        length = len(payload)
+        if length < 126:
+            header.append(0x80 | length)
+        elif length < 65536:
+            header.append(0x80 | 126)
+            header += struct.pack("!H", length)
+        else:
+            header.append(0x80 | 127)
+            header += struct.pack("!Q", length)
+        mask = os.urandom(4)
+        header += mask
+        masked = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+        with self.send_lock:
+            if self.sock is None:
+                raise ConnectionError("Websocket not connected")
+            self.sock.sendall(bytes(header) + masked)
+
+    def recv(self):
+        message = b""
+        while True:
+            fin, opcode, payload = self._read_frame()
+            if opcode == OP_PING:
+                self._send_frame(OP_PONG, payload)
+            elif opcode == OP_CLOSE:
+                self.close()
+                return None
+            elif opcode in (OP_TEXT, OP_BINARY, OP_CONTINUATION):
+                message += payload
+                if fin:
+                    return message.decode('utf-8', errors='replace')
+
+    def send(self, text):
+        self._send_frame(OP_TEXT, text.encode())
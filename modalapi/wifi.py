@@ -22,6 +22,12 @@ import threading
 import subprocess
 import logging
 
+import common.eventloop as EventLoop
+import common.realtime as Realtime
+
+# Seconds between wifi status checks
+POLL_PERIOD = 5.0
+
 class WifiManager():
 
     # For now hard wire wifi interface to avoid spending time scrubbing sysfs
@@ -31,9 +37,10 @@ class WifiManager():
     # proper network management, but we aren't there. Alternatively, we could
     # monitor for hotplug events via dbus...
     #
-    def __init__(self, ifname = 'wlan0'):
+    def __init__(self, ifname = 'wlan0', period = POLL_PERIOD):
         # Grab default wifi interface
         self.iface_name = 'wlan0'
+        self.period = period
         self.lock = threading.Lock()
         self.last_status = {}
         self.changed = False
@@ -84,7 +91,8 @@ class WifiManager():
             logging.error("WPA CLI fail:" + str(e))
 
     def _polling_thread(self):
-        while not self.stop.wait(5.0):
+        Realtime.apply(Realtime.BACKGROUND)
+        while not self.stop.wait(self.period):
             new_status = {}
             new_status['wifi_supported'] = supported = self._is_wifi_supported()
             new_status['wifi_connected'] = connected = self._is_wifi_connected()
@@ -97,6 +105,7 @@ class WifiManager():
                 self.last_status = new_status
                 self.changed = True
                 self.lock.release()
+                EventLoop.wakeup()
 
     # External API
     def poll(self):
@@ -18,17 +18,43 @@ import argparse
 import logging
 import os
 import RPi.GPIO as GPIO
+import signal
 import sys
-import time
 
 from rtmidi.midiutil import open_midioutput
 
+import common.eventloop as EventLoop
+import common.histogram as Histogram
+import common.realtime as Realtime
+import common.token as Token
 import modalapi.mod as Mod
+import pistomp.config as config
 import pistomp.audiocardfactory as Audiocardfactory
 import pistomp.generichost as Generichost
 import pistomp.testhost as Testhost
 import pistomp.hardwarefactory as Hardwarefactory
 import pistomp.handler as Handler
+import pistomp.scheduler as Scheduler
+
+def sched_policies(cfg, overrides):
+    # The realtime config section, with --sched ROLE KEY=VALUE... overrides
+    policies = {}
+    for role in Realtime.ROLES:
+        settings = config.get_value(cfg, Token.REALTIME, role, {})
+        policies[role] = dict(settings) if isinstance(settings, dict) else {}
+    for override in overrides or []:
+        role = override[0]
+        if role not in Realtime.ROLES:
+            raise argparse.ArgumentTypeError("--sched role must be one of %s" % ", ".join(Realtime.ROLES))
+        for setting in override[1:]:
+            key, _, value = setting.partition('=')
+            if key not in (Token.CPUS, Token.FIFO, Token.NICE):
+                raise argparse.ArgumentTypeError("--sched setting must be cpus=, fifo= or nice=")
+            policies[role][key] = value
+    # Nothing to do unless something is set
+    if not any(v not in (None, "", 0, "0", []) for settings in policies.values() for v in settings.values()):
+        return None
+    return policies
 
 def main():
     sys.settrace
@@ -39,6 +65,9 @@ def main():
                         choices=['debug', 'info', 'warning', 'error', 'critical'])
     parser.add_argument("--host", nargs='+', help="Plugin host to use. Example --host mod'", default=['mod'],
                         choices=['mod', 'generic', 'test'])
+    parser.add_argument("--sched", nargs='+', action='append', metavar="ROLE [cpus=N,.. fifo=N nice=N]",
+                        help="CPU affinity and scheduling for the control, host or background threads, overriding "
+                             "the config's realtime section.  Example --sched control cpus=3 fifo=40")
 
     args = parser.parse_args()
 
@@ -51,6 +80,14 @@ def main():
         print("Log level now set to: %s" % logging.getLevelName(log_level))
         logging.basicConfig(level=log_level)
 
+    # CPU affinity and scheduling, before any threads are started.  The GPIO interrupt thread inherits the control
+    # thread's, the others apply their own.
+    try:
+        Realtime.configure(sched_policies(config.load_default_cfg(), args.sched))
+    except argparse.ArgumentTypeError as e:
+        parser.error(str(e))
+    Realtime.apply(Realtime.CONTROL)
+
     # Current Working Dir
     cwd = os.path.dirname(os.path.realpath(__file__))
 
@@ -86,16 +123,8 @@ def main():
         hw = factory.create(handler, midiout)
         handler.add_hardware(hw)
 
-        # Load all pedalboard info from the lilv ttl file
-        handler.load_pedalboards()
-
-        # Load the current pedalboard as "current"
-        current_pedal_board_bundle = handler.get_current_pedalboard_bundle_path()
-        if not current_pedal_board_bundle:
-            # Apparently, no pedalboard is currently loaded so just change to the default
-            handler.pedalboard_change()
-        else:
-            handler.set_current_pedalboard(handler.pedalboards[current_pedal_board_bundle])
+        # Load all pedalboard info and the current pedalboard, as soon as mod-ui is available
+        handler.host_connect()
 
         # Load system info.  This can take a few seconds
         handler.system_info_load()
@@ -120,17 +149,38 @@ def main():
             raise
 
     logging.info("Entering main loop. Press Control-C to exit.")
-    period = 0
+    loop = EventLoop.get_loop()
+    scheduler = Scheduler.Scheduler(loop, hw.default_cfg if hw is not None else None)
+    handler.schedule(scheduler)
+
+    # kill -USR1 logs the latency figures.  Not from the signal handler itself, which could interrupt the main
+    # thread holding a histogram's lock, it only flags the dump for the loop.
+    dump_requested = []
+
+    def dump_stats():
+        if dump_requested:
+            dump_requested.clear()
+            Histogram.dump()
+            for name, period, runs, late, worst, average in scheduler.stats():
+                logging.info("task %s: every %.3fs n=%d late=%d worst=%.1fms avg=%.2fms" %
+                             (name, period, runs, late, worst * 1000, average * 1000))
+        return False
+
+    def request_dump(signum, frame):
+        dump_requested.append(signum)
+        loop.wakeup()
+
+    loop.on_wakeup(dump_stats)
+    signal.signal(signal.SIGUSR1, request_dump)
+
+    Realtime.report()
+
+    # The GPIO interrupt thread has inherited the control scheduling by now, nothing started later should (eg.
+    # plugin data fetches, the system menu's commands)
+    Realtime.reset_on_fork(Realtime.CONTROL)
+
     try:
-        while True:
-            handler.poll_controls()
-            time.sleep(0.01)  # lower to increase responsiveness, but can cause conflict with LCD if too low
-
-            # For less frequent events
-            period += 1
-            if period > 100:
-                handler.poll_modui_changes()
-                period = 0
+        loop.run()
 
     except KeyboardInterrupt:
         logging.info('keyboard interrupt')
@@ -19,6 +19,7 @@ import board
 import adafruit_mcp3xxx.mcp3008 as MCP
 from adafruit_mcp3xxx.analog_in import AnalogIn
 from enum import Enum
+import time
 
 
 import pistomp.analogcontrol as analogcontrol
@@ -31,14 +32,14 @@ class Value(Enum):
     CLICKED = 4
     DOUBLECLICKED = 5
 
-LONGPRESS_THRESHOLD = 60  # TODO somewhat LAME.  It's dependent on the refresh frequency of the main loop
+LONGPRESS_THRESHOLD = 0.6  # seconds held, timed so it doesn't depend on how often the ADC is polled
 
 class AnalogSwitch(analogcontrol.AnalogControl):
 
     def __init__(self, spi, adc_channel, tolerance, callback):
         super(AnalogSwitch, self).__init__(spi, adc_channel, tolerance)
         self.value = None          # this keeps track of the last value
-        self.trigger_count = 0
+        self.press_tstamp = None   # when the switch was pressed
         self.callback = callback
         self.longpress_state = False
 
@@ -46,6 +47,7 @@ class AnalogSwitch(analogcontrol.AnalogControl):
     def refresh(self):
         # read the analog pin
         new_value = self.readChannel()
+        now = time.monotonic()
 
         # if last read is None, this is the first refresh so don't do anything yet
         if self.value is None:
@@ -56,11 +58,14 @@ class AnalogSwitch(analogcontrol.AnalogControl):
         pot_adjust = abs(new_value - self.value)
         value_changed = (pot_adjust > self.tolerance)
 
-        # Count the number of simultaneous refresh cycles had the switch Low (triggered)
+        # Time how long the switch has been held Low (triggered)
+        longpress = False
         if not self.longpress_state and new_value < self.tolerance and self.value < self.tolerance:
-            self.trigger_count += 1
-            if self.trigger_count > LONGPRESS_THRESHOLD:
+            if self.press_tstamp is None:
+                self.press_tstamp = now
+            elif now - self.press_tstamp > LONGPRESS_THRESHOLD:
                 value_changed = True
+                longpress = True
                 self.longpress_state = True
 
         if value_changed:
@@ -68,17 +73,17 @@ class AnalogSwitch(analogcontrol.AnalogControl):
             # save the potentiometer reading for the next loop
             self.value = new_value
 
-            if self.trigger_count > LONGPRESS_THRESHOLD:
+            self.press_tstamp = None
+            if longpress:
                 new_value = Value.LONGPRESSED
             elif new_value < self.tolerance:
                 new_value = Value.PRESSED
+                self.press_tstamp = now
             elif new_value >= self.tolerance:
                 if self.longpress_state:
                     self.longpress_state = False
-                    self.trigger_count = 0
                     return
                 else:
                     new_value = Value.RELEASED
-            self.trigger_count = 0
 
             self.callback(new_value)
@@ -26,3 +26,12 @@ def load_default_cfg():
     with open(default_config_file, 'r') as ymlfile:
         cfg = yaml.load(ymlfile, Loader=yaml.SafeLoader)
         return cfg
+
+
+def get_value(cfg, section, key, default=None):
+    # Read an optional top level section setting, falling back to default if it's not specified
+    try:
+        value = cfg[section][key]
+    except (KeyError, TypeError):
+        return default
+    return default if value is None else value
@@ -15,9 +15,13 @@
 
 import RPi.GPIO as GPIO
 import threading
+import time
 
 from functools import partial
 
+import common.eventloop as EventLoop
+import common.histogram as Histogram
+
 
 class Encoder:
 
@@ -51,6 +55,7 @@ class Encoder:
         if d != 0:
             with self._lock:
                 self.direction += d
+            EventLoop.wakeup()
 
     def __init__(self, d_pin, clk_pin, callback, use_interrupt = True):
 
@@ -85,6 +90,7 @@ class Encoder:
         return GPIO.input(self.clk_pin)
 
     def read_rotary(self):
+        # One step per call, returns True if there are more to read (or, without interrupts, to keep polling)
         d = 0
         if self.use_interrupt:
             if self.direction != 0:
@@ -97,4 +103,7 @@ class Encoder:
         else:
             d = self._process_gpios()
         if d != 0:
+            start = time.perf_counter()
             self.callback(d)
+            Histogram.get(Histogram.ENCODER).add(time.perf_counter() - start)
+        return self.direction != 0 if self.use_interrupt else True
@@ -26,4 +26,9 @@ class Generichost(Handler):
 
     def poll_controls(self):
         if self.hardware:
-            self.hardware.poll_controls()
+            return self.hardware.poll_gpio_controls()
+        return False
+
+    def poll_analog_controls(self):
+        if self.hardware:
+            self.hardware.poll_analog_controls()
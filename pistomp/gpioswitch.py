@@ -17,66 +17,90 @@ import logging
 import RPi.GPIO as GPIO
 from rtmidi.midiconstants import CONTROL_CHANGE
 
+import common.eventloop as EventLoop
+import common.histogram as Histogram
 import pistomp.controller as controller
 import time
 import queue
 
+# Presses closer together than this are taken as contact bounce (what RPi.GPIO's bouncetime did)
+DEBOUNCE = 0.25
+
+
 class GpioSwitch(controller.Controller):
 
     def __init__(self, fs_pin, midi_channel, midi_CC):
         super(GpioSwitch, self).__init__(midi_channel, midi_CC)
         self.fs_pin = fs_pin
         self.cur_tstamp = None
+        self.last_down = None  # of the last press let through, for the debounce (GPIO thread only)
+        self.long_press_timer = None
         self.events = queue.Queue()
 
         # Long press threshold in seconds
         self.long_press_threshold = 0.5
 
         GPIO.setup(fs_pin, GPIO.IN, pull_up_down=GPIO.PUD_UP)
-        GPIO.add_event_detect(fs_pin, GPIO.FALLING, callback=self._gpio_down, bouncetime=250)
+        GPIO.add_event_detect(fs_pin, GPIO.BOTH, callback=self._gpio_edge)
 
     def __del__(self):
         GPIO.remove_event_detect(self.fs_pin)
 
-    def _gpio_down(self, gpio):
-        # This is run from a separate thread, timestamp pressed and queue an event
-        #
-        # I considered using a dual edge callback and handle the timestamp here
-        # to queue long/short press events, but in practice, I noticed dual edge
-        # is rather unreliable with such a long debounce, we often don't get the
-        # rising edge callback at all. So let's just timestamp and we'll handle
-        # everything from the poller thread
+    def _gpio_edge(self, gpio):
+        # This is run from a separate thread.  A press is timestamped and queued, a release only wakes the main
+        # loop, which then reads the input, so it doesn't have to poll the switch while it's held.
         #
-        self.events.put(time.monotonic())
+        # RPi.GPIO's bouncetime applies to both edges, so it would drop the release of a press shorter than the
+        # debounce.  Presses are debounced here instead.  If a release edge is lost anyway, the long press timer
+        # still finishes the press (see poll).
+        now = time.monotonic()
+        if not GPIO.input(self.fs_pin):
+            if self.last_down is not None and now - self.last_down < DEBOUNCE:
+                return
+            self.last_down = now
+            self.events.put(now)
+        EventLoop.wakeup()
 
     def poll(self):
+        # Returns True while pressed, unless the main loop will be woken for the release (the release edge) and
+        # the long press threshold (a timer).  Without an event loop the caller polls regularly anyway.
+
         # Grab press event if any
         if not self.events.empty():
             new_tstamp = self.events.get_nowait()
+            Histogram.get(Histogram.SWITCH_WAKE).add(time.monotonic() - new_tstamp)
         else:
             new_tstamp = None
 
         # If we were a already pressed and waiting for a release, drop it, it's easier
         # that way and we should be polling fast enough for this not to matter.
         # Otherwise record it
-        if self.cur_tstamp is None:
+        if self.cur_tstamp is None and new_tstamp is not None:
             self.cur_tstamp = new_tstamp
+            self.long_press_timer = EventLoop.call_later(self.long_press_threshold - (time.monotonic() - new_tstamp),
+                                                         EventLoop.wakeup)
 
         # Are we waiting for release ?
         if self.cur_tstamp is None:
-            return
+            return False
 
         time_pressed = time.monotonic() - self.cur_tstamp
 
         # If it's a long press, process as soon as we reach the threshold, otherwise
         # check the GPIO input
-        if time_pressed > self.long_press_threshold:
+        if time_pressed >= self.long_press_threshold:
             short = False
         elif GPIO.input(self.fs_pin):
             short = True
         else:
-            return
+            return self.long_press_timer is None
         self.cur_tstamp = None
+        if self.long_press_timer is not None:
+            self.long_press_timer.cancel()
+            self.long_press_timer = None
 
         logging.debug("Switch %d %s press" % (self.fs_pin, "short" if short else "long"))
+        start = time.perf_counter()
         self.pressed(short)
+        Histogram.get(Histogram.SWITCH).add(time.perf_counter() - start)
+        return False
@@ -14,11 +14,23 @@
 # along with pi-stomp.  If not, see <https://www.gnu.org/licenses/>.
 
 
+import common.token as Token
+
+# Main loop task periods (seconds), unless configured otherwise (see pistomp/scheduler.py)
+ANALOG_PERIOD = 0.01  # ADC reads for the analog controls (knobs, expression pedal)
+MODUI_PERIOD = 1.0    # mod-ui changes (see Mod.poll_modui_changes)
+
+
 class Handler:
 
+    # Seconds between poll_controls() calls for handlers which poll everything at a fixed rate, None for handlers
+    # which are only polled when woken
+    POLL_PERIOD = None
+
     def __init__(self):
         self.homedir = None
         self.lcd = None
+        self.hardware = None
         pass
 
     def noop(self):
@@ -34,11 +46,28 @@ class Handler:
         pass
 
     def poll_controls(self):
+        # Called when the main loop is woken (see common/eventloop.py), or every POLL_PERIOD
+        # Returns True to be called again soon without a wakeup
+        pass
+
+    def poll_analog_controls(self):
+        # Called on a timer, controls which can't wake the main loop
         pass
 
     def poll_modui_changes(self):
         pass
 
+    def schedule(self, scheduler):
+        # Register the polling with the main loop
+        if self.POLL_PERIOD is not None:
+            scheduler.add(Token.CONTROLS, self.poll_controls, self.POLL_PERIOD)
+        else:
+            # GPIO interrupts, mod-ui notifications and finished host commands wake the loop, which then polls them
+            scheduler.loop.on_wakeup(self.poll_controls)
+            if self.hardware is not None and len(self.hardware.analog_controls) > 0:
+                scheduler.add(Token.ANALOG, self.poll_analog_controls, ANALOG_PERIOD)
+        scheduler.add(Token.MODUI, self.poll_modui_changes, MODUI_PERIOD)
+
     def preset_incr_and_change(self):
         pass
 
@@ -16,7 +16,9 @@
 import logging
 import os
 import spidev
+import time
 
+import common.histogram as Histogram
 import common.token as Token
 import common.util as Util
 import pistomp.analogmidicontrol as AnalogMidiControl
@@ -64,14 +66,39 @@ class Hardware:
 
     def poll_controls(self):
         # This is intended to be called periodically from main working loop to poll the instantiated controls
+        self.poll_analog_controls()
+        return self.poll_gpio_controls()
+
+    def poll_analog_controls(self, midi_only=False):
+        # The ADC has no interrupt, so the main loop calls this on a timer
+        # midi_only leaves out controls which need a plugin host (eg. AnalogSwitch), see poll_midi_controls
+        start = time.perf_counter()
         for c in self.analog_controls:
+            if midi_only and not isinstance(c, AnalogMidiControl.AnalogMidiControl):
+                continue
             c.refresh()
+        Histogram.get(Histogram.ANALOG).add(time.perf_counter() - start)
+
+    def poll_gpio_controls(self):
+        # The GPIO controls wake the main loop from their interrupts (see common/eventloop.py), which then calls this
+        # Returns True while any of them needs polling again without a further interrupt (eg. a switch held down)
+        start = time.perf_counter()
+        busy = False
         for e in self.encoders:
-            e.read_rotary()
+            busy = e.read_rotary() or busy
         for s in self.encoder_switches:
-            s.poll()
+            busy = s.poll() or busy
+        for s in self.footswitches:
+            busy = s.poll() or busy
+        Histogram.get(Histogram.GPIO).add(time.perf_counter() - start)
+        return busy
+
+    def poll_midi_controls(self):
+        # Only the GPIO controls which work without a plugin host (as plain MIDI controllers), the analog ones do too
+        busy = False
         for s in self.footswitches:
-            s.poll()
+            busy = s.poll() or busy
+        return busy
 
     def reinit(self, cfg):
         # reinit hardware as specified by the new cfg context (after pedalboard change, etc.)
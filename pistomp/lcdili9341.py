@@ -17,6 +17,7 @@ import board
 import digitalio
 from PIL import Image, ImageDraw, ImageFont
 import adafruit_rgb_display.ili9341 as ili9341
+import common.histogram as Histogram
 import common.token as Token
 import os
 import pistomp.lcdcolor as lcdcolor
@@ -174,11 +175,13 @@ class Lcd(lcdcolor.Lcdcolor):
 
         # Wait if a lock is present (to avoid multiple async refreshes accessing the SPI simultaneously
         # If the LCD clears out during certain events, might need to increase the max wait
+        start = time.perf_counter()
         self.wait_lock(0.005, 10)
         self.lock = True
 
         # Since rotating 270 or 90, x becomes y, y becomes x
         self.disp.image(image, 270 if self.flip else 90, x=y0, y=x0)
+        Histogram.get(Histogram.LCD).add(time.perf_counter() - start)
 
         # unlock so the next refresh can happen
         self.lock = False
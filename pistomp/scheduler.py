@@ -0,0 +1,93 @@
+# This file is part of pi-stomp.
+#
+# pi-stomp is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pi-stomp is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pi-stomp.  If not, see <https://www.gnu.org/licenses/>.
+
+import logging
+import time
+
+from functools import partial
+
+import common.token as Token
+import pistomp.config as config
+
+
+class Task:
+
+    def __init__(self, name, fn, period, deadline):
+        self.name = name
+        self.fn = fn
+        self.period = period
+        self.deadline = deadline  # seconds a run may start late before it counts as late
+        self.due = time.monotonic() + period
+        self.timer = None
+        self.runs = 0
+        self.late = 0
+        self.worst = 0.0  # latest start
+        self.busy = 0.0   # total run time
+
+
+class Scheduler:
+
+    # The main loop's periodic tasks (see common/eventloop.py)
+    #
+    # Each task has a name, which is its key in the main_loop section of the config to override the period.  A
+    # period of 0 disables the task.  Runs which start more than the task's deadline (by default its period) after
+    # they were due are counted, see stats().
+    def __init__(self, loop, cfg=None):
+        self.loop = loop
+        self.cfg = cfg
+        self.tasks = {}
+        loop.busy_period = self.period(Token.CONTROLS, loop.busy_period)
+
+    def _run(self, task):
+        start = time.monotonic()
+        lateness = start - task.due
+        task.due = max(task.due + task.period, start)
+        if lateness > task.deadline:
+            task.late += 1
+            logging.debug("%s task %.1fms late" % (task.name, lateness * 1000))
+        if lateness > task.worst:
+            task.worst = lateness
+        try:
+            task.fn()
+        finally:
+            elapsed = time.monotonic() - start
+            task.runs += 1
+            task.busy += elapsed
+
+    # External API
+    def period(self, name, default):
+        # The configured period (seconds) for name, or default
+        return config.get_value(self.cfg, Token.MAIN_LOOP, name, default)
+
+    def add(self, name, fn, period, deadline=None):
+        # Call fn() every period seconds (or as configured), returns the Task or None if it's disabled
+        period = self.period(name, period)
+        if period <= 0:
+            logging.info("%s polling disabled" % name)
+            return None
+        task = Task(name, fn, period, period if deadline is None else deadline)
+        task.timer = self.loop.call_every(period, partial(self._run, task))
+        self.tasks[name] = task
+        return task
+
+    def remove(self, name):
+        task = self.tasks.pop(name, None)
+        if task is not None:
+            task.timer.cancel()
+
+    def stats(self):
+        # [(name, period, runs, late, worst lateness, average run time)]
+        return [(t.name, t.period, t.runs, t.late, t.worst, t.busy / t.runs if t.runs else 0.0)
+                for t in self.tasks.values()]
@@ -36,6 +36,7 @@ class CursesLogHandler(logging.Handler):
         
 class Testhost(Handler):
 
+    POLL_PERIOD = 0.01  # keyboard and VU meters aren't event driven
     LOG_HEIGHT = 8
     VU_GREEN = 1
     VU_YELLOW = 2
@@ -0,0 +1,67 @@
+# This file is part of pi-stomp.
+#
+# pi-stomp is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pi-stomp is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pi-stomp.  If not, see <https://www.gnu.org/licenses/>.
+
+# TtlReader against the bundles in tests/pedalboards (as saved by mod-ui), and against lilv where it's installed
+# Run with: python -m pytest tests  (or python -m unittest discover tests)
+
+import sys, os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import glob
+import importlib.util
+import unittest
+
+import common.token as Token
+import modalapi.ttlreader as TtlReader
+
+PEDALBOARD_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pedalboards")
+BUNDLES = sorted(glob.glob(os.path.join(PEDALBOARD_DIR, "*.pedalboard")))
+
+HAVE_LILV = importlib.util.find_spec("lilv") is not None
+
+
+def port(symbol, value=None, binding=None):
+    return {Token.SYMBOL: symbol, Token.VALUE: value, Token.BINDING: binding}
+
+
+class TtlReaderTest(unittest.TestCase):
+
+    def test_crunch_verb(self):
+        data = TtlReader.parse_pedalboard(os.path.join(PEDALBOARD_DIR, "Crunch_Verb.pedalboard"))
+        self.assertEqual(data[Token.ARCS], [(None, "/gxts9"), ("/gxts9", "/reverb"), ("/gxts9", "/reverb"),
+                                            ("/reverb", None), ("/reverb", None)])
+        self.assertEqual(data[Token.BLOCKS], [
+            {Token.INSTANCE_ID: "/gxts9",
+             Token.PROTOTYPE: "http://guitarix.sourceforge.net/plugins/gxts9#ts9sim",
+             Token.PORTS: [port(":bypass", 0, "0:62"), port("fslider0_", 0.5), port("fslider1_", -16.0),
+                           port("fslider2_", 0.75, "0:70"), port("in"), port("out")]},
+            {Token.INSTANCE_ID: "/reverb",
+             Token.PROTOTYPE: "http://calf.sourceforge.net/plugins/Reverb",
+             Token.PORTS: [port(":bypass", 1, "0:63"), port("amount", 0.25), port("decay_time", 1500.0),
+                           port("dry", 1.0), port("in_l"), port("in_r"), port("out_l"), port("out_r"),
+                           port("room_size", 2.0)]}])
+
+    @unittest.skipUnless(HAVE_LILV, "lilv isn't installed")
+    def test_lilv_parity(self):
+        import modalapi.lilvworld as LilvWorld
+        world = LilvWorld.get_world()
+        self.assertTrue(len(BUNDLES) > 0)
+        for bundle in BUNDLES:
+            with self.subTest(bundle=os.path.basename(bundle)):
+                self.assertEqual(TtlReader.parse_pedalboard(bundle), world.parse_pedalboard(bundle))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,466 @@
+#!/usr/bin/env python3
+
+# This file is part of pi-stomp.
+#
+# pi-stomp is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pi-stomp is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pi-stomp.  If not, see <https://www.gnu.org/licenses/>.
+
+# Control to MIDI/handler latency of the main loop, without a pi-Stomp
+#
+# The real Hardware, Footswitch, AnalogMidiControl and Encoder code runs against in-process stand-ins for RPi.GPIO
+# (pin levels and edge callbacks), spidev (MCP3008 reads of a scripted ADC waveform) and the rtmidi output.  A
+# stimulus thread presses footswitches, turns the encoder and moves the knobs at random (seeded) times, the MIDI
+# messages and handler callbacks which follow are timestamped and matched to them.
+#
+# Loop designs:
+#   sleep: poll everything, sleep 10ms (the main loop before it was event driven)
+#   event: common/eventloop.py with the main_loop periods from the config, as modalapistomp.py runs it
+#
+# Usage:
+#   bench_controls.py [--design sleep event] [--duration 10] [--config pistomp/default_config_3fs_2knob_exp.yml]
+#
+# Latency is from the stimulus (switch released, encoder detent completed, ADC value stepped) to the MIDI message or
+# handler call.  Footswitches act on release (or at the long press threshold), so press duration isn't included.
+# CPU is per second of play, for the loop thread and the whole process (which includes the stimulus thread).
+
+import sys, os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import argparse
+import bisect
+import copy
+import importlib.util
+import random
+import statistics
+import threading
+import time
+import types
+import yaml
+
+# Pins as on pi-Stomp Core (see pistomp/pistompcore.py)
+ENC_PIN_D = 17
+ENC_PIN_CLK = 4
+ENC_SWITCH_PIN = 1
+DEBOUNCE_MAP = {0: 27, 1: 23, 2: 22, 3: 24, 4: 25}
+
+CONTROL_CHANGE = 0xB0
+
+# Seconds the loop keeps running after the last stimulus, for its response
+SETTLE = 0.2
+
+
+class FakeGPIO(types.ModuleType):
+
+    # RPi.GPIO: pin levels set by the stimulus, edge callbacks run on the thread changing the level (RPi.GPIO runs
+    # them on its own thread, either way not the main loop's)
+    BCM = 11
+    IN = 1
+    OUT = 0
+    HIGH = 1
+    LOW = 0
+    PUD_UP = 22
+    PUD_DOWN = 21
+    RISING = 31
+    FALLING = 32
+    BOTH = 33
+
+    def __init__(self):
+        super(FakeGPIO, self).__init__("RPi.GPIO")
+        self.levels = {}
+        self.detect = {}  # pin: (edge, callback, bouncetime)
+        self.last_callback = {}
+
+    def setmode(self, mode):
+        pass
+
+    def setwarnings(self, flag):
+        pass
+
+    def setup(self, pin, direction, pull_up_down=None, initial=None):
+        self.levels[pin] = 0 if pull_up_down == self.PUD_DOWN else 1
+
+    def input(self, pin):
+        return self.levels.get(pin, 1)
+
+    def output(self, pin, value):
+        self.levels[pin] = 1 if value else 0
+
+    def add_event_detect(self, pin, edge, callback=None, bouncetime=None):
+        self.detect[pin] = (edge, callback, bouncetime)
+
+    def remove_event_detect(self, pin):
+        self.detect.pop(pin, None)
+
+    def cleanup(self):
+        self.detect.clear()
+
+    # Stimulus side
+    def set_level(self, pin, level):
+        old = self.levels.get(pin, 1)
+        self.levels[pin] = level
+        if pin not in self.detect or old == level:
+            return
+        edge, callback, bouncetime = self.detect[pin]
+        if edge == self.BOTH or (edge == self.FALLING) == (level == 0):
+            now = time.monotonic()
+            if bouncetime and now - self.last_callback.get(pin, -1.0) < bouncetime / 1000:
+                return
+            self.last_callback[pin] = now
+            if callback is not None:
+                callback(pin)
+
+
+class FakeSpiDev:
+
+    # spidev.SpiDev wired to an MCP3008 whose channel values the stimulus sets.  A transfer takes xfer_time seconds
+    # (blocked, not spinning, like the kernel's SPI driver).
+    xfer_time = 0.0001
+    values = {}
+
+    def __init__(self):
+        self.max_speed_hz = 0
+
+    def open(self, bus, device):
+        pass
+
+    def close(self):
+        pass
+
+    def xfer2(self, data):
+        # MCP3008 single ended read: [1, (8 + channel) << 4, 0] -> [x, high 2 bits, low 8 bits]
+        channel = (data[1] >> 4) - 8
+        value = FakeSpiDev.values.get(channel, 0)
+        if self.xfer_time > 0:
+            time.sleep(self.xfer_time)
+        return [0, (value >> 8) & 3, value & 0xff]
+
+
+class FakeMidiOut:
+
+    def __init__(self, recorder):
+        self.recorder = recorder
+
+    def send_message(self, message):
+        if message[0] & 0xF0 == CONTROL_CHANGE:
+            self.recorder.response(("cc", message[1]))
+
+    def close_port(self):
+        pass
+
+
+def install_fakes():
+    # Before anything imports pistomp.  GPIO and SPI are always the stand-ins, even on a Pi, the modules which are
+    # only imported (ADC and MIDI helpers, Blinka) get placeholders if they aren't installed.
+    gpio = FakeGPIO()
+    rpi = types.ModuleType("RPi")
+    rpi.GPIO = gpio
+    sys.modules["RPi"] = rpi
+    sys.modules["RPi.GPIO"] = gpio
+    spidev = types.ModuleType("spidev")
+    spidev.SpiDev = FakeSpiDev
+    sys.modules["spidev"] = spidev
+
+    def placeholder(name, **attrs):
+        try:
+            if importlib.util.find_spec(name) is not None:
+                return
+        except (ImportError, ValueError):
+            pass
+        module = types.ModuleType(name)
+        module.__dict__.update(attrs)
+        sys.modules[name] = module
+        parent, _, child = name.rpartition('.')
+        if parent:
+            setattr(sys.modules[parent], child, module)
+
+    placeholder("rtmidi")
+    placeholder("rtmidi.midiconstants", CONTROL_CHANGE=CONTROL_CHANGE)
+    placeholder("rtmidi.midiutil", open_midioutput=None)
+    placeholder("adafruit_mcp3xxx")
+    placeholder("adafruit_mcp3xxx.mcp3008")
+    placeholder("adafruit_mcp3xxx.analog_in", AnalogIn=None)
+    placeholder("board")
+    placeholder("busio")
+    placeholder("digitalio")
+    return gpio
+
+
+class Recorder:
+
+    # Stimulus and response timestamps, by key
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stimuli = []   # (key, label, time)
+        self.responses = {}  # key: [time]
+
+    def stimulus(self, key, label):
+        with self.lock:
+            self.stimuli.append((key, label, time.monotonic()))
+
+    def response(self, key):
+        now = time.monotonic()
+        with self.lock:
+            self.responses.setdefault(key, []).append(now)
+
+    def latencies(self):
+        # {label: [seconds]} and {label: missed}, each stimulus matched with the first response to its key after it
+        # (and before the key's next stimulus)
+        latencies = {}
+        missed = {}
+        by_key = {}
+        for key, label, t in self.stimuli:
+            by_key.setdefault(key, []).append((t, label))
+        for key, stimuli in by_key.items():
+            responses = self.responses.get(key, [])
+            for i, (t, label) in enumerate(stimuli):
+                limit = stimuli[i + 1][0] if i + 1 < len(stimuli) else float('inf')
+                j = bisect.bisect_left(responses, t)
+                if j < len(responses) and responses[j] < limit:
+                    latencies.setdefault(label, []).append(responses[j] - t)
+                else:
+                    missed[label] = missed.get(label, 0) + 1
+        return latencies, missed
+
+
+def make_handler(recorder):
+    # The handler the hardware calls back, a Generichost which records the calls
+    import pistomp.generichost as Generichost
+
+    class BenchHandler(Generichost.Generichost):
+
+        def preset_incr_and_change(self):
+            recorder.response(("preset",))
+
+        def preset_decr_and_change(self):
+            recorder.response(("preset",))
+
+        def preset_set_and_change(self, index):
+            recorder.response(("preset",))
+
+        def universal_encoder_select(self, direction):
+            recorder.response(("encoder", direction))
+
+        def universal_encoder_sw(self, value):
+            recorder.response(("encoder_sw",))
+
+        def refresh(self, bypass_change=False):
+            pass
+
+    return BenchHandler()
+
+
+def make_hardware(cfg, handler, midiout):
+    # pi-Stomp Core's controls without the LCD and relay (relays write sentinel files, and only act on long presses)
+    import pistomp.encoder as Encoder
+    import pistomp.encoderswitch as EncoderSwitch
+    import pistomp.hardware as Hardware
+
+    class BenchHardware(Hardware.Hardware):
+
+        def __init__(self, cfg, mod, midiout, refresh_callback):
+            super(BenchHardware, self).__init__(cfg, mod, midiout, refresh_callback)
+            self.debounce_map = DEBOUNCE_MAP
+            self.init_spi()
+            self.init_encoders()
+            self.init_footswitches()
+            self.init_analog_controls()
+            self.reinit(None)
+
+        def init_encoders(self):
+            self.encoders.append(Encoder.Encoder(ENC_PIN_D, ENC_PIN_CLK, callback=self.mod.universal_encoder_select))
+            self.encoder_switches.append(EncoderSwitch.EncoderSwitch(ENC_SWITCH_PIN,
+                                                                     callback=self.mod.universal_encoder_sw))
+
+        def init_analog_controls(self):
+            self.create_analog_controls(self.default_cfg)
+
+        def init_footswitches(self):
+            self.create_footswitches(self.default_cfg)
+
+        def init_relays(self):
+            pass
+
+        def test(self):
+            pass
+
+    cfg = copy.deepcopy(cfg)
+    for f in cfg["hardware"].get("footswitches") or []:
+        f.pop("bypass", None)
+    return BenchHardware(cfg, handler, midiout, handler.refresh)
+
+
+class Stimulus(threading.Thread):
+
+    # Presses footswitches, turns the encoder and steps the knobs at random times for duration seconds
+    def __init__(self, gpio, hardware, recorder, duration, seed):
+        super(Stimulus, self).__init__(daemon=True)
+        self.gpio = gpio
+        self.hardware = hardware
+        self.recorder = recorder
+        self.random = random.Random(seed)
+        self.events = self._script(duration)
+
+    def _script(self, duration):
+        # [(time, fn, args)] for the whole run
+        r = self.random
+        events = []
+        for fs in self.hardware.footswitches:
+            t = r.uniform(0.1, 0.5)
+            while t < duration:
+                hold = r.uniform(0.05, 0.3)
+                events.append((t, self.press, (fs.fs_pin,)))
+                events.append((t + hold, self.release, (fs,)))
+                t += hold + r.uniform(0.3, 0.8)  # beyond the switches' 250ms debounce
+        t = r.uniform(0.1, 0.5)
+        while t < duration:
+            direction = r.choice([1, -1])
+            for i in range(r.randint(1, 5)):
+                events.append((t, self.detent, (direction,)))
+                t += r.uniform(0.02, 0.08)
+            t += r.uniform(0.3, 1.0)
+        for c in self.hardware.analog_controls:
+            t = r.uniform(0.1, 0.5)
+            while t < duration:
+                events.append((t, self.knob, (c, r.randint(0, 1023))))
+                t += r.uniform(0.2, 0.6)
+        events.sort(key=lambda e: e[0])
+        return events
+
+    def press(self, pin):
+        self.gpio.set_level(pin, 0)
+
+    def release(self, fs):
+        if fs.midi_CC is not None:
+            key = ("cc", fs.midi_CC)
+        elif fs.preset_callback is not None:
+            key = ("preset",)
+        else:
+            key = None
+        if key is not None:
+            self.recorder.stimulus(key, "footswitch %s" % ("midi" if key[0] == "cc" else "preset"))
+        self.gpio.set_level(fs.fs_pin, 1)
+
+    def detent(self, direction):
+        # One detent as quadrature (clk, d) states, 1ms apart: clockwise 11 10 00 01 11, anticlockwise 11 01 00 10 11
+        states = [(1, 0), (0, 0), (0, 1), (1, 1)] if direction > 0 else [(0, 1), (0, 0), (1, 0), (1, 1)]
+        for i, (clk, d) in enumerate(states):
+            if i == len(states) - 1:
+                self.recorder.stimulus(("encoder", direction), "encoder")
+            if self.gpio.input(ENC_PIN_CLK) != clk:
+                self.gpio.set_level(ENC_PIN_CLK, clk)
+            if self.gpio.input(ENC_PIN_D) != d:
+                self.gpio.set_level(ENC_PIN_D, d)
+            if i < len(states) - 1:
+                time.sleep(0.001)
+
+    def knob(self, control, value):
+        # Only steps bigger than the control's tolerance send MIDI
+        if abs(value - control.last_read) > control.tolerance:
+            self.recorder.stimulus(("cc", control.midi_CC), "analog midi")
+        FakeSpiDev.values[control.adc_channel] = value
+
+    def run(self):
+        start = time.monotonic()
+        for t, fn, args in self.events:
+            delay = start + t - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            fn(*args)
+
+
+def run_sleep(handler, hardware, duration):
+    end = time.monotonic() + duration
+    while time.monotonic() < end:
+        hardware.poll_controls()
+        time.sleep(0.01)
+
+
+def run_event(handler, hardware, duration, cfg):
+    import common.eventloop as EventLoop
+    import pistomp.scheduler as Scheduler
+
+    loop = EventLoop.get_loop()
+    scheduler = Scheduler.Scheduler(loop, cfg)
+    handler.schedule(scheduler)
+    loop.call_later(duration, loop.stop)
+    loop.run()
+    for name in list(scheduler.tasks):
+        scheduler.remove(name)
+    loop.wake_callbacks.clear()
+
+
+def report(name, values, missed):
+    if len(values) == 0:
+        print("  %-18s n=0  missed %d" % (name, missed))
+        return
+    values = sorted(values)
+    print("  %-18s n=%-4d median %6.2fms  p95 %6.2fms  p99 %6.2fms  max %6.2fms%s" %
+          (name, len(values), statistics.median(values) * 1000, values[max(int(len(values) * 0.95) - 1, 0)] * 1000,
+           values[max(int(len(values) * 0.99) - 1, 0)] * 1000, values[-1] * 1000,
+           "  missed %d" % missed if missed else ""))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--design", nargs='+', default=["sleep", "event"], choices=["sleep", "event"])
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of play per design")
+    parser.add_argument("--config", default=os.path.join(os.path.dirname(__file__), '..', 'pistomp',
+                                                         'default_config_3fs_2knob_exp.yml'))
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--spi-time", type=float, default=0.1, help="ms per ADC read")
+    args = parser.parse_args()
+
+    gpio = install_fakes()
+    import common.histogram as Histogram
+    import common.eventloop  # not to time the import in run_event
+    import pistomp.scheduler
+
+    with open(args.config, 'r') as ymlfile:
+        cfg = yaml.load(ymlfile, Loader=yaml.SafeLoader)
+    FakeSpiDev.xfer_time = args.spi_time / 1000
+
+    keep = []  # earlier runs' controls, their __del__ would remove the pins' edge detection
+    for design in args.design:
+        recorder = Recorder()
+        handler = make_handler(recorder)
+        hardware = make_hardware(cfg, handler, FakeMidiOut(recorder))
+        handler.add_hardware(hardware)
+        keep.append(hardware)
+        for name in Histogram.NAMES:
+            Histogram.get(name).reset()
+        stimulus = Stimulus(gpio, hardware, recorder, args.duration, args.seed)
+
+        stimulus.start()
+        cpu = time.process_time()
+        loop_cpu = time.thread_time()
+        if design == "sleep":
+            run_sleep(handler, hardware, args.duration + SETTLE)
+        else:
+            run_event(handler, hardware, args.duration + SETTLE, cfg)
+        loop_cpu = time.thread_time() - loop_cpu
+        cpu = time.process_time() - cpu
+        stimulus.join()
+
+        seconds = args.duration + SETTLE
+        print("%s loop: %.0fs of play, loop CPU %.1fms/s, process CPU %.1fms/s" %
+              (design, args.duration, loop_cpu * 1000 / seconds, cpu * 1000 / seconds))
+        latencies, missed = recorder.latencies()
+        for label in sorted(set(latencies) | set(missed)):
+            report(label, latencies.get(label, []), missed.get(label, 0))
+        for name in [Histogram.SWITCH, Histogram.ENCODER, Histogram.GPIO, Histogram.ANALOG, Histogram.WAKEUP]:
+            histogram = Histogram.get(name)
+            if histogram.count > 0:
+                print("  %-18s %s" % (name + " (run time)", Histogram.compact(name)))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+
+# This file is part of pi-stomp.
+#
+# pi-stomp is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pi-stomp is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pi-stomp.  If not, see <https://www.gnu.org/licenses/>.
+
+# Latency of parameter changes: one HTTP request each (pi_stomp_set) vs. param_set over mod-ui's websocket
+#
+# The HTTP time is the request's round trip.  A websocket send isn't answered, its time is until mod-ui relays the
+# change to another websocket client (as it does for every change made in a browser).
+#
+# Against a running system (needs the pi_stomp mod-tweaks):
+#   bench_modhost.py --instance /graph/<plugin> --symbol <param>
+# Or entirely local, with a fake mod-ui which forwards to a fake (single client, like the real one) mod-host:
+#   bench_modhost.py --fake
+
+import sys, os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import argparse
+import base64
+import hashlib
+import http.server
+import json
+import socket
+import statistics
+import struct
+import threading
+import time
+
+import modalapi.modui as ModUi
+import modalapi.moduisubscriber as ModUiSubscriber
+import modalapi.websocketclient as WebSocketClient
+import util.fake_modhost as FakeModHost
+
+
+class FakeModUi(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    # Forwards changes to mod-host over its one connection, and relays websocket changes to the other
+    # websocket clients, like mod-ui
+    def __init__(self, modhost_port):
+        super().__init__(("localhost", 0), FakeModUiHandler)
+        self.modhost = socket.create_connection(("localhost", modhost_port))
+        self.modhost.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.modhost_lock = threading.Lock()
+        self.clients = []
+        self.clients_lock = threading.Lock()
+
+    def command(self, command):
+        with self.modhost_lock:
+            self.modhost.sendall(command.encode() + b"\0")
+            resp = b""
+            while not resp.endswith(b"\0"):
+                resp += self.modhost.recv(4096)
+        return resp
+
+    def broadcast(self, sender, message):
+        with self.clients_lock:
+            clients = [c for c in self.clients if c is not sender]
+        for client in clients:
+            client.send_text(message)
+
+
+class FakeModUiHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like tornado
+    disable_nagle_algorithm = True  # headers and body are written separately
+
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, body):
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/websocket" and self.headers.get("Upgrade", "").lower() == "websocket":
+            self.websocket()
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        value = json.loads(self.rfile.read(int(self.headers["Content-Length"])))["value"]
+        if self.path.startswith("/effect/parameter/pi_stomp_set/"):
+            symbol = self.path.rsplit("/", 1)[1]
+            self.server.command("param_set 1 %s %f" % (symbol, float(value)))
+            self.reply(True)
+        else:
+            self.send_error(404)
+
+    def websocket(self):
+        accept = base64.b64encode(hashlib.sha1((self.headers["Sec-WebSocket-Key"] +
+                                                WebSocketClient.GUID).encode()).digest()).decode()
+        self.send_lock = threading.Lock()
+        with self.server.clients_lock:
+            self.server.clients.append(self)  # before the client is told it's connected
+        self.send_response(101)
+        self.send_header("Upgrade", "websocket")
+        self.send_header("Connection", "Upgrade")
+        self.send_header("Sec-WebSocket-Accept", accept)
+        self.end_headers()
+        try:
+            while True:
+                message = self.recv_text()
+                if message is None:
+                    return
+                args = message.split()
+                if args[0] == "param_set":
+                    instance, symbol = args[1].rsplit("/", 1)
+                    self.server.broadcast(self, "param_set %s %s %s" % (instance, symbol, args[2]))
+                    self.server.command("param_set 1 %s %s" % (symbol, args[2]))
+        except (OSError, ValueError):
+            pass
+        finally:
+            with self.server.clients_lock:
+                self.server.clients.remove(self)
+            self.close_connection = True
+
+    def recv_text(self):
+        # Client frames are always masked, the bench's are never fragmented
+        header = self.rfile.read(2)
+        if len(header) < 2 or header[0] & 0x0F == WebSocketClient.OP_CLOSE:
+            return None
+        length = header[1] & 0x7F
+        if length == 126:
+            length = struct.unpack("!H", self.rfile.read(2))[0]
+        elif length == 127:
+            length = struct.unpack("!Q", self.rfile.read(8))[0]
+        mask = self.rfile.read(4)
+        payload = self.rfile.read(length)
+        return bytes(b ^ mask[i % 4] for i, b in enumerate(payload)).decode()
+
+    def send_text(self, text):
+        payload = text.encode()
+        with self.send_lock:
+            self.wfile.write(bytes([0x80 | WebSocketClient.OP_TEXT, len(payload)]) + payload)
+            self.wfile.flush()
+
+
+def measure(name, count, fn):
+    times = []
+    for i in range(count):
+        start = time.perf_counter()
+        fn(i)
+        times.append(time.perf_counter() - start)
+    times.sort()
+    print("%-9s n=%d  median %.3fms  p95 %.3fms  max %.3fms  mean %.3fms" %
+          (name, count, statistics.median(times) * 1000, times[int(len(times) * 0.95) - 1] * 1000,
+           times[-1] * 1000, statistics.mean(times) * 1000))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--fake", action="store_true", help="use a local fake mod-host and mod-ui")
+    parser.add_argument("--count", type=int, default=500)
+    parser.add_argument("--instance", default="/graph/bench")
+    parser.add_argument("--symbol", default="gain")
+    args = parser.parse_args()
+
+    if args.fake:
+        fake_host = FakeModHost.start()
+        fake_ui = FakeModUi(fake_host.server_address[1])
+        threading.Thread(target=fake_ui.serve_forever, daemon=True).start()
+        modui = ModUi.ModUi("http://localhost:%d/" % fake_ui.server_address[1])
+        ws_url = "ws://localhost:%d/websocket" % fake_ui.server_address[1]
+    else:
+        modui = ModUi.get_client()
+        ws_url = ModUiSubscriber.WS_URI
+
+    sender = WebSocketClient.WebSocketClient(ws_url, timeout=2.0)
+    observer = WebSocketClient.WebSocketClient(ws_url, timeout=2.0)
+    expected = "param_set %s %s " % (args.instance, args.symbol)
+
+    def http_set(i):
+        resp = modui.post("effect/parameter/pi_stomp_set/%s/%s" % (args.instance, args.symbol),
+                          json={"value": "%.1f" % (i % 10)})
+        if resp.status_code != 200:
+            raise Exception("pi_stomp_set failed: %d" % resp.status_code)
+
+    def websocket_set(i):
+        sender.send("param_set %s/%s %f" % (args.instance, args.symbol, float(i % 10)))
+        while True:
+            message = observer.recv()
+            if message is None:
+                raise Exception("mod-ui closed the websocket")
+            if message.startswith(expected):
+                return
+
+    # warm up each path before measuring.  The websockets connect after the HTTP run so the observer doesn't see
+    # mod-ui's notifications of those changes.
+    http_set(0)
+    measure("http", args.count, http_set)
+    sender.connect()
+    observer.connect()
+    websocket_set(0)
+    measure("websocket", args.count, websocket_set)
+    if args.fake:
+        print("fake mod-host received %d commands" % len(fake_host.commands))
+    sender.close()
+    observer.close()
+
+if __name__ == '__main__':
+    main()
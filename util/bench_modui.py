@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+
+# This file is part of pi-stomp.
+#
+# pi-stomp is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pi-stomp is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pi-stomp.  If not, see <https://www.gnu.org/licenses/>.
+
+# Latency of the mod-ui request sequences behind pedalboard switches, preset changes and parameter edits
+#
+# By default against a local fake mod-ui (see fake_modui.py) with made up pedalboards, eg.
+#   bench_modui.py --latency 2 --latency pedalboard/load_bundle/=300
+# or against a recording of a real system (fake_modui.py --record), for repeatable runs:
+#   bench_modui.py --replay traffic.jsonl --replay-latency
+# or against a running mod-ui (or fake):
+#   bench_modui.py --url http://pistomp.local/
+
+import sys, os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import argparse
+import json
+import statistics
+import time
+
+import common.token as Token
+import modalapi.modui as ModUi
+import util.fake_modui as FakeModUi
+
+
+def measure(name, count, fn):
+    times = []
+    for i in range(count):
+        start = time.perf_counter()
+        fn(i)
+        times.append(time.perf_counter() - start)
+    times.sort()
+    print("%-15s n=%d  median %.1fms  p95 %.1fms  max %.1fms" %
+          (name, count, statistics.median(times) * 1000, times[max(int(len(times) * 0.95) - 1, 0)] * 1000,
+           times[-1] * 1000))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", help="mod-ui to use instead of starting a fake one")
+    parser.add_argument("--count", type=int, default=20)
+    parser.add_argument("--plugins", type=int, default=12, help="plugins per made up pedalboard")
+    parser.add_argument("--latency", action="append", help="[PREFIX=]MS added by the fake mod-ui (repeatable)")
+    parser.add_argument("--replay", help="recording for the fake mod-ui to answer from")
+    parser.add_argument("--replay-latency", action="store_true")
+    args = parser.parse_args()
+
+    if args.url:
+        url = args.url
+    else:
+        server = FakeModUi.start(pedalboards=FakeModUi.generate_pedalboards(2, args.plugins),
+                                 latency=FakeModUi.parse_latency(args.latency), replay=args.replay,
+                                 replay_latency=args.replay_latency)
+        url = "http://localhost:%d/" % server.server_address[1]
+    modui = ModUi.ModUi(url)
+
+    pedalboards = json.loads(modui.get("pedalboard/list").text)
+    if len(pedalboards) == 0:
+        print("No pedalboards")
+        return
+    modui.post("pedalboard/load_bundle/", {"bundlepath": pedalboards[0][Token.BUNDLE]})
+    instances = list(json.loads(modui.get("effect/pi_stomp_instances").text).keys())
+    presets = sorted(int(i) for i in json.loads(modui.get("snapshot/list").text).keys()) or [0]
+    print("%d pedalboards, %d plugins, %d presets" % (len(pedalboards), len(instances), len(presets)))
+
+    def switch(i):
+        modui.get("reset")
+        modui.post("pedalboard/load_bundle/", {"bundlepath": pedalboards[i % len(pedalboards)][Token.BUNDLE]})
+        modui.get("snapshot/list")
+
+    def preset_query(i):
+        # one bypass query per plugin after the load
+        modui.get("snapshot/load?id=%d" % presets[i % len(presets)])
+        for instance in instances:
+            modui.get("effect/parameter/pi_stomp_get/%s/:bypass" % instance)
+
+    def preset_verify(i):
+        # bypass states from the bundle's snapshots, one request to check them (see Mod.preset_load_host)
+        modui.get("snapshot/load?id=%d" % presets[i % len(presets)])
+        modui.get("snapshot/name?id=%d" % presets[i % len(presets)])
+
+    def preset_state(i):
+        # the whole graph's values in one request (pi_stomp_state mod-tweak, see Mod.host_state_get)
+        modui.get("snapshot/load?id=%d" % presets[i % len(presets)])
+        modui.get("effect/pi_stomp_state")
+
+    def parameter(i):
+        modui.post("effect/parameter/pi_stomp_set/%s/param0" % instances[i % len(instances)],
+                   json={"value": "%.1f" % (i % 10 / 10)})
+
+    measure("switch", args.count, switch)
+    modui.post("pedalboard/load_bundle/", {"bundlepath": pedalboards[0][Token.BUNDLE]})
+    measure("preset (query)", args.count, preset_query)
+    measure("preset (verify)", args.count, preset_verify)
+    measure("preset (state)", args.count, preset_state)
+    if len(instances) > 0:
+        measure("parameter", args.count * 10, parameter)
+
+if __name__ == '__main__':
+    main()
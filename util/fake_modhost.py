@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+
+# This file is part of pi-stomp.
+#
+# pi-stomp is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pi-stomp is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pi-stomp.  If not, see <https://www.gnu.org/licenses/>.
+
+# Fake mod-host command socket, for trying out mod-ui clients without a sound engine
+#
+# Speaks mod-host's protocol (null terminated commands, "resp <status>" replies) for param_set, param_get
+# and bypass, keeping the values it was sent.  Other commands get "resp 0".  Like mod-host it serves one client
+# at a time: a second client can connect but gets no replies until the first one disconnects.
+# Usage: fake_modhost.py [port]
+
+import sys, os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import socketserver
+import threading
+
+DEFAULT_PORT = 5555
+
+# mod-host error codes
+ERR_INSTANCE_NON_EXISTS = -2
+ERR_INVALID_OPERATION = -101
+
+
+class FakeModHost(socketserver.TCPServer):
+    allow_reuse_address = True
+
+    def __init__(self, port=DEFAULT_PORT, instances=None):
+        super().__init__(("localhost", port), Handler)
+        self.lock = threading.Lock()
+        self.instances = set(instances) if instances is not None else None  # None accepts any instance number
+        self.params = {}  # (instance, symbol): value
+        self.bypassed = {}  # instance: bool
+        self.commands = []
+
+    def execute(self, command):
+        with self.lock:
+            self.commands.append(command)
+            args = command.split()
+            if len(args) == 0:
+                return "resp %d" % ERR_INVALID_OPERATION
+            try:
+                if args[0] in ("param_set", "param_get", "bypass"):
+                    instance = int(args[1])
+                    if self.instances is not None and instance not in self.instances:
+                        return "resp %d" % ERR_INSTANCE_NON_EXISTS
+                    if args[0] == "param_set":
+                        self.params[(instance, args[2])] = float(args[3])
+                    elif args[0] == "param_get":
+                        return "resp 0 %f" % self.params.get((instance, args[2]), 0.0)
+                    else:
+                        self.bypassed[instance] = args[2] != "0"
+            except (IndexError, ValueError):
+                return "resp %d" % ERR_INVALID_OPERATION
+            return "resp 0"
+
+
+class Handler(socketserver.BaseRequestHandler):
+
+    def handle(self):
+        data = b""
+        while True:
+            chunk = self.request.recv(4096)
+            if not chunk:
+                return
+            data += chunk
+            while b"\0" in data:
+                command, data = data.split(b"\0", 1)
+                self.request.sendall(self.server.execute(command.decode()).encode() + b"\0")
+
+
+def start(port=0, instances=None):
+    # Start a server on a background thread (port 0 picks a free one, see server.server_address)
+    server = FakeModHost(port, instances)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_PORT
+    server = FakeModHost(port)
+    print("Fake mod-host listening on port %d" % port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+
+# This file is part of pi-stomp.
+#
+# pi-stomp is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pi-stomp is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pi-stomp.  If not, see <https://www.gnu.org/licenses/>.
+
+# Stand-in for mod-ui's HTTP API, for measuring modalapi without a MOD install
+#
+# Three ways of answering requests:
+#   emulate: the endpoints modalapi uses, backed by a directory of pedalboard bundles (parsed with TtlReader,
+#            snapshots from snapshots.json) or by generated pedalboards.  Plugin data is made up from the ports
+#            the pedalboards use.  With --data-dir, loading a pedalboard writes last.json like mod-ui does.
+#   record:  forward to a real mod-ui and append every exchange to a JSON lines file
+#   replay:  answer from such a file, each (method, path, body) gets its recorded responses in order
+# Latency can be added to every answer (--latency MS) or per endpoint prefix (--latency pedalboard/load_bundle/=800),
+# the longest matching prefix applies, like ModUi.TIMEOUTS.
+#
+# Usage:
+#   fake_modui.py [--port 8080] [--pedalboards DIR | --generate N] [--data-dir DIR] [--latency [PREFIX=]MS ...]
+#   fake_modui.py --record traffic.jsonl --upstream http://pistomp.local/
+#   fake_modui.py --replay traffic.jsonl [--replay-latency]
+
+import sys, os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import argparse
+import collections
+import glob
+import http.server
+import json
+import random
+import requests
+import threading
+import time
+import urllib.parse
+
+import common.token as Token
+import modalapi.snapshots as Snapshots
+import modalapi.ttlreader as TtlReader
+
+
+class Emulator:
+
+    # The state mod-ui would keep for modalapi's requests: the pedalboards, which one is loaded and its
+    # current parameter/bypass values and snapshots
+    def __init__(self, pedalboards, data_dir=None):
+        self.lock = threading.Lock()
+        self.pedalboards = pedalboards  # bundle: (title, parsed data, {index: Snapshot} or None)
+        self.data_dir = data_dir
+        self.plugins = self.make_plugins()
+        self.bundle = None
+        self.values = {}     # instance: {symbol: value}, bypass included as :bypass
+        self.snapshots = {}  # of the loaded pedalboard
+        self.snapshot = 0
+        self.instances = {}  # instance: mod-host instance number
+
+    def make_plugins(self):
+        # effect/get data for each plugin URI, with a control input for every port which has a value
+        plugins = {}
+        for title, data, snapshots in self.pedalboards.values():
+            for block in data[Token.BLOCKS]:
+                uri = block[Token.PROTOTYPE]
+                info = plugins.setdefault(uri, {"uri": uri, "name": uri.rsplit("/", 1)[-1], Token.CATEGORY: [],
+                                                Token.BUNDLES: [], Token.PORTS: {Token.CONTROL: {Token.INPUT: []}}})
+                inputs = info[Token.PORTS][Token.CONTROL][Token.INPUT]
+                known = set(p[Token.SYMBOL] for p in inputs)
+                for port in block[Token.PORTS]:
+                    symbol = port[Token.SYMBOL]
+                    value = port[Token.VALUE]
+                    if value is None or symbol == Token.COLON_BYPASS or symbol in known:
+                        continue
+                    inputs.append({Token.SYMBOL: symbol, Token.NAME: symbol, Token.SHORTNAME: symbol,
+                                   Token.RANGES: {Token.MINIMUM: min(0.0, value), Token.MAXIMUM: max(1.0, value)}})
+        return plugins
+
+    def load(self, bundle):
+        title, data, snapshots = self.pedalboards[bundle]
+        self.bundle = bundle
+        self.values = {}
+        self.instances = {}
+        for n, block in enumerate(data[Token.BLOCKS]):
+            instance = "/graph" + block[Token.INSTANCE_ID]
+            self.instances[instance] = n
+            self.values[instance] = {p[Token.SYMBOL]: float(p[Token.VALUE])
+                                     for p in block[Token.PORTS] if p[Token.VALUE] is not None}
+        self.snapshots = snapshots or {}
+        self.snapshot = 0
+        if self.data_dir is not None:
+            with open(os.path.join(self.data_dir, "last.json"), 'w') as file:
+                json.dump({Token.PEDALBOARD: bundle}, file)
+        return title
+
+    def load_snapshot(self, index):
+        snapshot = self.snapshots.get(index)
+        if snapshot is None:
+            return False
+        self.snapshot = index
+        for instance_id, params in snapshot.parameters.items():
+            self.values.setdefault("/graph" + instance_id, {}).update(params)
+        for instance_id, bypassed in snapshot.bypass.items():
+            self.values.setdefault("/graph" + instance_id, {})[Token.COLON_BYPASS] = 1.0 if bypassed else 0.0
+        return True
+
+    def handle(self, method, path, query, body):
+        # Returns (status, reply), reply being json encodable (or a str sent as is)
+        with self.lock:
+            if path == "ping":
+                return 200, {}
+            if path == "pedalboard/list":
+                return 200, [{Token.BUNDLE: b, Token.TITLE: t} for b, (t, d, s) in self.pedalboards.items()]
+            if path == "effect/get":
+                info = self.plugins.get(query.get("uri", [""])[0])
+                return (200, info) if info is not None else (404, {})
+            if path == "reset":
+                self.bundle = None
+                self.values = {}
+                return 200, True
+            if path == "pedalboard/load_bundle/" and method == "POST":
+                bundle = urllib.parse.parse_qs(body).get("bundlepath", [""])[0]
+                if bundle not in self.pedalboards:
+                    return 200, {"ok": False}
+                return 200, {"ok": True, Token.NAME: self.load(bundle)}
+            if path == "pedalboard/save":
+                return 200, {"ok": True}
+            if path == "snapshot/list":
+                return 200, {str(i): s.name for i, s in self.snapshots.items()}
+            if path == "snapshot/load":
+                return 200, self.load_snapshot(int(query.get("id", ["-1"])[0]))
+            if path == "snapshot/name":
+                snapshot = self.snapshots.get(int(query.get("id", ["-1"])[0]))
+                return 200, {"ok": snapshot is not None, Token.NAME: snapshot.name if snapshot else None}
+            if path == "effect/pi_stomp_instances":
+                return 200, self.instances
+            if path == "effect/pi_stomp_state":
+                return 200, self.values
+            if path.startswith("effect/parameter/pi_stomp_notify/"):
+                return 200, True
+            if path.startswith("effect/parameter/pi_stomp_set/") and method == "POST":
+                instance, symbol = path[len("effect/parameter/pi_stomp_set/"):].rsplit("/", 1)
+                if instance not in self.values:
+                    return 404, False
+                self.values[instance][symbol] = float(json.loads(body)[Token.VALUE])
+                return 200, True
+            if path.startswith("effect/parameter/pi_stomp_get/"):
+                instance, symbol = path[len("effect/parameter/pi_stomp_get/"):].rsplit("/", 1)
+                value = self.values.get(instance, {}).get(symbol)
+                if value is None:
+                    return 404, False
+                if symbol == Token.COLON_BYPASS:
+                    return 200, "true" if value >= 0.5 else "false"
+                return 200, str(value)
+            return 404, {}
+
+
+class Recorder:
+
+    # Forwards to a real mod-ui, appending {method, path, body, status, type, reply, elapsed} lines to a file
+    def __init__(self, upstream, filename):
+        self.upstream = upstream.rstrip("/") + "/"
+        self.session = requests.Session()
+        self.lock = threading.Lock()
+        self.file = open(filename, 'a')
+
+    def forward(self, method, full_path, body, content_type):
+        start = time.monotonic()
+        headers = {"Content-Type": content_type} if content_type else {}
+        resp = self.session.request(method, self.upstream + full_path, data=body.encode() if body else None,
+                                    headers=headers, timeout=60)
+        elapsed = time.monotonic() - start
+        reply_type = resp.headers.get("Content-Type", "text/plain")
+        with self.lock:
+            self.file.write(json.dumps({"method": method, "path": full_path, "body": body, "status": resp.status_code,
+                                        "type": reply_type, "reply": resp.text, "elapsed": elapsed}) + "\n")
+            self.file.flush()
+        return resp.status_code, reply_type, resp.text
+
+
+class Replayer:
+
+    # Answers from a recording.  Each (method, path, body) gets its recorded replies in order, the last one
+    # repeating once they run out.  Requests which weren't recorded with that body fall back to the path alone.
+    def __init__(self, filename, use_latency=False):
+        self.lock = threading.Lock()
+        self.use_latency = use_latency
+        self.exact = collections.defaultdict(collections.deque)
+        self.by_path = collections.defaultdict(collections.deque)
+        with open(filename, 'r') as file:
+            for line in file:
+                if line.strip():
+                    r = json.loads(line)
+                    self.exact[(r["method"], r["path"], r["body"])].append(r)
+                    self.by_path[(r["method"], r["path"])].append(r)
+
+    def next(self, queue):
+        r = queue[0]
+        if len(queue) > 1:
+            queue.popleft()
+        return r
+
+    def forward(self, method, full_path, body, content_type):
+        with self.lock:
+            queue = self.exact.get((method, full_path, body)) or self.by_path.get((method, full_path))
+            if not queue:
+                return 404, "application/json", "{}"
+            r = self.next(queue)
+        if self.use_latency:
+            time.sleep(r["elapsed"])
+        return r["status"], r["type"], r["reply"]
+
+
+class FakeModUi(http.server.ThreadingHTTPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, port=0, emulator=None, proxy=None, latency=None, jitter=0.0):
+        # Either an Emulator or a proxy (Recorder or Replayer).  latency is {endpoint prefix: seconds}
+        super().__init__(("localhost", port), Handler)
+        self.emulator = emulator
+        self.proxy = proxy
+        self.latency = latency or {}
+        self.jitter = jitter
+        self.requests = 0
+
+    def delay(self, path):
+        prefixes = [p for p in self.latency if path.startswith(p)]
+        if prefixes:
+            seconds = self.latency[max(prefixes, key=len)]
+            if self.jitter > 0:
+                seconds += random.uniform(0, self.jitter)
+            time.sleep(seconds)
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like tornado
+    disable_nagle_algorithm = True  # headers and body are written separately
+
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, status, content_type, text):
+        data = text.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do(self, method):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length).decode() if length > 0 else ""
+        full_path = self.path.lstrip("/")
+        url = urllib.parse.urlsplit(full_path)
+        self.server.requests += 1
+        self.server.delay(url.path)
+        if self.server.proxy is not None:
+            try:
+                self.reply(*self.server.proxy.forward(method, full_path, body, self.headers.get("Content-Type")))
+            except requests.exceptions.RequestException as e:
+                self.reply(502, "text/plain", str(e))
+            return
+        status, reply = self.server.emulator.handle(method, url.path, urllib.parse.parse_qs(url.query), body)
+        if isinstance(reply, str):
+            self.reply(status, "text/plain", reply)
+        else:
+            self.reply(status, "application/json", json.dumps(reply))
+
+    def do_GET(self):
+        self.do("GET")
+
+    def do_POST(self):
+        self.do("POST")
+
+
+#
+# Pedalboards to emulate
+#
+
+def load_pedalboards(directory):
+    # {bundle: (title, data, snapshots)} for each *.pedalboard bundle in directory
+    pedalboards = {}
+    for bundle in sorted(glob.glob(os.path.join(directory, "*.pedalboard"))):
+        title = os.path.basename(bundle)[:-len(".pedalboard")]
+        pedalboards[bundle] = (title, TtlReader.parse_pedalboard(bundle), Snapshots.read_snapshots(bundle))
+    return pedalboards
+
+
+def generate_pedalboards(count, plugins=12, params=4, snapshots=4):
+    # count made up pedalboards, each a chain of plugins with params controls and snapshots presets
+    # (the bundle paths don't exist, so these are for request level benchmarks, not for Mod itself)
+    pedalboards = {}
+    for n in range(count):
+        bundle = "/tmp/fake-modui/board%d.pedalboard" % n
+        blocks = []
+        for p in range(plugins):
+            ports = [{Token.SYMBOL: Token.COLON_BYPASS, Token.VALUE: 0, Token.BINDING: None}]
+            ports += [{Token.SYMBOL: "param%d" % i, Token.VALUE: 0.5, Token.BINDING: None} for i in range(params)]
+            blocks.append({Token.INSTANCE_ID: "/plugin%d" % p, Token.PROTOTYPE: "urn:fake:plugin%d" % (p % 5),
+                           Token.PORTS: ports})
+        ids = [None] + [b[Token.INSTANCE_ID] for b in blocks] + [None]
+        data = {Token.BLOCKS: blocks, Token.ARCS: list(zip(ids, ids[1:]))}
+        snaps = {}
+        for s in range(snapshots):
+            bypass = {b[Token.INSTANCE_ID]: (p + s) % 3 == 0 for p, b in enumerate(blocks)}
+            values = {b[Token.INSTANCE_ID]: {"param0": s / max(snapshots, 1)} for b in blocks}
+            snaps[s] = Snapshots.Snapshot("Preset %d" % s, bypass, values)
+        pedalboards[bundle] = ("Board %d" % n, data, snaps)
+    return pedalboards
+
+
+def parse_latency(specs):
+    # ["20", "pedalboard/load_bundle/=800"] to {"": 0.02, "pedalboard/load_bundle/": 0.8}
+    latency = {}
+    for spec in specs or []:
+        prefix, _, ms = spec.rpartition("=")
+        latency[prefix] = float(ms) / 1000
+    return latency
+
+
+def start(port=0, pedalboards=None, data_dir=None, latency=None, jitter=0.0, record=None, upstream=None,
+          replay=None, replay_latency=False):
+    # Start a server on a background thread (port 0 picks a free one, see server.server_address)
+    if record is not None:
+        server = FakeModUi(port, proxy=Recorder(upstream, record), latency=latency, jitter=jitter)
+    elif replay is not None:
+        server = FakeModUi(port, proxy=Replayer(replay, replay_latency), latency=latency, jitter=jitter)
+    else:
+        emulator = Emulator(pedalboards if pedalboards is not None else generate_pedalboards(3), data_dir)
+        server = FakeModUi(port, emulator=emulator, latency=latency, jitter=jitter)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--pedalboards", help="directory of pedalboard bundles to emulate")
+    parser.add_argument("--generate", type=int, default=3, help="number of made up pedalboards (without --pedalboards)")
+    parser.add_argument("--data-dir", help="where to write last.json when a pedalboard is loaded")
+    parser.add_argument("--latency", action="append", help="[PREFIX=]MS added to answers (repeatable)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="up to this many ms more, at random")
+    parser.add_argument("--record", help="forward to --upstream and record the exchanges to this file")
+    parser.add_argument("--upstream", default="http://localhost:80/")
+    parser.add_argument("--replay", help="answer from this recording")
+    parser.add_argument("--replay-latency", action="store_true", help="take as long as the recorded answers did")
+    args = parser.parse_args()
+
+    pedalboards = load_pedalboards(args.pedalboards) if args.pedalboards else generate_pedalboards(args.generate)
+    server = start(args.port, pedalboards, args.data_dir, parse_latency(args.latency), args.jitter / 1000,
+                   args.record, args.upstream, args.replay, args.replay_latency)
+    print("Fake mod-ui listening on port %d" % server.server_address[1])
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
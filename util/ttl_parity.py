@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+# This file is part of pi-stomp.
+#
+# pi-stomp is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pi-stomp is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pi-stomp.  If not, see <https://www.gnu.org/licenses/>.
+
+# Parity check of the two pedalboard parsers (lilv and the built-in Turtle reader)
+#
+# Parses each bundle with both and reports any difference in the parsed data, along with parse times.
+# Usage: ttl_parity.py [bundle ...]   (defaults to all bundles in ~pistomp/data/.pedalboards)
+# Exits non zero if any bundle differs.
+# tests/test_ttlreader.py does the same for the bundles in tests/pedalboards.
+
+import sys, os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import glob
+import time
+
+import common.token as Token
+import modalapi.lilvworld as LilvWorld
+import modalapi.ttlreader as TtlReader
+
+PEDALBOARD_DIR = "/home/pistomp/data/.pedalboards"
+
+
+def timed(parse, bundle):
+    start = time.perf_counter()
+    try:
+        data = parse(bundle)
+    except Exception as e:
+        data = "error: %s" % e
+    return data, time.perf_counter() - start
+
+
+def differences(expected, actual):
+    if not isinstance(expected, dict) or not isinstance(actual, dict):
+        return [] if expected == actual else ["lilv: %s, turtle: %s" % (expected, actual)]
+    diffs = []
+    if expected[Token.ARCS] != actual[Token.ARCS]:
+        diffs.append("arcs: lilv: %s, turtle: %s" % (expected[Token.ARCS], actual[Token.ARCS]))
+    blocks = {b[Token.INSTANCE_ID]: b for b in actual[Token.BLOCKS]}
+    for block in expected[Token.BLOCKS]:
+        other = blocks.pop(block[Token.INSTANCE_ID], None)
+        if other != block:
+            diffs.append("block %s: lilv: %s, turtle: %s" % (block[Token.INSTANCE_ID], block, other))
+    for instance_id in blocks:
+        diffs.append("block %s: only found by turtle" % instance_id)
+    if len(diffs) == 0 and expected != actual:
+        diffs.append("block order differs")
+    return diffs
+
+
+def main():
+    bundles = sys.argv[1:] or sorted(glob.glob(os.path.join(PEDALBOARD_DIR, "*.pedalboard")))
+    world = LilvWorld.get_world()
+    failed = 0
+    lilv_total = 0
+    turtle_total = 0
+    for bundle in bundles:
+        expected, lilv_time = timed(world.parse_pedalboard, bundle)
+        actual, turtle_time = timed(TtlReader.parse_pedalboard, bundle)
+        lilv_total += lilv_time
+        turtle_total += turtle_time
+        diffs = differences(expected, actual)
+        status = "FAIL" if diffs else "ok"
+        print("%-4s lilv %7.2fms turtle %7.2fms  %s" % (status, lilv_time * 1000, turtle_time * 1000, bundle))
+        for d in diffs:
+            print("       %s" % d)
+        if diffs:
+            failed += 1
+
+    print("%d bundles, %d differ.  lilv %.1fms, turtle %.1fms total" %
+          (len(bundles), failed, lilv_total * 1000, turtle_total * 1000))
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()